@@ -57,7 +57,10 @@ class ConfigManager:
             'email_senha_app': '',              # Senha de app do remetente
             'email_destinatario_padrao': '',    # Destinatário padrão (opcional)
             'email_assunto_padrao': '',          # Assunto padrão do e-mail (opcional)
-            'modo_teste': True                  # Habilitar modo de teste por padrão
+            'modo_teste': True,                 # Habilitar modo de teste por padrão
+            'smtp_conexoes': 2,                 # Conexões SMTP simultâneas durante o envio
+            'taxa_envio': 2.0,                  # Taxa inicial de envio por domínio (e-mails/s)
+            'mesclar_duplicados': False         # Mesclar pessoas com vários códigos antes do envio
         }
         self._save_config(default_config)
         return default_config
\ No newline at end of file
@@ -1,6 +1,23 @@
 import pandas as pd
+import numpy as np
+import hashlib
 import json
-from datetime import datetime
+
+from modules.sharding import run_sharded
+from modules.lazy_items import LazyItems, bind_frame, COLUNA_RESUMO
+from modules.date_utils import br_to_iso, parse_date_text, parse_date_column, format_date_column, FORMATO_BR
+
+# Faixas dos histogramas exibidos no painel de resultados
+FAIXAS_ATRASO = [-1, 7, 30, 90, np.inf]
+ROTULOS_ATRASO = ['0–7 dias', '8–30 dias', '31–90 dias', '90+ dias']
+
+FAIXAS_MULTA = [0, 5, 10, 20, 50, 100, np.inf]
+ROTULOS_MULTA = ['até R$ 5', 'R$ 5–10', 'R$ 10–20', 'R$ 20–50', 'R$ 50–100', 'R$ 100+']
+
+RELATORIOS = ['rel86', 'rel76']
+
+# Texto exibido nos e-mails quando a data do item não está disponível
+DATA_INDISPONIVEL = 'Data não disponível'
 
 def sort_by_user_code(df):
     """
@@ -64,16 +81,8 @@ def format_date(date_str):
     Returns:
         String de data no formato YYYY-MM-DD ou a string original se não for possível converter
     """
-    if pd.isna(date_str) or not isinstance(date_str, str):
-        return ""
-
-    try:
-        # Tenta converter do formato brasileiro para ISO
-        date_obj = datetime.strptime(date_str, "%d/%m/%Y")
-        return date_obj.strftime("%Y-%m-%d")
-    except ValueError:
-        # Se falhar, retorna a string original
-        return date_str
+    # Conversão com cache (as mesmas datas se repetem em muitos itens)
+    return br_to_iso(date_str)
 
 def get_users_in_rel86(df):
     """
@@ -181,8 +190,11 @@ def categorize_users(df):
                     if isinstance(data_prevista, pd.Timestamp):
                         data_prevista = data_prevista.date()
                     elif isinstance(data_prevista, str):
-                        from datetime import datetime as dt
-                        data_prevista = dt.strptime(data_prevista, '%d/%m/%Y').date()
+                        data_texto = data_prevista
+                        data_prevista = parse_date_text(data_texto, (FORMATO_BR,))
+                        if data_prevista is None:
+                            raise ValueError(f"data '{data_texto}' fora do formato DD/MM/AAAA")
+                        data_prevista = data_prevista.date()
 
                     # Garantir que data_prevista é um objeto date
                     if hasattr(data_prevista, 'date'):
@@ -200,13 +212,14 @@ def categorize_users(df):
 
     return categories
 
-def group_fines_by_user(df):
+def group_fines_by_user(df, num_shards=None):
     """
     Agrupa as multas por usuário e cria uma estrutura de dados adequada.
     Com tratamento especial para multas de chaves.
 
     Args:
         df: DataFrame pandas com os dados das multas
+        num_shards: Número de partições paralelas (padrão: conforme o volume de dados)
 
     Returns:
         Dicionário com dados agrupados por usuário
@@ -217,14 +230,172 @@ def group_fines_by_user(df):
     # Extrair colunas relevantes
     df_relevant = extract_relevant_columns(df)
 
+    # Adicionar categorias específicas
+    categories = categorize_users(df)
+    contexto = {
+        'sem_email': {codigo for codigo, _ in categories['sem_email']['pessoas']},
+        'rel86_sem_email': categories['rel86']['pessoas_sem_email'],
+        'rel76_sem_email': categories['rel76']['pessoas_sem_email']
+    }
+
+    # Bases muito grandes são particionadas por código e agrupadas em paralelo
+    return run_sharded(df_relevant, _build_users_data, contexto, num_shards, ao_receber=bind_frame)
+
+def _fine_amounts(row):
+    """
+    Calcula valor da multa, desconto e valor final de uma linha (tratando NaN e valores inválidos).
+
+    Returns:
+        Tupla (valor_multa, valor_desconto, valor_final)
+    """
+    try:
+        valor_multa = 0.0
+        if 'Valor multa' in row and not pd.isna(row['Valor multa']):
+            valor_multa = float(row['Valor multa'])
+    except (ValueError, TypeError):
+        valor_multa = 0.0
+
+    try:
+        valor_desconto = 0.0
+        if 'Valor do desconto' in row and not pd.isna(row['Valor do desconto']):
+            valor_desconto = float(row['Valor do desconto'])
+    except (ValueError, TypeError):
+        valor_desconto = 0.0
+
+    valor_final = max(0, valor_multa - valor_desconto)  # Garantir que nunca seja negativo
+    return valor_multa, valor_desconto, valor_final
+
+def _key_number(row):
+    """Número da chave da linha (pode estar em duas colunas diferentes) ou ''."""
+    numero_chave = row.get('Número chave', row.get('Número da chave', ""))
+    return "" if pd.isna(numero_chave) else str(numero_chave).strip()
+
+def _return_status(row):
+    """
+    Verifica a devolução pendente (data efetivada vazia).
+
+    Returns:
+        Tupla (tem_devolucao_pendente, data_efetivada normalizada)
+    """
+    data_efetivada = row.get('Data devolução efetivada', "")
+    if pd.isna(data_efetivada):
+        return True, ""  # Garantir que é string vazia para uso futuro
+    if isinstance(data_efetivada, str):
+        return not data_efetivada.strip(), data_efetivada  # Manter como string
+    return True, ""  # Assume pendente para casos não-string
+
+def _fine_item(row):
+    """
+    Monta o dicionário de uma multa, com tratamento especial para multas de chaves.
+
+    Args:
+        row: Linha (dicionário ou Series) com as colunas relevantes
+
+    Returns:
+        Dicionário da multa
+    """
+    # Verificar devolução pendente (data efetivada está vazia)
+    tem_devolucao_pendente, data_efetivada = _return_status(row)
+
+    # Extrair e validar todos os valores com tratamento para NaN
+    titulo = row.get('Título', "")
+    titulo = "" if pd.isna(titulo) else str(titulo).strip()
+
+    data_emprestimo = row.get('Data de empréstimo', "")
+    data_emprestimo = "" if pd.isna(data_emprestimo) else data_emprestimo
+
+    data_prevista = row.get('Data devolução prevista', "")
+    data_prevista = "" if pd.isna(data_prevista) else data_prevista
+
+    # Tratamento específico para multas de chaves
+    numero_chave = _key_number(row)
+    tem_chave = bool(numero_chave.strip())
+
+    # Calcular o valor com desconto - tratamento seguro para NaN
+    valor_multa, valor_desconto, valor_final = _fine_amounts(row)
+
+    # LÓGICA ESPECÍFICA PARA CHAVES
+    # 1. Se tem chave e não tem data de empréstimo, usar a data prevista como data de empréstimo
+    if tem_chave and not data_emprestimo and data_prevista:
+        data_emprestimo = data_prevista
+
+    # 2. Se tem chave, tem multa e não tem data de devolução efetiva, calcular a data
+    data_efetivada_calculada = ""
+
+    # Corrigir a verificação para evitar chamar strip() em float
+    tem_data_efetivada = False
+    if isinstance(data_efetivada, str) and data_efetivada.strip():
+        tem_data_efetivada = True
+
+    if tem_chave and valor_final > 0 and not tem_data_efetivada:
+        try:
+            # Converter data prevista para objeto de data
+            data_obj = parse_date_text(data_prevista, (FORMATO_BR,)) if isinstance(data_prevista, str) else None
+            if data_obj is None:
+                raise ValueError("Data prevista fora do formato DD/MM/AAAA")
+
+            # Se o valor da multa for 1, adicionar 1 dia à data prevista
+            if valor_final == 1:
+                data_devolucao = data_obj + pd.Timedelta(days=1)
+            else:
+                # Caso contrário, usar o valor da multa como dias de atraso
+                data_devolucao = data_obj + pd.Timedelta(days=int(valor_final))
+
+            # Formatar de volta para string
+            data_efetivada_calculada = data_devolucao.strftime("%d/%m/%Y")
+            # Como calculamos a data, não está mais pendente
+            tem_devolucao_pendente = False
+        except (ValueError, TypeError):
+            # Se não conseguir calcular, mantém como estava
+            pass
+
+    # Usar a data calculada se disponível
+    if data_efetivada_calculada:
+        data_efetivada = data_efetivada_calculada
+
+    # Criar objeto de multa
+    return {
+        'titulo': titulo,
+        'data_emprestimo': format_date(data_emprestimo),
+        'data_prevista': format_date(data_prevista),
+        'data_efetivada': format_date(data_efetivada),
+        'valor': valor_multa,
+        'desconto': valor_desconto,
+        'valor_final': valor_final,
+        'numero_chave': numero_chave,
+        'devolucao_pendente': tem_devolucao_pendente,
+        'eh_chave': tem_chave,
+        'dias_atraso': int(valor_final) if tem_chave else 0
+    }
+
+def _fine_items(linhas):
+    """Materializa as multas de um usuário (usado por LazyItems)."""
+    return [_fine_item(row) for row in linhas.to_dict('records')]
+
+def _build_users_data(df_relevant, contexto):
+    """
+    Monta o dicionário de usuários de group_fines_by_user (uma partição por vez).
+
+    Apenas os totais e as flags de categoria são calculados aqui; a lista de
+    multas de cada usuário é montada sob demanda (LazyItems).
+
+    Args:
+        df_relevant: DataFrame com as colunas relevantes, ordenado por código
+        contexto: Conjuntos de códigos das categorias sem e-mail
+
+    Returns:
+        Dicionário com dados agrupados por usuário
+    """
     # Inicializar o dicionário de usuários
     users_data = {}
+    posicoes = {}
 
-    # Adicionar categorias específicas
-    categories = categorize_users(df)
+    # Iterar sobre as linhas (dicionários leves, sem criar uma Series por linha)
+    colunas = list(df_relevant.columns)
+    valores_colunas = [df_relevant[coluna].tolist() for coluna in colunas]
+    for posicao, valores in enumerate(zip(*valores_colunas)):
+        row = dict(zip(colunas, valores))
 
-    # Iterar sobre as linhas do DataFrame
-    for _, row in df_relevant.iterrows():
         # Tratamento para código da pessoa (chave principal)
         if pd.isna(row.get('Código da pessoa')):
             # Pular registros sem código de pessoa válido
@@ -252,6 +423,7 @@ def group_fines_by_user(df):
                 'sem_email': False,
                 'categoria': []
             }
+            posicoes[user_code] = []
 
             # Verificar se o usuário tem email
             if not email:
@@ -259,117 +431,25 @@ def group_fines_by_user(df):
                 users_data[user_code]['categoria'].append('sem_email')
 
             # Adicionar à categoria sem_email se estiver na lista
-            sem_email_codigos = {codigo for codigo, _ in categories['sem_email']['pessoas']}
-            if user_code in sem_email_codigos:
+            if user_code in contexto['sem_email']:
                 users_data[user_code]['categoria'].append('sem_email')
 
             # Verificar se está nas listas de categorias específicas
-            if user_code in categories['rel86']['pessoas_sem_email']:
+            if user_code in contexto['rel86_sem_email']:
                 users_data[user_code]['categoria'].append('rel86_sem_email')
 
-            if user_code in categories['rel76']['pessoas_sem_email']:
+            if user_code in contexto['rel76_sem_email']:
                 users_data[user_code]['categoria'].append('rel76_sem_email')
 
-        # Verificar devolução pendente (data efetivada está vazia)
-        data_efetivada = row.get('Data devolução efetivada', "")
-        if pd.isna(data_efetivada):
-            tem_devolucao_pendente = True
-            data_efetivada = ""  # Garantir que é string vazia para uso futuro
-        elif isinstance(data_efetivada, str):
-            tem_devolucao_pendente = not data_efetivada.strip()
-            # Manter como string
-        else:
-            tem_devolucao_pendente = True  # Assume pendente para casos não-string
-            data_efetivada = ""  # Converter para string vazia
-
-        # Extrair e validar todos os valores com tratamento para NaN
-        titulo = row.get('Título', "")
-        titulo = "" if pd.isna(titulo) else str(titulo).strip()
-
-        data_emprestimo = row.get('Data de empréstimo', "")
-        data_emprestimo = "" if pd.isna(data_emprestimo) else data_emprestimo
-
-        data_prevista = row.get('Data devolução prevista', "")
-        data_prevista = "" if pd.isna(data_prevista) else data_prevista
-
-        # Número chave pode estar em duas colunas diferentes
-        numero_chave = row.get('Número chave', row.get('Número da chave', ""))
-        numero_chave = "" if pd.isna(numero_chave) else str(numero_chave).strip()
-
-        # Tratamento específico para multas de chaves
-        tem_chave = bool(numero_chave.strip())
-
-        # Calcular o valor com desconto - tratamento seguro para NaN
-        try:
-            valor_multa = 0.0
-            if 'Valor multa' in row and not pd.isna(row['Valor multa']):
-                valor_multa = float(row['Valor multa'])
-        except (ValueError, TypeError):
-            valor_multa = 0.0
-
-        try:
-            valor_desconto = 0.0
-            if 'Valor do desconto' in row and not pd.isna(row['Valor do desconto']):
-                valor_desconto = float(row['Valor do desconto'])
-        except (ValueError, TypeError):
-            valor_desconto = 0.0
-
-        valor_final = max(0, valor_multa - valor_desconto)  # Garantir que nunca seja negativo
-
-        # LÓGICA ESPECÍFICA PARA CHAVES
-        # 1. Se tem chave e não tem data de empréstimo, usar a data prevista como data de empréstimo
-        if tem_chave and not data_emprestimo and data_prevista:
-            data_emprestimo = data_prevista
-
-        # 2. Se tem chave, tem multa e não tem data de devolução efetiva, calcular a data
-        data_efetivada_calculada = ""
-
-        # Corrigir a verificação para evitar chamar strip() em float
-        tem_data_efetivada = False
-        if isinstance(data_efetivada, str) and data_efetivada.strip():
-            tem_data_efetivada = True
-
-        if tem_chave and valor_final > 0 and not tem_data_efetivada:
-            try:
-                # Converter data prevista para objeto de data
-                data_obj = datetime.strptime(data_prevista, "%d/%m/%Y")
-
-                # Se o valor da multa for 1, adicionar 1 dia à data prevista
-                if valor_final == 1:
-                    data_devolucao = data_obj + pd.Timedelta(days=1)
-                else:
-                    # Caso contrário, usar o valor da multa como dias de atraso
-                    data_devolucao = data_obj + pd.Timedelta(days=int(valor_final))
-
-                # Formatar de volta para string
-                data_efetivada_calculada = data_devolucao.strftime("%d/%m/%Y")
-                # Como calculamos a data, não está mais pendente
-                tem_devolucao_pendente = False
-            except (ValueError, TypeError):
-                # Se não conseguir calcular, mantém como estava
-                pass
-
-        # Usar a data calculada se disponível
-        if data_efetivada_calculada:
-            data_efetivada = data_efetivada_calculada
-
-        # Criar objeto de multa
-        multa = {
-            'titulo': titulo,
-            'data_emprestimo': format_date(data_emprestimo),
-            'data_prevista': format_date(data_prevista),
-            'data_efetivada': format_date(data_efetivada),
-            'valor': valor_multa,
-            'desconto': valor_desconto,
-            'valor_final': valor_final,
-            'numero_chave': numero_chave,
-            'devolucao_pendente': tem_devolucao_pendente,
-            'eh_chave': tem_chave,
-            'dias_atraso': int(valor_final) if tem_chave else 0
-        }
+        posicoes[user_code].append(posicao)
 
-        # Adicionar multa à lista de multas do usuário
-        users_data[user_code]['multas'].append(multa)
+        # Multas de chaves dependem da data calculada; as demais só precisam do valor e da data efetivada
+        if _key_number(row):
+            multa = _fine_item(row)
+            valor_final, tem_devolucao_pendente = multa['valor_final'], multa['devolucao_pendente']
+        else:
+            valor_final = _fine_amounts(row)[2]
+            tem_devolucao_pendente = _return_status(row)[0]
 
         # Atualizar o total de multas do usuário
         users_data[user_code]['total_multas'] += valor_final
@@ -383,6 +463,9 @@ def group_fines_by_user(df):
 
     # Atribuir categorias baseadas nas flags
     for user_code, user_data in users_data.items():
+        # Multas montadas apenas quando acessadas
+        user_data['multas'] = LazyItems(df_relevant, posicoes[user_code], _fine_items)
+
         # Categoria de valor alto (≥ 100)
         if user_data['total_multas'] >= 100:
             user_data['categoria'].append('multa_alta')
@@ -397,6 +480,207 @@ def group_fines_by_user(df):
 
     return users_data
 
+def group_items_by_person(df, num_shards=None):
+    """
+    Agrupa multas (rel86) e pendências (rel76) por código de pessoa.
+
+    Args:
+        df: DataFrame unificado (com a coluna 'Relatório')
+        num_shards: Número de partições paralelas (padrão: conforme o volume de dados)
+
+    Returns:
+        Dicionário {código: registro} na ordem de primeira ocorrência dos códigos
+    """
+    colunas = [
+        'Código da pessoa', 'Código original', 'Nome da pessoa', 'Email', 'Relatório', 'Título',
+        'Valor multa', 'Data de empréstimo', 'Data devolução prevista', 'Data devolução efetivada'
+    ]
+    df_itens = df[[coluna for coluna in colunas if coluna in df.columns]]
+    df_itens = pd.concat([df_itens, typed_item_columns(df_itens)], axis=1)
+    # Hash de cada linha, calculado de uma vez (resumo do conteúdo nas chaves do cache)
+    df_itens[COLUNA_RESUMO] = pd.util.hash_pandas_object(df_itens, index=False).to_numpy()
+    return run_sharded(df_itens, _build_person_items, num_shards=num_shards, ao_receber=bind_frame)
+
+def typed_item_columns(df):
+    """
+    Calcula de uma vez, para todas as linhas, os campos exibidos nos e-mails.
+
+    As datas são convertidas para datetime64 e formatadas com um strftime
+    vetorizado por coluna. Para as chaves sem data de devolução, a data
+    efetiva é a prevista somada aos dias de atraso (R$ 1,00 por dia), e os
+    dias de atraso das chaves são o próprio valor da multa. Nos demais
+    itens, os dias de atraso vêm das datas; sem elas, do valor da multa.
+    Nas pendências, o atraso é contado da data prevista até hoje (vazio sem
+    data prevista).
+
+    Args:
+        df: DataFrame com as colunas de itens (as ausentes são tratadas como vazias)
+
+    Returns:
+        DataFrame com as colunas 'Item chave', 'Empréstimo formatado',
+        'Prevista formatada', 'Efetivada formatada', 'Dias de atraso' (inteiro),
+        'Dias de atraso formatado', 'Atraso até hoje' (Int64, nulo sem data
+        prevista) e 'Atraso até hoje formatado'
+    """
+    vazia = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    emprestimo = parse_date_column(df['Data de empréstimo']) if 'Data de empréstimo' in df.columns else vazia
+    prevista = parse_date_column(df['Data devolução prevista']) if 'Data devolução prevista' in df.columns else vazia
+    efetivada = parse_date_column(df['Data devolução efetivada']) if 'Data devolução efetivada' in df.columns else vazia
+
+    valor = pd.to_numeric(df['Valor multa'], errors='coerce').fillna(0.0) \
+        if 'Valor multa' in df.columns else pd.Series(0.0, index=df.index)
+    dias_valor = valor.astype(np.int64)
+    chave = df['Título'].astype(str).str.contains('Chave:', regex=False).to_numpy() \
+        if 'Título' in df.columns else np.zeros(len(df), dtype=bool)
+
+    # Chaves sem devolução registrada: prevista + dias de atraso
+    calcular = chave & efetivada.isna().to_numpy() & prevista.notna().to_numpy()
+    efetivada = efetivada.where(~calcular, prevista + pd.to_timedelta(dias_valor, unit='D'))
+
+    # Com data efetiva, os dias vêm das datas (0 se a data prevista estiver vazia)
+    com_datas = efetivada.notna().to_numpy() & ('Data devolução prevista' in df.columns)
+    dias_datas = (efetivada - prevista).dt.days.fillna(0).clip(lower=0).astype(np.int64)
+    dias = np.where(chave, dias_valor, np.where(com_datas, dias_datas, np.where(valor > 0, dias_valor, 0)))
+
+    # Pendências: dias desde a data prevista até hoje
+    ate_hoje = (pd.Timestamp.now() - prevista).dt.days.clip(lower=0).astype('Int64')
+
+    return pd.DataFrame({
+        'Item chave': chave,
+        'Empréstimo formatado': format_date_column(emprestimo, FORMATO_BR, DATA_INDISPONIVEL),
+        'Prevista formatada': format_date_column(prevista, FORMATO_BR, DATA_INDISPONIVEL),
+        'Efetivada formatada': format_date_column(efetivada, FORMATO_BR, DATA_INDISPONIVEL),
+        'Dias de atraso': dias,
+        'Dias de atraso formatado': pd.Series(dias, index=df.index).astype(str).astype(object),
+        'Atraso até hoje': ate_hoje,
+        'Atraso até hoje formatado': ate_hoje.astype(object).where(ate_hoje.notna(), '').astype(str).astype(object)
+    }, index=df.index)
+
+def _column_values(df, coluna, padrao=''):
+    """Valores de uma coluna como lista (ou o valor padrão, se a coluna não existir)."""
+    return df[coluna].tolist() if coluna in df.columns else [padrao] * len(df)
+
+def _person_fine_items(linhas):
+    """Materializa as multas (rel86) de uma pessoa (usado por LazyItems)."""
+    return [
+        {
+            'titulo': titulo,
+            'valor': 0.0 if pd.isna(valor) else valor,
+            'data_emprestimo': data_emprestimo,
+            'data_prevista': data_prevista,
+            'data_efetivada': data_efetivada,
+            'eh_chave': bool(eh_chave),
+            'texto_emprestimo': texto_emprestimo,
+            'texto_prevista': texto_prevista,
+            'texto_efetivada': texto_efetivada,
+            'dias_atraso': int(dias_atraso),
+            'texto_dias_atraso': texto_dias_atraso
+        }
+        for (titulo, valor, data_emprestimo, data_prevista, data_efetivada, eh_chave,
+             texto_emprestimo, texto_prevista, texto_efetivada, dias_atraso, texto_dias_atraso) in zip(
+            _column_values(linhas, 'Título'),
+            _column_values(linhas, 'Valor multa', 0.0),
+            _column_values(linhas, 'Data de empréstimo'),
+            _column_values(linhas, 'Data devolução prevista'),
+            _column_values(linhas, 'Data devolução efetivada'),
+            _column_values(linhas, 'Item chave', False),
+            _column_values(linhas, 'Empréstimo formatado', DATA_INDISPONIVEL),
+            _column_values(linhas, 'Prevista formatada', DATA_INDISPONIVEL),
+            _column_values(linhas, 'Efetivada formatada', DATA_INDISPONIVEL),
+            _column_values(linhas, 'Dias de atraso', 0),
+            _column_values(linhas, 'Dias de atraso formatado', '0')
+        )
+    ]
+
+def _person_pending_items(linhas):
+    """Materializa as pendências (rel76) de uma pessoa (usado por LazyItems)."""
+    return [
+        {
+            'titulo': titulo,
+            'data_emprestimo': data_emprestimo,
+            'data_prevista': data_prevista,
+            'texto_emprestimo': texto_emprestimo,
+            'texto_prevista': texto_prevista,
+            'dias_atraso': None if pd.isna(dias_atraso) else int(dias_atraso),
+            'texto_dias_atraso': texto_dias_atraso
+        }
+        for (titulo, data_emprestimo, data_prevista, texto_emprestimo, texto_prevista,
+             dias_atraso, texto_dias_atraso) in zip(
+            _column_values(linhas, 'Título'),
+            _column_values(linhas, 'Data de empréstimo'),
+            _column_values(linhas, 'Data devolução prevista'),
+            _column_values(linhas, 'Empréstimo formatado', DATA_INDISPONIVEL),
+            _column_values(linhas, 'Prevista formatada', DATA_INDISPONIVEL),
+            _column_values(linhas, 'Atraso até hoje', None),
+            _column_values(linhas, 'Atraso até hoje formatado')
+        )
+    ]
+
+def _build_person_items(df, contexto=None):
+    """
+    Monta os registros de group_items_by_person (uma partição por vez).
+
+    Nome, e-mail, códigos e valor total são calculados de forma vetorizada; as
+    listas de multas e pendências guardam apenas as posições das linhas e são
+    montadas sob demanda (LazyItems).
+
+    Args:
+        df: DataFrame unificado (ou uma partição dele), com índice posicional
+        contexto: Não utilizado
+
+    Returns:
+        Dicionário {código: registro}
+    """
+    codigos = np.array([str(codigo) for codigo in _column_values(df, 'Código da pessoa')], dtype=object)
+    validos = codigos != ''
+    relatorio = np.array(_column_values(df, 'Relatório'), dtype=object)
+
+    # Nome e e-mail da primeira linha de cada pessoa
+    nomes = df['Nome da pessoa'].astype(object).where(df['Nome da pessoa'].notna(), '') \
+        if 'Nome da pessoa' in df.columns else pd.Series('', index=df.index, dtype=object)
+    emails = df['Email'].astype(object).where(df['Email'].notna(), '') \
+        if 'Email' in df.columns else pd.Series('', index=df.index, dtype=object)
+    primeiras = pd.DataFrame({'codigo': codigos, 'nome': nomes.to_numpy(), 'email': emails.to_numpy()})[validos]
+    primeiras = primeiras.drop_duplicates('codigo')
+
+    # Códigos originais distintos de cada pessoa (mais de um quando há duplicados mesclados)
+    originais = _column_values(df, 'Código original', None) if 'Código original' in df.columns else codigos
+    pares = pd.DataFrame({'codigo': codigos, 'original': originais})[validos].drop_duplicates()
+    codigos_originais = {}
+    for codigo, original in zip(pares['codigo'], pares['original']):
+        codigos_originais.setdefault(codigo, []).append(original)
+
+    # Posições das multas e das pendências de cada pessoa
+    posicoes_multa = np.flatnonzero(validos & (relatorio == 'rel86'))
+    posicoes_pendencia = np.flatnonzero(validos & (relatorio == 'rel76'))
+    multas = {
+        codigo: posicoes_multa[indices]
+        for codigo, indices in pd.Series(codigos[posicoes_multa]).groupby(codigos[posicoes_multa], sort=False).indices.items()
+    } if len(posicoes_multa) else {}
+    pendencias = {
+        codigo: posicoes_pendencia[indices]
+        for codigo, indices in pd.Series(codigos[posicoes_pendencia]).groupby(codigos[posicoes_pendencia], sort=False).indices.items()
+    } if len(posicoes_pendencia) else {}
+
+    # Soma sequencial (mesmo resultado de somar item a item)
+    totais = {}
+    for codigo, valor in zip(codigos[posicoes_multa], np.array(_column_values(df, 'Valor multa', 0.0), dtype=object)[posicoes_multa]):
+        totais[codigo] = totais.get(codigo, 0.0) + (0.0 if pd.isna(valor) else valor)
+
+    temp_user_data = {}
+    for codigo, nome, email in zip(primeiras['codigo'], primeiras['nome'], primeiras['email']):
+        temp_user_data[codigo] = {
+            'codigo': codigo,
+            'codigos': codigos_originais[codigo],
+            'nome': nome,
+            'email': email.strip().lower(),  # Normalizar email para agrupar corretamente
+            'multas': LazyItems(df, multas.get(codigo, []), _person_fine_items),
+            'pendencias': LazyItems(df, pendencias.get(codigo, []), _person_pending_items),
+            'valor_total_multas': totais.get(codigo, 0.0)
+        }
+
+    return temp_user_data
+
 def filter_users_by_category(users_data, category):
     """
     Filtra usuários por uma categoria específica.
@@ -505,7 +789,8 @@ def generate_json_file(df, output_path="multas_usuarios.json"):
 
     # Gravar arquivo JSON
     with open(output_path, 'w', encoding='utf-8') as json_file:
-        json.dump(users_list, json_file, ensure_ascii=False, indent=2)
+        # As listas de multas (LazyItems) são materializadas aqui
+        json.dump(users_list, json_file, ensure_ascii=False, indent=2, default=list)
 
     print(f"Arquivo JSON gerado com sucesso: {output_path}")
     return output_path
@@ -543,6 +828,101 @@ def get_fines_summary(df):
         'max_fines_count': max_fines_count
     }
 
+def data_fingerprint(df):
+    """
+    Calcula uma impressão digital do conteúdo do DataFrame.
+
+    Usada para evitar recalcular (e redesenhar) estatísticas quando os
+    dados unificados não mudaram.
+
+    Args:
+        df: DataFrame pandas
+
+    Returns:
+        String hexadecimal que muda sempre que o conteúdo do DataFrame muda
+    """
+    if df is None:
+        return ""
+    hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.sha1(hashes.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode('utf-8'))
+    return digest.hexdigest()
+
+def _bincount_by_report(relatorio, faixas, num_faixas):
+    """Conta as linhas de cada faixa separadamente por relatório em uma única passada."""
+    codigos_relatorio = pd.Categorical(relatorio, categories=RELATORIOS).codes.astype(np.int64)
+    codigos_faixa = np.asarray(faixas.cat.codes, dtype=np.int64)
+
+    # Linhas sem faixa (-1) ou de relatório desconhecido ficam de fora
+    validos = (codigos_relatorio >= 0) & (codigos_faixa >= 0)
+    combinados = codigos_relatorio[validos] * num_faixas + codigos_faixa[validos]
+    contagens = np.bincount(combinados, minlength=len(RELATORIOS) * num_faixas)
+
+    return {
+        relatorio_nome: contagens[i * num_faixas:(i + 1) * num_faixas].tolist()
+        for i, relatorio_nome in enumerate(RELATORIOS)
+    }
+
+def compute_overdue_days(df, hoje=None):
+    """
+    Calcula os dias de atraso de cada linha de forma vetorizada.
+
+    Pendências contam até hoje, multas até a data de devolução efetivada e,
+    para chaves, o atraso é o próprio valor da multa (R$ 1,00 por dia).
+
+    Args:
+        df: DataFrame unificado
+        hoje: Data de referência (padrão: data atual)
+
+    Returns:
+        Series com os dias de atraso (NaN quando não há data prevista)
+    """
+    if hoje is None:
+        hoje = pd.Timestamp.now().normalize()
+
+    vazio = pd.Series(index=df.index, dtype=object)
+    prevista = parse_date_column(df.get('Data devolução prevista', vazio))
+    efetivada = parse_date_column(df.get('Data devolução efetivada', vazio))
+    valor = pd.to_numeric(df.get('Valor multa', vazio), errors='coerce').fillna(0)
+
+    numero_chave = df.get('Número chave', vazio)
+    eh_chave = numero_chave.notna() & numero_chave.astype(str).str.strip().ne('')
+
+    dias = (efetivada.fillna(hoje) - prevista).dt.days
+    return dias.where(~eh_chave, valor).clip(lower=0)
+
+def compute_aging_histograms(df, hoje=None):
+    """
+    Calcula a distribuição dos dias de atraso e dos valores de multa por relatório.
+
+    Args:
+        df: DataFrame unificado
+        hoje: Data de referência (padrão: data atual)
+
+    Returns:
+        Dicionário com as contagens por faixa de atraso e de multa para cada relatório
+    """
+    vazio = pd.Series(index=df.index, dtype=object)
+    dias = compute_overdue_days(df, hoje)
+    valor = pd.to_numeric(df.get('Valor multa', vazio), errors='coerce').fillna(0)
+
+    faixas_atraso = pd.cut(dias, bins=FAIXAS_ATRASO, labels=ROTULOS_ATRASO)
+    # Apenas valores positivos entram na distribuição de multas
+    faixas_multa = pd.cut(valor.where(valor > 0), bins=FAIXAS_MULTA, labels=ROTULOS_MULTA, right=False)
+
+    relatorio = df.get('Relatório', vazio)
+
+    return {
+        'atraso': {
+            'rotulos': list(ROTULOS_ATRASO),
+            **_bincount_by_report(relatorio, faixas_atraso, len(ROTULOS_ATRASO))
+        },
+        'multas': {
+            'rotulos': list(ROTULOS_MULTA),
+            **_bincount_by_report(relatorio, faixas_multa, len(ROTULOS_MULTA))
+        }
+    }
+
 # Função de teste do módulo
 if __name__ == "__main__":
     from read_excel import read_excel_file, clean_column_names
@@ -0,0 +1,156 @@
+"""
+Conversão e formatação de datas com cache.
+
+As mesmas datas (empréstimo, devolução prevista) se repetem em muitos itens e
+são formatadas a cada preview e a cada envio. As funções deste módulo guardam
+em caches LRU limitados o resultado de cada valor bruto já visto, evitando
+repetir as tentativas de strptime. Há também versões vetorizadas para colunas
+inteiras, que convertem cada valor distinto uma única vez.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FORMATO_BR = '%d/%m/%Y'
+FORMATO_ISO = '%Y-%m-%d'
+FORMATOS_PADRAO = (FORMATO_BR, FORMATO_ISO)
+
+# Quantidade máxima de valores distintos guardados em cada cache
+TAMANHO_CACHE = 4096
+
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def parse_date_text(texto, formatos=FORMATOS_PADRAO):
+    """
+    Converte um texto em datetime tentando os formatos na ordem informada.
+
+    Args:
+        texto: Texto da data
+        formatos: Tupla de formatos aceitos pelo strptime
+
+    Returns:
+        datetime ou None se nenhum formato servir
+    """
+    for formato in formatos:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return None
+
+
+def to_datetime(valor, formatos=FORMATOS_PADRAO):
+    """
+    Converte um valor (texto ou datetime/Timestamp) em datetime.
+
+    Returns:
+        datetime ou None se o valor não puder ser convertido
+    """
+    if isinstance(valor, str):
+        return parse_date_text(valor, formatos)
+    if isinstance(valor, datetime):
+        return valor
+    return None
+
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _format_datetime(valor, formato):
+    """Formata um datetime (resultado guardado por valor)."""
+    return valor.strftime(formato)
+
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _format_text_br(texto):
+    """Formata um texto de data para DD/MM/YYYY (mantém o texto se não for ISO)."""
+    data = parse_date_text(texto, (FORMATO_ISO,))
+    return data.strftime(FORMATO_BR) if data is not None else texto
+
+
+def format_date_br(valor):
+    """
+    Formata uma data para o padrão DD/MM/YYYY.
+
+    Textos em ISO são convertidos; textos já em DD/MM/YYYY ou em formato
+    desconhecido são mantidos como estão.
+
+    Args:
+        valor: Timestamp, datetime ou texto
+
+    Returns:
+        Texto da data
+    """
+    if isinstance(valor, str):
+        return _format_text_br(valor)
+    if isinstance(valor, datetime):
+        return _format_datetime(valor, FORMATO_BR)
+    return str(valor)
+
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _br_text_to_iso(texto):
+    """Converte um texto DD/MM/YYYY para YYYY-MM-DD (mantém o texto se não for possível)."""
+    data = parse_date_text(texto, (FORMATO_BR,))
+    return data.strftime(FORMATO_ISO) if data is not None else texto
+
+
+def br_to_iso(valor):
+    """
+    Converte uma data no formato brasileiro para ISO.
+
+    Args:
+        valor: Texto no formato DD/MM/YYYY
+
+    Returns:
+        Texto YYYY-MM-DD, o texto original se não for possível converter,
+        ou '' para valores vazios ou que não são texto
+    """
+    if not isinstance(valor, str):
+        return ""
+    return _br_text_to_iso(valor)
+
+
+def parse_date_column(serie, formatos=FORMATOS_PADRAO):
+    """
+    Converte uma coluna inteira em datas (cada valor distinto é convertido uma vez).
+
+    Args:
+        serie: Series com textos, datetimes ou valores vazios
+        formatos: Formatos aceitos para os textos
+
+    Returns:
+        Series datetime64 (NaT para valores vazios ou inválidos)
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie
+
+    codigos, unicos = pd.factorize(serie)
+    convertidos = pd.to_datetime(
+        pd.Series([to_datetime(valor, formatos) for valor in unicos] + [None], dtype=object),
+        errors='coerce'
+    )
+    # O código -1 (valores vazios) aponta para o último elemento (NaT)
+    return pd.Series(convertidos.to_numpy()[codigos], index=serie.index)
+
+
+def format_date_column(serie, formato=FORMATO_BR, vazio=''):
+    """
+    Formata uma coluna inteira de datas.
+
+    Args:
+        serie: Series com textos, datetimes ou valores vazios
+        formato: Formato de saída
+        vazio: Texto usado para valores vazios ou inválidos
+
+    Returns:
+        Series de textos
+    """
+    datas = parse_date_column(serie)
+
+    # Um único strftime vetorizado sobre as datas distintas
+    codigos, unicos = pd.factorize(datas)
+    textos = np.append(pd.DatetimeIndex(unicos).strftime(formato).to_numpy(dtype=object), vazio)
+    # O código -1 (NaT) aponta para o último elemento (texto vazio)
+    return pd.Series(textos[codigos], index=serie.index, dtype=object)
@@ -0,0 +1,252 @@
+"""
+Detecção de usuários duplicados (mesma pessoa com vários códigos).
+
+Os candidatos são gerados por um índice de blocagem (primeiro + último nome
+normalizados e parte local do e-mail), de forma que apenas pessoas do mesmo
+bloco são comparadas entre si. Os pares com pontuação acima do limiar são
+unidos e o resultado é um mapa de mesclagem {código: código_canônico} que
+pode ser aplicado antes dos agrupamentos por usuário.
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from itertools import combinations
+
+import pandas as pd
+
+# Preposições e conectivos ignorados na comparação de nomes
+STOPWORDS_NOME = {'da', 'de', 'do', 'das', 'dos', 'e', 'di', 'du'}
+
+# Blocos muito grandes (nomes muito comuns) são ignorados para evitar explosão de pares
+MAX_BLOCO = 200
+
+LIMIAR_PADRAO = 0.8
+PESO_NOME = 0.7
+PESO_EMAIL = 0.3
+
+_RE_NAO_LETRA = re.compile(r'[^a-z ]+')
+_RE_NAO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name_tokens(nome):
+    """
+    Normaliza um nome em uma tupla de tokens sem acentos e sem conectivos.
+
+    Args:
+        nome: Nome da pessoa
+
+    Returns:
+        Tupla de tokens em minúsculas
+    """
+    if not isinstance(nome, str):
+        return ()
+    sem_acentos = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    texto = _RE_NAO_LETRA.sub(' ', sem_acentos.lower())
+    return tuple(token for token in texto.split() if token not in STOPWORDS_NOME)
+
+
+def normalize_email_local(email):
+    """
+    Extrai a parte local do e-mail normalizada (sem pontos, hífens e sufixos '+').
+
+    Args:
+        email: Endereço de e-mail
+
+    Returns:
+        String normalizada ou '' se não houver e-mail
+    """
+    if not isinstance(email, str) or '@' not in email:
+        return ''
+    local = email.strip().lower().split('@', 1)[0].split('+', 1)[0]
+    return _RE_NAO_ALFANUMERICO.sub('', local)
+
+
+def build_person_table(df):
+    """
+    Monta a tabela de pessoas (uma linha por código) usada na detecção.
+
+    Args:
+        df: DataFrame unificado
+
+    Returns:
+        DataFrame com código, nome, e-mail, tokens do nome e parte local do e-mail
+    """
+    df = df[df['Código da pessoa'].notna()]
+    pessoas = pd.DataFrame({
+        'codigo': df['Código da pessoa'].map(str),
+        'nome': df['Nome da pessoa'].astype(object).where(df['Nome da pessoa'].notna(), ''),
+        'email': df['Email'].astype(object).where(df['Email'].notna(), '')
+    })
+    pessoas['email'] = pessoas['email'].map(lambda email: str(email).strip().lower())
+
+    # Preferir o primeiro e-mail não vazio de cada código (vazios por último, ordem estável)
+    pessoas = pessoas.sort_values('email', key=lambda emails: emails.eq(''), kind='stable')
+    pessoas = pessoas.drop_duplicates('codigo').set_index('codigo')
+
+    pessoas['tokens'] = pessoas['nome'].map(normalize_name_tokens)
+    pessoas['email_local'] = pessoas['email'].map(normalize_email_local)
+    return pessoas
+
+
+def build_blocking_index(pessoas):
+    """
+    Cria o índice de blocagem {chave: [códigos]}.
+
+    Args:
+        pessoas: Tabela gerada por build_person_table
+
+    Returns:
+        Dicionário com os blocos que possuem pelo menos dois códigos
+    """
+    blocos = {}
+    for codigo, tokens, email_local in zip(pessoas.index, pessoas['tokens'], pessoas['email_local']):
+        chaves = []
+        if len(tokens) >= 2:
+            chaves.append(('nome', tokens[0], tokens[-1]))
+        if len(email_local) >= 4:
+            chaves.append(('email', email_local))
+        for chave in chaves:
+            blocos.setdefault(chave, []).append(codigo)
+
+    return {chave: codigos for chave, codigos in blocos.items() if len(codigos) > 1}
+
+
+def score_pair(tokens_a, tokens_b, email_local_a, email_local_b, limiar=0.0):
+    """
+    Pontua a semelhança entre duas pessoas (0 a 1).
+
+    O nome contribui com a similaridade de Jaccard dos tokens; o e-mail conta
+    integralmente quando as partes locais coincidem e parcialmente quando são
+    muito parecidas. Sem e-mail dos dois lados não há evidência além do nome
+    (homônimos são comuns), e o par fica abaixo do limiar padrão. Pares que
+    não podem atingir o limiar retornam 0 sem a comparação (mais cara) dos
+    e-mails.
+    """
+    conjunto_a, conjunto_b = set(tokens_a), set(tokens_b)
+    if not conjunto_a or not conjunto_b:
+        return 0.0
+    similaridade_nome = len(conjunto_a & conjunto_b) / len(conjunto_a | conjunto_b)
+    tem_emails = bool(email_local_a and email_local_b)
+    if PESO_NOME * similaridade_nome + (PESO_EMAIL if tem_emails else 0.0) < limiar:
+        return 0.0
+
+    if tem_emails:
+        if email_local_a == email_local_b:
+            similaridade_email = 1.0
+        else:
+            comparador = SequenceMatcher(None, email_local_a, email_local_b)
+            # Limites superiores baratos antes do cálculo completo
+            if comparador.real_quick_ratio() < 0.85 or comparador.quick_ratio() < 0.85:
+                razao = 0.0
+            else:
+                razao = comparador.ratio()
+            similaridade_email = razao if razao >= 0.85 else 0.0
+    else:
+        similaridade_email = 0.0
+
+    return PESO_NOME * similaridade_nome + PESO_EMAIL * similaridade_email
+
+
+def find_duplicate_patrons(df, limiar=LIMIAR_PADRAO):
+    """
+    Detecta códigos de pessoa que provavelmente pertencem à mesma pessoa.
+
+    Args:
+        df: DataFrame unificado
+        limiar: Pontuação mínima para considerar um par como duplicado
+
+    Returns:
+        Tupla (merge_map, pares), onde merge_map é {código: código_canônico}
+        (apenas códigos mesclados) e pares é um DataFrame com os pares aceitos
+    """
+    if df is None or df.empty:
+        return {}, pd.DataFrame(columns=['codigo_a', 'codigo_b', 'pontuacao'])
+
+    pessoas = build_person_table(df)
+    tokens = pessoas['tokens'].to_dict()
+    emails_locais = pessoas['email_local'].to_dict()
+
+    comparados = set()
+    pares = []
+    for chave, codigos in build_blocking_index(pessoas).items():
+        if len(codigos) > MAX_BLOCO:
+            print(f"Aviso: bloco {chave} com {len(codigos)} pessoas ignorado na detecção de duplicados.")
+            continue
+        for codigo_a, codigo_b in combinations(codigos, 2):
+            par = (codigo_a, codigo_b) if codigo_a < codigo_b else (codigo_b, codigo_a)
+            if par in comparados:
+                continue
+            comparados.add(par)
+
+            pontuacao = score_pair(
+                tokens[codigo_a], tokens[codigo_b],
+                emails_locais[codigo_a], emails_locais[codigo_b],
+                limiar
+            )
+            if pontuacao >= limiar:
+                pares.append((par[0], par[1], round(pontuacao, 3)))
+
+    # União dos pares aceitos (union-find)
+    pai = {}
+
+    def raiz(codigo):
+        pai.setdefault(codigo, codigo)
+        while pai[codigo] != codigo:
+            pai[codigo] = pai[pai[codigo]]
+            codigo = pai[codigo]
+        return codigo
+
+    for codigo_a, codigo_b, _ in pares:
+        raiz_a, raiz_b = raiz(codigo_a), raiz(codigo_b)
+        if raiz_a != raiz_b:
+            pai[raiz_b] = raiz_a
+
+    grupos = {}
+    for codigo in pai:
+        grupos.setdefault(raiz(codigo), []).append(codigo)
+
+    # Código canônico: o primeiro (menor) código que possui e-mail, senão o menor código
+    # (comparados como números quando todos são numéricos, para que "9" venha antes de "10")
+    emails = pessoas['email'].to_dict()
+    merge_map = {}
+    for membros in grupos.values():
+        numericos = all(codigo.isdigit() for codigo in membros)
+        membros.sort(key=lambda codigo: (emails[codigo] == '', int(codigo) if numericos else codigo))
+        canonico = membros[0]
+        for codigo in membros[1:]:
+            merge_map[codigo] = canonico
+
+    return merge_map, pd.DataFrame(pares, columns=['codigo_a', 'codigo_b', 'pontuacao'])
+
+
+def apply_merge_map(df, merge_map):
+    """
+    Aplica o mapa de mesclagem ao DataFrame unificado.
+
+    Os códigos mesclados passam a usar o código, o nome e o e-mail do código
+    canônico. O código original é preservado na coluna 'Código original'.
+
+    Args:
+        df: DataFrame unificado
+        merge_map: Dicionário {código: código_canônico}
+
+    Returns:
+        Novo DataFrame com os códigos mesclados
+    """
+    df = df.copy()
+    codigos = df['Código da pessoa'].map(lambda codigo: None if pd.isna(codigo) else str(codigo))
+    df['Código original'] = codigos
+    if not merge_map:
+        return df
+
+    canonicos = codigos.map(lambda codigo: merge_map.get(codigo, codigo))
+    mesclados = canonicos.ne(codigos) & codigos.notna()
+
+    # Nome e e-mail de referência de cada código canônico, mantendo o tipo original do código
+    pessoas = build_person_table(df)
+    valores_originais = dict(zip(codigos, df['Código da pessoa']))
+    df.loc[mesclados, 'Código da pessoa'] = canonicos[mesclados].map(valores_originais)
+    df.loc[mesclados, 'Nome da pessoa'] = canonicos[mesclados].map(pessoas['nome'])
+    df.loc[mesclados, 'Email'] = canonicos[mesclados].map(pessoas['email'])
+    return df
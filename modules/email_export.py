@@ -0,0 +1,75 @@
+"""
+Exportação dos e-mails de um lote para revisão, sem envio.
+
+As mensagens MIME montadas por email_sender.build_message (as mesmas que
+send_email enviaria) são gravadas uma a uma, à medida que ficam prontas,
+num arquivo mbox ou numa pasta de arquivos .eml. Nenhuma mensagem é mantida
+em memória além da que está sendo gravada.
+"""
+
+import os
+import re
+import time
+from email.generator import BytesGenerator
+
+FORMATO_MBOX = 'mbox'
+FORMATO_EML = 'eml'
+
+_CARACTERES_INVALIDOS = re.compile(r'[^\w.@+-]+')
+
+
+def eml_filename(indice, destinatario):
+    """
+    Nome do arquivo .eml de uma mensagem.
+
+    Args:
+        indice: Posição da mensagem no lote (mantém a ordem de envio)
+        destinatario: Endereço do destinatário
+
+    Returns:
+        Nome do arquivo
+    """
+    return f"{indice + 1:05d}_{_CARACTERES_INVALIDOS.sub('_', destinatario or 'sem_email')}.eml"
+
+
+def _write_mbox(mensagens, caminho):
+    """Grava as mensagens num único arquivo mbox."""
+    quantidade = 0
+    with open(caminho, 'wb') as arquivo:
+        gerador = BytesGenerator(arquivo, mangle_from_=True)
+        for _, mensagem in mensagens:
+            mensagem.set_unixfrom(f"From MAILER-DAEMON {time.asctime()}")
+            gerador.flatten(mensagem, unixfrom=True)
+            arquivo.write(b"\n")
+            quantidade += 1
+    return quantidade
+
+
+def _write_eml(mensagens, pasta):
+    """Grava cada mensagem num arquivo .eml da pasta."""
+    os.makedirs(pasta, exist_ok=True)
+    quantidade = 0
+    for indice, (destinatario, mensagem) in enumerate(mensagens):
+        with open(os.path.join(pasta, eml_filename(indice, destinatario)), 'wb') as arquivo:
+            BytesGenerator(arquivo, mangle_from_=False).flatten(mensagem)
+        quantidade += 1
+    return quantidade
+
+
+def export_messages(mensagens, destino, formato=FORMATO_MBOX):
+    """
+    Grava as mensagens de um lote em disco.
+
+    Args:
+        mensagens: Iterável de (destinatário, mensagem MIME), consumido à medida que é gravado
+        destino: Caminho do arquivo mbox ou da pasta dos arquivos .eml
+        formato: FORMATO_MBOX ou FORMATO_EML
+
+    Returns:
+        Número de mensagens gravadas
+    """
+    if formato == FORMATO_MBOX:
+        return _write_mbox(mensagens, destino)
+    if formato == FORMATO_EML:
+        return _write_eml(mensagens, destino)
+    raise ValueError(f"Formato de exportação desconhecido: {formato}")
@@ -1,31 +1,187 @@
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORTA = 587
+# Mensagens enviadas por conexão antes de reconectar (limite do provedor por sessão)
+MAX_MENSAGENS_POR_CONEXAO = 90
+# Tempo ocioso (s) a partir do qual a conexão é conferida com NOOP antes do envio
+TEMPO_OCIOSO = 30
+TIMEOUT_SMTP = 60
 
-def send_email(remetente, senha, destinatario, assunto, corpo_email, modo_teste=True, destinatario_teste=None):
+
+def build_message(remetente, destinatario, assunto, corpo_email, corpo_texto=None,
+                  modo_teste=True, destinatario_teste=None):
     """
-    Envia um e-mail usando SMTP do Gmail.
-    Se modo_teste=True, envia apenas para destinatario_teste.
+    Monta a mensagem MIME enviada por send_email.
+    Se modo_teste=True, a mensagem é endereçada a destinatario_teste.
+    Com corpo_texto, a mensagem é multipart/alternative (texto simples + HTML).
+
+    Returns:
+        Mensagem MIME
     """
     if modo_teste and destinatario_teste:
         destinatario_real = destinatario
         destinatario = destinatario_teste
         assunto = f"[TESTE] {assunto} (original: {destinatario_real})"
 
-    # Criar o objeto MIMEText com o corpo do email
-    msg = MIMEMultipart()
+    if corpo_texto is None:
+        # Criar o objeto MIMEText com o corpo do email
+        msg = MIMEMultipart()
+        msg.attach(MIMEText(corpo_email, 'html'))
+    else:
+        # A última parte é a preferida pelos leitores de e-mail
+        msg = MIMEMultipart('alternative')
+        msg.attach(MIMEText(corpo_texto, 'plain'))
+        msg.attach(MIMEText(corpo_email, 'html'))
     msg['From'] = remetente
     msg['To'] = destinatario
     msg['Subject'] = assunto
-    msg.attach(MIMEText(corpo_email, 'html'))
+    return msg
+
+
+def send_email(remetente, senha, destinatario, assunto, corpo_email, modo_teste=True, destinatario_teste=None,
+               corpo_texto=None):
+    """
+    Envia um e-mail usando SMTP do Gmail.
+    Se modo_teste=True, envia apenas para destinatario_teste.
+    Se corpo_texto for informado, o e-mail leva também uma parte text/plain.
+    """
+    msg = build_message(remetente, destinatario, assunto, corpo_email, corpo_texto, modo_teste, destinatario_teste)
+    destinatario = msg['To']
 
     try:
-        servidor = smtplib.SMTP('smtp.gmail.com', 587)
+        servidor = smtplib.SMTP(SMTP_HOST, SMTP_PORTA)
         servidor.starttls()
         servidor.login(remetente, senha)
         servidor.send_message(msg)
         servidor.quit()
         return True, f"Email enviado para {destinatario}"
     except Exception as e:
-        return False, f"Erro ao enviar para {destinatario}: {e}" 
\ No newline at end of file
+        return False, f"Erro ao enviar para {destinatario}: {e}"
+
+
+class SmtpSession:
+    """
+    Conexão SMTP autenticada reaproveitada entre os e-mails de um lote.
+
+    A conexão (TCP, STARTTLS e login) é aberta no primeiro envio e mantida.
+    Depois de um período ocioso ela é conferida com NOOP; se o servidor tiver
+    encerrado a sessão, uma nova conexão é aberta e o envio é repetido uma
+    vez. Após max_mensagens envios a conexão é renovada preventivamente.
+    """
+
+    def __init__(self, remetente, senha, host=SMTP_HOST, porta=SMTP_PORTA,
+                 max_mensagens=MAX_MENSAGENS_POR_CONEXAO, tempo_ocioso=TEMPO_OCIOSO, timeout=TIMEOUT_SMTP):
+        self.remetente = remetente
+        self.senha = senha
+        self.host = host
+        self.porta = porta
+        self.max_mensagens = max_mensagens
+        self.tempo_ocioso = tempo_ocioso
+        self.timeout = timeout
+        self.servidor = None
+        self.mensagens_na_conexao = 0
+        self.conexoes = 0  # Conexões abertas (para acompanhamento)
+        self.ultimo_erro = None  # Exceção do último envio que falhou (códigos de resposta SMTP)
+        self.falha_na_conexao = False  # O último erro ocorreu ao abrir a conexão (conexão, STARTTLS ou login)
+        self.falha_na_autenticacao = False  # ... e, mais especificamente, no STARTTLS ou no login
+        self._ultimo_uso = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        """Abre e autentica uma nova conexão (fechando a anterior, se houver)."""
+        self.close()
+        # Permanecem True se a conexão ou a autenticação falhar
+        self.falha_na_conexao = True
+        self.falha_na_autenticacao = False
+        servidor = smtplib.SMTP(self.host, self.porta, timeout=self.timeout)
+        try:
+            servidor.ehlo()
+            self.falha_na_autenticacao = True
+            servidor.starttls()
+            servidor.login(self.remetente, self.senha)
+        except Exception:
+            servidor.close()
+            raise
+        self.falha_na_conexao = False
+        self.falha_na_autenticacao = False
+        self.servidor = servidor
+        self.mensagens_na_conexao = 0
+        self.conexoes += 1
+        self._ultimo_uso = time.monotonic()
+
+    def close(self):
+        """Encerra a conexão atual."""
+        servidor, self.servidor = self.servidor, None
+        if servidor is None:
+            return
+        try:
+            servidor.quit()
+        except Exception:
+            servidor.close()
+
+    def _ensure_connection(self):
+        """Garante uma conexão utilizável antes do envio."""
+        if self.servidor is not None and self.mensagens_na_conexao >= self.max_mensagens:
+            self.close()
+        elif self.servidor is not None and time.monotonic() - self._ultimo_uso > self.tempo_ocioso:
+            # Conexão parada há algum tempo: conferir se o servidor ainda a mantém
+            try:
+                if self.servidor.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.servidor is None:
+            self.connect()
+
+    def send_message(self, msg):
+        """
+        Envia uma mensagem MIME pela conexão da sessão.
+
+        Returns:
+            Tupla (sucesso, mensagem de status)
+        """
+        destinatario = msg['To']
+        self.ultimo_erro = None
+        self.falha_na_conexao = False
+        self.falha_na_autenticacao = False
+        try:
+            self._ensure_connection()
+            try:
+                self.servidor.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # O servidor encerrou a sessão: reconectar e tentar novamente uma vez
+                self.connect()
+                self.servidor.send_message(msg)
+        except smtplib.SMTPServerDisconnected as e:
+            self.ultimo_erro = e
+            self.close()
+            return False, f"Erro ao enviar para {destinatario}: {e}"
+        except smtplib.SMTPException as e:
+            # Recusas do servidor (destinatário, remetente, dados) mantêm a sessão
+            self.ultimo_erro = e
+            return False, f"Erro ao enviar para {destinatario}: {e}"
+        except Exception as e:
+            # Falhas de rede deixam a conexão em estado incerto
+            self.ultimo_erro = e
+            self.close()
+            return False, f"Erro ao enviar para {destinatario}: {e}"
+
+        self.mensagens_na_conexao += 1
+        self._ultimo_uso = time.monotonic()
+        return True, f"Email enviado para {destinatario}"
+
+    def send_email(self, destinatario, assunto, corpo_email, modo_teste=True, destinatario_teste=None,
+                   corpo_texto=None):
+        """Monta e envia um e-mail pela sessão (mesmos argumentos de send_email)."""
+        msg = build_message(self.remetente, destinatario, assunto, corpo_email, corpo_texto,
+                            modo_teste, destinatario_teste)
+        return self.send_message(msg) 
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Normalização e validação vetorizada de endereços de e-mail.
+
+Antes do envio, cada célula de e-mail é classificada como válida, corrigível
+ou inválida usando métodos de string do pandas e expressões regulares
+compiladas. Erros comuns de digitação no domínio são corrigidos por uma tabela
+local e células com vários endereços são separadas. Endereços inválidos são
+excluídos antes de qualquer conexão SMTP.
+"""
+
+import re
+import pandas as pd
+
+VALIDO = 'valido'
+CORRIGIVEL = 'corrigivel'
+INVALIDO = 'invalido'
+VAZIO = 'vazio'
+
+# Erros de digitação frequentes nos domínios -> domínio correto
+CORRECOES_DOMINIO = {
+    # Gmail
+    'gmial.com': 'gmail.com',
+    'gmai.com': 'gmail.com',
+    'gmal.com': 'gmail.com',
+    'gamil.com': 'gmail.com',
+    'gnail.com': 'gmail.com',
+    'gmail.co': 'gmail.com',
+    'gmail.con': 'gmail.com',
+    'gmail.cm': 'gmail.com',
+    'gmail.om': 'gmail.com',
+    'gmail.com.br': 'gmail.com',
+    'gmaill.com': 'gmail.com',
+    # Hotmail / Outlook
+    'hotmial.com': 'hotmail.com',
+    'hotmal.com': 'hotmail.com',
+    'hotmai.com': 'hotmail.com',
+    'hotmail.con': 'hotmail.com',
+    'hotmail.co': 'hotmail.com',
+    'homail.com': 'hotmail.com',
+    'outlok.com': 'outlook.com',
+    'outlook.con': 'outlook.com',
+    # Yahoo
+    'yaho.com': 'yahoo.com',
+    'yahoo.con': 'yahoo.com',
+    'yahoo.com.b': 'yahoo.com.br',
+    # Institucional
+    'ifc.edu.b': 'ifc.edu.br',
+    'ifc.edu': 'ifc.edu.br',
+    'ifc.edi.br': 'ifc.edu.br',
+    'ifc.eud.br': 'ifc.edu.br',
+    'ifc.edu.bt': 'ifc.edu.br',
+    'ifc.edu.rb': 'ifc.edu.br',
+    'ifc.com.br': 'ifc.edu.br',
+    'estudantes.ifc.edu.b': 'estudantes.ifc.edu.br',
+    'estudantes.ifc.edu': 'estudantes.ifc.edu.br',
+}
+
+# Separadores de vários endereços na mesma célula (espaços não separam: "joao silva@..."
+# é um endereço mal digitado, não dois endereços)
+_RE_SEPARADORES = re.compile(r'[;,/]+')
+_RE_ESPACO = re.compile(r'\s')
+# Resíduos comuns em endereços copiados (mailto:, <...>, pontuação nas pontas)
+_RE_PREFIXO_MAILTO = re.compile(r'^mailto:')
+_RE_PONTAS = re.compile(r'^[<("\'.]+|[>)"\'.]+$')
+# Endereço válido (forma prática, sem aspas nem IPs literais)
+_RE_EMAIL = re.compile(
+    r"[a-z0-9!#$%&'*+=?^_`{|}~-]+(?:\.[a-z0-9!#$%&'*+=?^_`{|}~-]+)*"
+    r"@(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}"
+)
+
+
+def _validate_unique(valores):
+    """Valida uma Series de células de e-mail sem repetição."""
+    limpos = valores.str.strip().str.lower()
+
+    # Uma linha por endereço (células com vários endereços são separadas)
+    enderecos = limpos.str.split(_RE_SEPARADORES).explode().str.strip()
+    enderecos = enderecos[enderecos.notna() & enderecos.ne('')]
+
+    ajustados = enderecos.str.replace(_RE_PREFIXO_MAILTO, '', regex=True)
+    ajustados = ajustados.str.replace(_RE_PONTAS, '', regex=True)
+
+    partes = ajustados.str.extract(r'^(?P<local>[^@]*)@(?P<dominio>[^@]*)$')
+    dominios = partes['dominio'].str.rstrip('.')
+    dominios = dominios.map(CORRECOES_DOMINIO).fillna(dominios)
+    ajustados = (partes['local'] + '@' + dominios).fillna(ajustados)
+
+    # Endereços com espaços internos são inválidos (nunca corrigidos para parte do texto)
+    eh_valido = ajustados.str.fullmatch(_RE_EMAIL).fillna(False).astype(bool)
+    eh_valido &= ~ajustados.str.contains(_RE_ESPACO).fillna(False).astype(bool)
+    foi_alterado = ajustados.ne(enderecos)
+
+    por_endereco = pd.DataFrame({
+        'email': ajustados,
+        'valido': eh_valido,
+        'alterado': foi_alterado & eh_valido
+    })
+
+    # Reagrupar por célula
+    agrupado = por_endereco.groupby(level=0, sort=False)
+    validos = por_endereco[por_endereco['valido']].groupby(level=0, sort=False)['email']
+    emails = validos.agg(lambda lista: ', '.join(dict.fromkeys(lista)))
+    qtd_enderecos = agrupado.size()
+    qtd_validos = validos.size()
+    algum_alterado = agrupado['alterado'].any()
+
+    resultado = pd.DataFrame(index=valores.index)
+    resultado['email'] = emails.reindex(valores.index).fillna('')
+    qtd_validos = qtd_validos.reindex(valores.index).fillna(0)
+    qtd_enderecos = qtd_enderecos.reindex(valores.index).fillna(0)
+    algum_alterado = algum_alterado.reindex(valores.index).fillna(False).astype(bool)
+
+    resultado['status'] = VALIDO
+    resultado.loc[(qtd_validos > 1) | (qtd_enderecos > qtd_validos) | algum_alterado, 'status'] = CORRIGIVEL
+    resultado.loc[qtd_validos == 0, 'status'] = INVALIDO
+    resultado.loc[limpos.eq(''), 'status'] = VAZIO
+
+    resultado['motivo'] = ''
+    resultado.loc[resultado['status'].eq(INVALIDO), 'motivo'] = 'Endereço inválido'
+    resultado.loc[resultado['status'].eq(CORRIGIVEL) & (qtd_enderecos > 1), 'motivo'] = 'Vários endereços na mesma célula'
+    resultado.loc[resultado['status'].eq(CORRIGIVEL) & (qtd_enderecos <= 1), 'motivo'] = 'Endereço corrigido'
+    return resultado
+
+
+def validate_emails(emails):
+    """
+    Normaliza e classifica uma coluna de e-mails.
+
+    Args:
+        emails: Series com os e-mails (pode conter NaN, vários endereços por célula etc.)
+
+    Returns:
+        DataFrame alinhado ao índice de entrada com as colunas:
+        - 'original': valor original
+        - 'email': endereço(s) normalizado(s) e válido(s), separados por ', '
+        - 'status': 'valido', 'corrigivel', 'invalido' ou 'vazio'
+        - 'motivo': descrição da correção ou do problema
+    """
+    originais = emails.astype(object).where(emails.notna(), '').map(str)
+
+    # Validar apenas os valores distintos (a mesma pessoa aparece em várias linhas)
+    codigos, unicos = pd.factorize(originais)
+    resultado_unicos = _validate_unique(pd.Series(unicos, dtype=object).astype(str))
+
+    resultado = resultado_unicos.iloc[codigos].set_index(emails.index)
+    resultado.insert(0, 'original', originais)
+    return resultado
@@ -14,6 +14,9 @@ from modules.read_excel import unify_dataframes
 from modules.styles_fix import get_main_styles, StyleManager, AppColors
 from modules.data_processor import generate_json_file, filter_users_by_category, categorize_users
 from modules.config_manager import ConfigManager
+from modules.sql_store import AnalyticsStore
+from modules.history_store import HistoryStore
+from modules.ledger import Ledger
 
 # Constantes de estilo que agora usam AppColors
 ACTION_CONTAINER_STYLE = f"""
@@ -43,6 +46,15 @@ class ExcelInterface(QMainWindow):
         self.multas_file = None
         self.pendencias_file = None
 
+        # Base SQLite em memória com as views de conciliação
+        self.analytics_store = AnalyticsStore()
+
+        # Histórico diário dos relatórios (tendências)
+        self.history_store = HistoryStore()
+
+        # Livro de lançamentos do atendimento (criado a cada unificação)
+        self.ledger = None
+
         # Configura a interface
         self.setup_ui()
 
@@ -227,15 +239,27 @@ class ExcelInterface(QMainWindow):
             # Gerar arquivo xlsx
             self.unified_data.to_excel('unificado.xlsx', index=False)
 
+            # Carregar a base analítica usada nas consultas de conciliação
+            self.analytics_store.load(self.unified_data)
+
+            # Registrar o snapshot do dia no histórico (falhas não impedem a unificação)
+            try:
+                self.history_store.record_snapshot(self.unified_data)
+            except Exception as e:
+                print(f"Erro ao registrar histórico: {e}")
+
+            # Livro de lançamentos para as atualizações pontuais do atendimento
+            self.ledger = Ledger(self.unified_data)
+
             # Atualizar todas as abas com os dados unificados
             if hasattr(self, 'results_tab'):
-                self.results_tab.update_data(self.unified_data)
+                self.results_tab.update_data(self.unified_data, self.analytics_store, self.history_store, self.ledger)
 
             if hasattr(self, 'template_tab'):
                 self.template_tab.update_data(self.unified_data)
 
             if hasattr(self, 'email_tab'):
-                self.email_tab.update_data(self.unified_data)
+                self.email_tab.update_data(self.unified_data, self.ledger)
 
             # Habilitar a aba de exportação
             # if hasattr(self, 'export_tab'):
@@ -0,0 +1,246 @@
+"""
+Histórico de snapshots diários dos relatórios unificados.
+
+Cada unificação registra, em um banco SQLite local, os agregados diários por
+pessoa (quantidade de multas e pendências, valor devido e maior atraso). Os
+totais diários e o início da situação de cada pessoa são mantidos de forma
+incremental no momento do registro, de modo que as consultas de tendência não
+precisam reprocessar os snapshots brutos.
+"""
+
+import sqlite3
+from datetime import datetime
+import pandas as pd
+
+from modules.data_processor import compute_overdue_days
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS snapshot_pessoa (
+        data TEXT NOT NULL,
+        codigo TEXT NOT NULL,
+        nome TEXT,
+        email TEXT,
+        qtd_multas INTEGER NOT NULL,
+        valor_multas REAL NOT NULL,
+        qtd_pendencias INTEGER NOT NULL,
+        maior_atraso INTEGER,
+        PRIMARY KEY (data, codigo)
+    );
+    CREATE INDEX IF NOT EXISTS idx_snapshot_pessoa_codigo ON snapshot_pessoa (codigo, data);
+
+    CREATE TABLE IF NOT EXISTS totais_diarios (
+        data TEXT PRIMARY KEY,
+        pessoas INTEGER NOT NULL,
+        pessoas_apenas_multa INTEGER NOT NULL,
+        pessoas_apenas_pendencia INTEGER NOT NULL,
+        pessoas_multa_e_pendencia INTEGER NOT NULL,
+        pessoas_sem_email INTEGER NOT NULL,
+        qtd_multas INTEGER NOT NULL,
+        qtd_pendencias INTEGER NOT NULL,
+        valor_total_multas REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS situacao_pessoa (
+        codigo TEXT PRIMARY KEY,
+        primeira_data TEXT NOT NULL,
+        inicio_sequencia TEXT NOT NULL,
+        ultima_data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_situacao_pessoa_ultima ON situacao_pessoa (ultima_data);
+'''
+
+
+def aggregate_by_person(df, hoje=None):
+    """
+    Calcula os agregados diários por pessoa a partir do DataFrame unificado.
+
+    Args:
+        df: DataFrame unificado
+        hoje: Data de referência para o cálculo dos atrasos
+
+    Returns:
+        DataFrame indexado pelo código da pessoa com os agregados do dia
+    """
+    df = df[df['Código da pessoa'].notna()]
+    relatorio = df['Relatório']
+    eh_multa = relatorio.eq('rel86')
+    valor = pd.to_numeric(df['Valor multa'], errors='coerce').fillna(0)
+
+    email = df['Email'].astype(object).where(df['Email'].notna(), '')
+    nome = df['Nome da pessoa'].astype(object).where(df['Nome da pessoa'].notna(), '')
+
+    linhas = pd.DataFrame({
+        'codigo': df['Código da pessoa'].map(str),
+        'nome': nome.map(str).str.strip(),
+        'email': email.map(str).str.strip(),
+        'multa': eh_multa.astype(int),
+        'pendencia': relatorio.eq('rel76').astype(int),
+        'valor': valor.where(eh_multa, 0.0),
+        'atraso': compute_overdue_days(df, hoje)
+    })
+
+    return linhas.groupby('codigo', sort=False).agg(
+        nome=('nome', 'first'),
+        email=('email', 'first'),
+        qtd_multas=('multa', 'sum'),
+        valor_multas=('valor', 'sum'),
+        qtd_pendencias=('pendencia', 'sum'),
+        maior_atraso=('atraso', 'max')
+    )
+
+
+class HistoryStore:
+    """Armazena snapshots diários por pessoa e mantém os totais de tendência."""
+
+    def __init__(self, path='historico.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def record_snapshot(self, df, data=None):
+        """
+        Registra o snapshot do dia e atualiza os agregados incrementais.
+
+        Registrar novamente o mesmo dia substitui o snapshot daquele dia.
+
+        Args:
+            df: DataFrame unificado
+            data: Data do snapshot (padrão: hoje)
+
+        Returns:
+            Dicionário com os totais registrados para o dia
+        """
+        data = pd.Timestamp(data or datetime.now()).normalize()
+        data_iso = data.strftime('%Y-%m-%d')
+
+        agregados = aggregate_by_person(df, hoje=data)
+        qtd_multas = agregados['qtd_multas']
+        qtd_pendencias = agregados['qtd_pendencias']
+
+        totais = {
+            'data': data_iso,
+            'pessoas': int(len(agregados)),
+            'pessoas_apenas_multa': int(((qtd_multas > 0) & (qtd_pendencias == 0)).sum()),
+            'pessoas_apenas_pendencia': int(((qtd_multas == 0) & (qtd_pendencias > 0)).sum()),
+            'pessoas_multa_e_pendencia': int(((qtd_multas > 0) & (qtd_pendencias > 0)).sum()),
+            'pessoas_sem_email': int(agregados['email'].eq('').sum()),
+            'qtd_multas': int(qtd_multas.sum()),
+            'qtd_pendencias': int(qtd_pendencias.sum()),
+            'valor_total_multas': float(agregados['valor_multas'].sum())
+        }
+
+        maior_atraso = agregados['maior_atraso'].astype(object).where(agregados['maior_atraso'].notna(), None)
+        linhas = list(zip(
+            [data_iso] * len(agregados),
+            agregados.index.tolist(),
+            agregados['nome'].tolist(),
+            agregados['email'].tolist(),
+            qtd_multas.astype(int).tolist(),
+            agregados['valor_multas'].astype(float).tolist(),
+            qtd_pendencias.astype(int).tolist(),
+            [None if valor is None else int(valor) for valor in maior_atraso.tolist()]
+        ))
+
+        with self.conn:
+            # Data do snapshot anterior, usada para saber se a situação de cada pessoa continua
+            anterior = self.conn.execute(
+                "SELECT MAX(data) FROM totais_diarios WHERE data < ?", (data_iso,)
+            ).fetchone()[0]
+
+            self.conn.execute("DELETE FROM snapshot_pessoa WHERE data = ?", (data_iso,))
+            self.conn.executemany(
+                "INSERT INTO snapshot_pessoa VALUES (?, ?, ?, ?, ?, ?, ?, ?)", linhas
+            )
+
+            colunas = ", ".join(totais)
+            marcadores = ", ".join("?" for _ in totais)
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO totais_diarios ({colunas}) VALUES ({marcadores})",
+                tuple(totais.values())
+            )
+
+            # Pessoas que já estavam no snapshot anterior (ou hoje) mantêm o início da sequência
+            self.conn.executemany(
+                '''
+                INSERT INTO situacao_pessoa (codigo, primeira_data, inicio_sequencia, ultima_data)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(codigo) DO UPDATE SET
+                    primeira_data = MIN(primeira_data, excluded.primeira_data),
+                    inicio_sequencia = CASE
+                        WHEN ultima_data >= COALESCE(?, excluded.ultima_data) THEN inicio_sequencia
+                        ELSE excluded.inicio_sequencia
+                    END,
+                    ultima_data = MAX(ultima_data, excluded.ultima_data)
+                ''',
+                [(codigo, data_iso, data_iso, data_iso, anterior) for codigo in agregados.index.tolist()]
+            )
+
+        return totais
+
+    def get_daily_totals(self, inicio=None, fim=None):
+        """
+        Retorna os totais diários no intervalo informado.
+
+        Args:
+            inicio: Data inicial (inclusive) ou None
+            fim: Data final (inclusive) ou None
+
+        Returns:
+            DataFrame com uma linha por dia registrado, em ordem cronológica
+        """
+        inicio = pd.Timestamp(inicio).strftime('%Y-%m-%d') if inicio is not None else '0000-00-00'
+        fim = pd.Timestamp(fim).strftime('%Y-%m-%d') if fim is not None else '9999-99-99'
+        cursor = self.conn.execute(
+            "SELECT * FROM totais_diarios WHERE data BETWEEN ? AND ? ORDER BY data",
+            (inicio, fim)
+        )
+        colunas = [descricao[0] for descricao in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=colunas)
+
+    def get_person_history(self, codigo, inicio=None, fim=None):
+        """
+        Retorna a evolução diária de uma pessoa.
+
+        Args:
+            codigo: Código da pessoa
+            inicio: Data inicial (inclusive) ou None
+            fim: Data final (inclusive) ou None
+
+        Returns:
+            DataFrame com os agregados da pessoa em cada dia registrado
+        """
+        inicio = pd.Timestamp(inicio).strftime('%Y-%m-%d') if inicio is not None else '0000-00-00'
+        fim = pd.Timestamp(fim).strftime('%Y-%m-%d') if fim is not None else '9999-99-99'
+        cursor = self.conn.execute(
+            "SELECT * FROM snapshot_pessoa WHERE codigo = ? AND data BETWEEN ? AND ? ORDER BY data",
+            (str(codigo), inicio, fim)
+        )
+        colunas = [descricao[0] for descricao in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=colunas)
+
+    def get_overdue_since(self, codigo):
+        """
+        Informa desde quando a pessoa aparece continuamente nos relatórios.
+
+        Args:
+            codigo: Código da pessoa
+
+        Returns:
+            Tupla (data_inicio, dias) ou None se a pessoa não está no snapshot
+            mais recente (a sequência terminou quando ela saiu dos relatórios)
+        """
+        linha = self.conn.execute(
+            """
+            SELECT inicio_sequencia, ultima_data FROM situacao_pessoa
+            WHERE codigo = ? AND ultima_data >= (SELECT MAX(data) FROM totais_diarios)
+            """,
+            (str(codigo),)
+        ).fetchone()
+        if not linha:
+            return None
+        inicio, ultima = (pd.Timestamp(valor) for valor in linha)
+        return inicio.date(), (ultima - inicio).days
+
+    def close(self):
+        """Fecha a conexão com o banco."""
+        self.conn.close()
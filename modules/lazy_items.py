@@ -0,0 +1,161 @@
+"""
+Listas de itens por usuário materializadas sob demanda.
+
+Os agrupamentos por usuário guardam, para cada pessoa, apenas as posições das
+suas linhas nos dados colunares. A lista de dicionários (com datas formatadas
+e datas calculadas das chaves) só é montada quando um preview, exportação ou
+envio acessa os itens daquela pessoa, e fica memorizada a partir daí.
+Quantidades (len) não exigem materialização.
+"""
+
+import hashlib
+import threading
+from collections.abc import Sequence
+
+import pandas as pd
+
+# Coluna com o hash de cada linha de origem (usada no resumo do conteúdo)
+COLUNA_RESUMO = 'Resumo da linha'
+
+
+class LazyItems(Sequence):
+    """Sequência somente leitura de itens montados a partir de linhas de um DataFrame."""
+
+    __slots__ = ('frame', 'posicoes', 'builder', 'partes', '_itens', '_resumo', '_lock')
+
+    def __init__(self, frame, posicoes, builder):
+        """
+        Args:
+            frame: DataFrame com as linhas (acessado por posição)
+            posicoes: Posições das linhas da pessoa, na ordem dos itens
+            builder: Função que recebe o DataFrame das linhas e retorna a lista de itens
+        """
+        self.frame = frame
+        self.posicoes = list(posicoes)
+        self.builder = builder
+        self.partes = None
+        self._itens = None
+        self._resumo = None
+        # Previews e envios podem materializar itens em threads de trabalho; cada
+        # sequência tem o seu lock, para que pessoas diferentes sejam montadas em paralelo
+        self._lock = threading.Lock()
+
+    @classmethod
+    def chain(cls, partes):
+        """
+        Concatena várias sequências sem materializá-las.
+
+        Args:
+            partes: Sequências (LazyItems ou listas) na ordem desejada
+
+        Returns:
+            Nova sequência (ou a própria parte, se houver apenas uma)
+        """
+        partes = list(partes)
+        if len(partes) == 1:
+            return partes[0]
+        encadeada = cls(None, [], None)
+        encadeada.partes = partes
+        return encadeada
+
+    def _materialize(self):
+        """Monta (uma única vez) a lista de itens."""
+        if self._itens is None:
+            with self._lock:
+                if self._itens is None:
+                    if self.partes is not None:
+                        itens = [item for parte in self.partes for item in parte]
+                    elif self.posicoes:
+                        itens = self.builder(self.frame.iloc[self.posicoes])
+                    else:
+                        itens = []
+                    self._itens = itens
+                    # Após a materialização as linhas de origem não são mais necessárias
+                    self.partes = None
+                    self.frame = None
+        return self._itens
+
+    def fingerprint(self):
+        """
+        Resumo (blake2b) do conteúdo, calculado uma única vez e sem materializar os itens.
+
+        Antes da materialização o resumo vem dos hashes das linhas de origem
+        (coluna COLUNA_RESUMO, calculada de uma vez para o DataFrame todo);
+        depois, dos próprios itens.
+
+        Returns:
+            Resumo em hexadecimal
+        """
+        if self._resumo is None:
+            resumo = hashlib.blake2b(digest_size=16)
+            if self._itens is not None:
+                resumo.update(repr(self._itens).encode('utf-8'))
+            elif self.partes is not None:
+                for parte in self.partes:
+                    resumo.update(item_fingerprint(parte).encode('ascii'))
+            elif self.posicoes:
+                resumo.update(self.builder.__qualname__.encode('utf-8'))
+                if COLUNA_RESUMO in self.frame.columns:
+                    hashes = self.frame[COLUNA_RESUMO].to_numpy()[self.posicoes]
+                else:
+                    hashes = pd.util.hash_pandas_object(self.frame.iloc[self.posicoes], index=False).to_numpy()
+                resumo.update(hashes.tobytes())
+            self._resumo = resumo.hexdigest()
+        return self._resumo
+
+    @property
+    def materialized(self):
+        """Indica se os itens já foram montados."""
+        return self._itens is not None
+
+    def __len__(self):
+        if self._itens is not None:
+            return len(self._itens)
+        if self.partes is not None:
+            return sum(len(parte) for parte in self.partes)
+        return len(self.posicoes)
+
+    def __getitem__(self, indice):
+        return self._materialize()[indice]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __eq__(self, outro):
+        if isinstance(outro, (LazyItems, list)):
+            return list(self) == list(outro)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+    def __getstate__(self):
+        # Entre processos trafegam apenas as posições (as linhas são religadas com bind_frame)
+        return {'frame': None, 'posicoes': self.posicoes, 'builder': self.builder,
+                'partes': self.partes, '_itens': self._itens, '_resumo': self._resumo}
+
+    def __setstate__(self, estado):
+        for atributo, valor in estado.items():
+            setattr(self, atributo, valor)
+        self._lock = threading.Lock()
+
+
+def item_fingerprint(itens):
+    """Resumo do conteúdo de uma lista de itens (LazyItems ou lista comum)."""
+    if isinstance(itens, LazyItems):
+        return itens.fingerprint()
+    return hashlib.blake2b(repr(list(itens)).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def bind_frame(resultados, frame):
+    """
+    Religa ao DataFrame as sequências recebidas de outro processo.
+
+    Args:
+        resultados: Dicionário {código: registro} retornado por uma partição
+        frame: DataFrame da partição (mesmas posições usadas no processo de origem)
+    """
+    for registro in resultados.values():
+        for valor in registro.values():
+            if isinstance(valor, LazyItems) and valor.frame is None and not valor.materialized:
+                valor.frame = frame
@@ -0,0 +1,296 @@
+"""
+Livro de lançamentos para atualizações pontuais durante o atendimento.
+
+O Ledger mantém os dados unificados e, para cada pessoa, os agregados
+(quantidade de multas e pendências, valor devido), a categoria e as entradas
+dos índices por categoria e por e-mail. Devoluções, pagamentos e correções de
+e-mail recalculam apenas a pessoa afetada, em O(itens da pessoa), e notificam
+os ouvintes registrados para que o painel e as listas de e-mail sejam
+atualizados sem reprocessar os relatórios.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from modules.email_validation import validate_emails, INVALIDO
+from modules.date_utils import to_datetime
+
+# Eventos enviados aos ouvintes
+EVENTO_DEVOLUCAO = 'devolucao'
+EVENTO_PAGAMENTO = 'pagamento'
+EVENTO_EMAIL = 'email'
+
+CATEGORIAS = ['apenas_multa', 'apenas_pendencia', 'multa_e_pendencia', 'sem_email']
+
+# Diferença abaixo da qual um valor é considerado quitado
+TOLERANCIA_VALOR = 0.005
+
+
+def _category(qtd_multas, qtd_pendencias):
+    """Categoria da pessoa conforme os itens em aberto (None se não há itens)."""
+    if qtd_multas and qtd_pendencias:
+        return 'multa_e_pendencia'
+    if qtd_multas:
+        return 'apenas_multa'
+    if qtd_pendencias:
+        return 'apenas_pendencia'
+    return None
+
+
+class Ledger:
+    """Dados unificados com agregados por pessoa mantidos incrementalmente."""
+
+    def __init__(self, df):
+        # Posição da linha == rótulo do índice (usado como identificador do item)
+        self.df = df.reset_index(drop=True).copy()
+        self.ativo = np.ones(len(self.df), dtype=bool)
+        self.atualizacoes = 0
+        self._listeners = []
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Calcula agregados, categorias e índices de todas as pessoas (uma única vez)."""
+        df = self.df
+        self._codigos = [None if pd.isna(codigo) else str(codigo) for codigo in df['Código da pessoa'].tolist()]
+        self._relatorios = df['Relatório'].tolist()
+        self._valores = pd.to_numeric(df['Valor multa'], errors='coerce').fillna(0.0).to_numpy(dtype=float, copy=True)
+
+        tabela = pd.DataFrame({
+            'codigo': self._codigos,
+            'nome': df['Nome da pessoa'].astype(object).where(df['Nome da pessoa'].notna(), '').map(str).str.strip(),
+            'email': df['Email'].astype(object).where(df['Email'].notna(), '').map(str).str.strip(),
+            'multa': df['Relatório'].eq('rel86').to_numpy(),
+            'pendencia': df['Relatório'].eq('rel76').to_numpy()
+        })
+        tabela['valor'] = np.where(tabela['multa'], self._valores, 0.0)
+        tabela = tabela[tabela['codigo'].notna()]
+
+        grupos = tabela.groupby('codigo', sort=False)
+        # Rótulos das linhas (== posições em self.df), não posições na tabela filtrada
+        self.linhas_por_codigo = {
+            codigo: tabela.index[posicoes].tolist() for codigo, posicoes in grupos.indices.items()
+        }
+        # Primeiro nome e primeiro e-mail não vazio de cada pessoa
+        self.nomes = grupos['nome'].first().to_dict()
+        emails = tabela[tabela['email'] != ''].groupby('codigo', sort=False)['email'].first()
+        self.emails = {codigo: emails.get(codigo, '') for codigo in self.linhas_por_codigo}
+        somas = grupos[['multa', 'pendencia', 'valor']].sum()
+
+        self.agregados = {}
+        self.categorias = {categoria: set() for categoria in CATEGORIAS}
+        self.codigos_por_email = {}
+        self.resumo = {
+            'pessoas': 0, 'apenas_multa': 0, 'apenas_pendencia': 0, 'multa_e_pendencia': 0,
+            'sem_email': 0, 'qtd_multas': 0, 'qtd_pendencias': 0, 'valor_multas': 0.0
+        }
+        for codigo, qtd_multas, qtd_pendencias, valor in zip(
+            somas.index, somas['multa'], somas['pendencia'], somas['valor']
+        ):
+            self._store(codigo, {
+                'qtd_multas': int(qtd_multas),
+                'qtd_pendencias': int(qtd_pendencias),
+                'valor_multas': float(valor),
+                'email': self.emails[codigo]
+            })
+
+    def _aggregate(self, codigo):
+        """Recalcula os agregados de uma pessoa a partir das suas linhas ativas."""
+        qtd_multas = qtd_pendencias = 0
+        valor = 0.0
+        for posicao in self.linhas_por_codigo.get(codigo, ()):
+            if not self.ativo[posicao]:
+                continue
+            if self._relatorios[posicao] == 'rel86':
+                qtd_multas += 1
+                valor += self._valores[posicao]
+            elif self._relatorios[posicao] == 'rel76':
+                qtd_pendencias += 1
+        return {
+            'qtd_multas': qtd_multas,
+            'qtd_pendencias': qtd_pendencias,
+            'valor_multas': float(valor),
+            'email': self.emails.get(codigo, '')
+        }
+
+    def _contribute(self, agregado, sinal):
+        """Soma (sinal=1) ou subtrai (sinal=-1) a contribuição de uma pessoa no resumo."""
+        if agregado is None or agregado['categoria'] is None:
+            return
+        self.resumo['pessoas'] += sinal
+        self.resumo[agregado['categoria']] += sinal
+        if not agregado['email']:
+            self.resumo['sem_email'] += sinal
+        self.resumo['qtd_multas'] += sinal * agregado['qtd_multas']
+        self.resumo['qtd_pendencias'] += sinal * agregado['qtd_pendencias']
+        self.resumo['valor_multas'] += sinal * agregado['valor_multas']
+
+    def _store(self, codigo, agregado):
+        """Substitui os agregados de uma pessoa, atualizando categorias, índices e resumo."""
+        agregado['categoria'] = _category(agregado['qtd_multas'], agregado['qtd_pendencias'])
+        anterior = self.agregados.get(codigo)
+        self._contribute(anterior, -1)
+
+        if anterior is not None:
+            for categoria in CATEGORIAS:
+                self.categorias[categoria].discard(codigo)
+            codigos = self.codigos_por_email.get(anterior['email'])
+            if codigos is not None:
+                codigos.discard(codigo)
+                if not codigos:
+                    del self.codigos_por_email[anterior['email']]
+
+        self.agregados[codigo] = agregado
+        if agregado['categoria'] is not None:
+            self.categorias[agregado['categoria']].add(codigo)
+            if agregado['email']:
+                self.codigos_por_email.setdefault(agregado['email'], set()).add(codigo)
+            else:
+                self.categorias['sem_email'].add(codigo)
+        self._contribute(agregado, 1)
+
+    def _refresh(self, codigo, evento):
+        """Recalcula uma pessoa e notifica os ouvintes."""
+        self._store(codigo, self._aggregate(codigo))
+        self.atualizacoes += 1
+        for listener in list(self._listeners):
+            listener(codigo, evento)
+
+    def _set_cell(self, posicao, coluna, valor):
+        """Altera uma célula do DataFrame (se a coluna existir)."""
+        if coluna in self.df.columns:
+            self.df.iat[posicao, self.df.columns.get_loc(coluna)] = valor
+
+    def add_listener(self, callback):
+        """Registra uma função callback(codigo, evento) chamada a cada atualização."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Remove um ouvinte registrado."""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def rows(self, codigo, apenas_ativas=True):
+        """
+        Retorna as linhas de uma pessoa.
+
+        Args:
+            codigo: Código da pessoa
+            apenas_ativas: Se True, omite itens já devolvidos ou pagos
+
+        Returns:
+            DataFrame com as linhas (o índice identifica cada item)
+        """
+        posicoes = self.linhas_por_codigo.get(str(codigo), [])
+        if apenas_ativas:
+            posicoes = [posicao for posicao in posicoes if self.ativo[posicao]]
+        return self.df.iloc[posicoes]
+
+    def amount_due(self, posicao):
+        """Retorna o valor ainda devido de um item (já descontados os pagamentos parciais)."""
+        return float(self._valores[posicao])
+
+    def active_data(self):
+        """Retorna o DataFrame apenas com os itens em aberto."""
+        return self.df[self.ativo]
+
+    def summary(self):
+        """Retorna uma cópia do resumo mantido incrementalmente."""
+        return dict(self.resumo, atualizacoes=self.atualizacoes)
+
+    def mark_returned(self, posicao, data=None):
+        """
+        Registra a devolução de um item.
+
+        Pendências (rel76) devolvidas deixam de estar em aberto; multas (rel86)
+        continuam em aberto até serem pagas.
+
+        Args:
+            posicao: Identificador do item (índice da linha em rows())
+            data: Data da devolução (padrão: hoje)
+        """
+        if not 0 <= posicao < len(self.df) or not self.ativo[posicao]:
+            raise ValueError("Item inexistente ou já baixado.")
+
+        data = pd.Timestamp(data or datetime.now()).normalize()
+        coluna = 'Data devolução efetivada'
+        if coluna in self.df.columns and not pd.api.types.is_datetime64_any_dtype(self.df[coluna].dtype):
+            data = data.strftime('%d/%m/%Y')
+        self._set_cell(posicao, coluna, data)
+
+        if self._relatorios[posicao] == 'rel76' or self._valores[posicao] <= TOLERANCIA_VALOR:
+            self.ativo[posicao] = False
+        self._refresh(self._codigos[posicao], EVENTO_DEVOLUCAO)
+
+    def register_payment(self, codigo, valor=None):
+        """
+        Registra um pagamento, quitando as multas da pessoa da mais antiga para a mais recente.
+
+        Args:
+            codigo: Código da pessoa
+            valor: Valor pago (None quita todas as multas)
+
+        Returns:
+            Valor efetivamente abatido
+        """
+        codigo = str(codigo)
+        if codigo not in self.linhas_por_codigo:
+            raise ValueError(f"Pessoa {codigo} não encontrada.")
+        if valor is not None and valor <= 0:
+            raise ValueError("O valor do pagamento deve ser positivo.")
+
+        restante = np.inf if valor is None else float(valor)
+        abatido = 0.0
+        for posicao in sorted(self.linhas_por_codigo[codigo], key=self._due_date_key):
+            if restante <= TOLERANCIA_VALOR:
+                break
+            if not self.ativo[posicao] or self._relatorios[posicao] != 'rel86':
+                continue
+
+            devido = self._valores[posicao]
+            pago = min(devido, restante)
+            self._valores[posicao] = round(devido - pago, 2)
+            self._set_cell(posicao, 'Valor multa', self._valores[posicao])
+            if self._valores[posicao] <= TOLERANCIA_VALOR:
+                self.ativo[posicao] = False
+            restante -= pago
+            abatido += pago
+
+        self._refresh(codigo, EVENTO_PAGAMENTO)
+        return round(abatido, 2)
+
+    def _due_date_key(self, posicao):
+        """Chave de ordenação pela devolução prevista (itens sem data por último, na ordem das linhas)."""
+        data = None
+        if 'Data devolução prevista' in self.df.columns:
+            data = to_datetime(self.df.at[posicao, 'Data devolução prevista'])
+        if data is None or pd.isna(data):
+            return (1, datetime.max, posicao)
+        return (0, pd.Timestamp(data).to_pydatetime(), posicao)
+
+    def update_email(self, codigo, email):
+        """
+        Corrige o e-mail de uma pessoa.
+
+        Args:
+            codigo: Código da pessoa
+            email: Novo endereço (normalizado antes de ser gravado)
+
+        Returns:
+            Endereço normalizado gravado
+        """
+        codigo = str(codigo)
+        if codigo not in self.linhas_por_codigo:
+            raise ValueError(f"Pessoa {codigo} não encontrada.")
+
+        validacao = validate_emails(pd.Series([email])).iloc[0]
+        if validacao['status'] == INVALIDO:
+            raise ValueError(f"{validacao['motivo']}: {email}")
+
+        self.emails[codigo] = validacao['email']
+        for posicao in self.linhas_por_codigo[codigo]:
+            self._set_cell(posicao, 'Email', validacao['email'])
+
+        self._refresh(codigo, EVENTO_EMAIL)
+        return validacao['email']
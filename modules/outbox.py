@@ -0,0 +1,384 @@
+"""
+Caixa de saída persistente dos envios em lote.
+
+Cada envio confirmado vira uma campanha num banco SQLite local, e todas as
+mensagens MIME renderizadas são gravadas nela (em lotes, numa transação por
+lote) com um estado: pendente, enviando, enviada ou falhou. As sessões de
+envio retiram as mensagens de forma transacional; se o programa fechar ou o
+computador hibernar no meio do lote, a campanha pode ser retomada exatamente
+de onde parou. Mensagens que estavam "enviando" no momento da interrupção
+voltam a pendentes (no máximo uma por sessão SMTP pode ser reenviada). Na
+retomada, o conteúdo das mensagens pendentes é substituído pelo gerado com
+os dados atuais (refresh), para não cobrar itens já devolvidos ou pagos.
+Mensagens com falha transitória voltam a pendentes com o horário da próxima
+tentativa; as que falharam de vez formam a lista de falhas, que pode ser
+consultada e reenviada.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from email import message_from_bytes
+
+ESTADO_PENDENTE = 'pendente'
+ESTADO_ENVIANDO = 'enviando'
+ESTADO_ENVIADA = 'enviada'
+ESTADO_FALHOU = 'falhou'
+
+CAMPANHA_ATIVA = 'ativa'
+CAMPANHA_CONCLUIDA = 'concluida'
+CAMPANHA_DESCARTADA = 'descartada'
+
+# Mensagens gravadas por transação ao enfileirar
+TAMANHO_LOTE = 500
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS campanha (
+        id INTEGER PRIMARY KEY,
+        criada_em TEXT NOT NULL,
+        remetente TEXT,
+        modo_teste INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL,
+        status TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS mensagem (
+        id INTEGER PRIMARY KEY,
+        campanha INTEGER NOT NULL REFERENCES campanha (id),
+        posicao INTEGER NOT NULL,
+        email TEXT NOT NULL,
+        conteudo BLOB,
+        estado TEXT NOT NULL,
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        erro TEXT,
+        atualizada_em TEXT,
+        proxima_tentativa REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_mensagem_estado ON mensagem (campanha, estado, posicao);
+'''
+
+
+def _agora():
+    """Data e hora atuais em ISO (registradas nas campanhas e mensagens)."""
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class Outbox:
+    """Campanhas e mensagens de envio persistidas em SQLite (segura entre threads)."""
+
+    def __init__(self, path='outbox.db'):
+        self.path = path
+        # A conexão é compartilhada pelas sessões de envio; o lock serializa o acesso
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        # Bancos criados antes do reagendamento não têm a coluna da próxima tentativa
+        colunas = [linha[1] for linha in self.conn.execute('PRAGMA table_info(mensagem)')]
+        if 'proxima_tentativa' not in colunas:
+            self.conn.execute('ALTER TABLE mensagem ADD COLUMN proxima_tentativa REAL NOT NULL DEFAULT 0')
+            self.conn.commit()
+        self._lock = threading.Lock()
+
+    def create_campaign(self, total, remetente='', modo_teste=False):
+        """
+        Cria uma campanha ativa.
+
+        Args:
+            total: Número de mensagens da campanha
+            remetente: E-mail do remetente (apenas para consulta)
+            modo_teste: Indica se as mensagens vão para o destinatário de teste
+
+        Returns:
+            Identificador da campanha
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO campanha (criada_em, remetente, modo_teste, total, status) VALUES (?, ?, ?, ?, ?)',
+                (_agora(), remetente, int(modo_teste), total, CAMPANHA_ATIVA)
+            )
+            return cursor.lastrowid
+
+    def enqueue(self, campanha, mensagens):
+        """
+        Grava mensagens na campanha, em transações de até TAMANHO_LOTE mensagens.
+
+        Args:
+            campanha: Identificador da campanha
+            mensagens: Iterável de (posição, e-mail, mensagem MIME serializada ou None,
+                erro ou None); mensagens sem conteúdo são gravadas como falhas
+
+        Returns:
+            Número de mensagens gravadas
+        """
+        quantidade = 0
+        lote = []
+        agora = _agora()
+        for posicao, email, conteudo, erro in mensagens:
+            estado = ESTADO_PENDENTE if conteudo is not None else ESTADO_FALHOU
+            lote.append((campanha, posicao, email, conteudo, estado, erro, agora))
+            if len(lote) >= TAMANHO_LOTE:
+                quantidade += self._insert(lote)
+                lote = []
+        if lote:
+            quantidade += self._insert(lote)
+        return quantidade
+
+    def _insert(self, lote):
+        """Grava um lote de mensagens numa única transação."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO mensagem (campanha, posicao, email, conteudo, estado, erro, atualizada_em) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                lote
+            )
+        return len(lote)
+
+    def claim(self, campanha):
+        """
+        Retira a próxima mensagem pendente (cuja tentativa já pode ser feita),
+        marcando-a como "enviando".
+
+        Returns:
+            Tupla (id, e-mail, tentativas feitas contando esta, mensagem MIME),
+            ou None se não houver mensagens prontas para envio
+        """
+        with self._lock, self.conn:
+            linha = self.conn.execute(
+                'SELECT id, email, conteudo, tentativas FROM mensagem '
+                'WHERE campanha = ? AND estado = ? AND proxima_tentativa <= ? ORDER BY posicao LIMIT 1',
+                (campanha, ESTADO_PENDENTE, time.time())
+            ).fetchone()
+            if linha is None:
+                return None
+            self.conn.execute(
+                'UPDATE mensagem SET estado = ?, tentativas = tentativas + 1, atualizada_em = ? WHERE id = ?',
+                (ESTADO_ENVIANDO, _agora(), linha[0])
+            )
+        return linha[0], linha[1], linha[3] + 1, message_from_bytes(linha[2])
+
+    def _set_state(self, mensagem_id, estado, erro=None):
+        """Atualiza o estado de uma mensagem."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE mensagem SET estado = ?, erro = ?, atualizada_em = ? WHERE id = ?',
+                (estado, erro, _agora(), mensagem_id)
+            )
+
+    def mark_sent(self, mensagem_id):
+        """Marca uma mensagem como enviada."""
+        self._set_state(mensagem_id, ESTADO_ENVIADA)
+
+    def mark_failed(self, mensagem_id, erro):
+        """Marca uma mensagem como falha, guardando o erro."""
+        self._set_state(mensagem_id, ESTADO_FALHOU, erro)
+
+    def reschedule(self, mensagem_id, erro, espera):
+        """
+        Devolve uma mensagem com falha transitória para pendente, com nova tentativa adiada.
+
+        Args:
+            mensagem_id: Identificador da mensagem
+            erro: Erro da tentativa que falhou
+            espera: Segundos até a próxima tentativa
+        """
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE mensagem SET estado = ?, erro = ?, proxima_tentativa = ?, atualizada_em = ? WHERE id = ?',
+                (ESTADO_PENDENTE, erro, time.time() + espera, _agora(), mensagem_id)
+            )
+
+    def next_retry(self, campanha):
+        """
+        Segundos até a próxima tentativa adiada da campanha.
+
+        Returns:
+            Espera em segundos (0 se já houver mensagens prontas), ou None se
+            não houver mensagens pendentes
+        """
+        with self._lock:
+            (proxima,) = self.conn.execute(
+                'SELECT MIN(proxima_tentativa) FROM mensagem WHERE campanha = ? AND estado = ?',
+                (campanha, ESTADO_PENDENTE)
+            ).fetchone()
+        return None if proxima is None else max(0.0, proxima - time.time())
+
+    def release(self, mensagem_id):
+        """
+        Devolve para pendente uma mensagem retirada e não enviada (cancelamento
+        ou falha ao abrir a sessão); a retirada não conta como tentativa.
+        """
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE mensagem SET estado = ?, tentativas = MAX(tentativas - 1, 0), atualizada_em = ? WHERE id = ?',
+                (ESTADO_PENDENTE, _agora(), mensagem_id)
+            )
+
+    def recover(self, campanha):
+        """
+        Devolve para pendente as mensagens interrompidas durante o envio.
+
+        Returns:
+            Número de mensagens devolvidas
+        """
+        with self._lock, self.conn:
+            return self.conn.execute(
+                'UPDATE mensagem SET estado = ?, atualizada_em = ? WHERE campanha = ? AND estado = ?',
+                (ESTADO_PENDENTE, _agora(), campanha, ESTADO_ENVIANDO)
+            ).rowcount
+
+    def pending(self, campanha):
+        """
+        Mensagens pendentes da campanha, na ordem de envio.
+
+        Returns:
+            Lista de tuplas (id, e-mail)
+        """
+        with self._lock:
+            return self.conn.execute(
+                'SELECT id, email FROM mensagem WHERE campanha = ? AND estado = ? ORDER BY posicao',
+                (campanha, ESTADO_PENDENTE)
+            ).fetchall()
+
+    def refresh(self, mensagens):
+        """
+        Substitui o conteúdo de mensagens pendentes (nova renderização na retomada).
+
+        Args:
+            mensagens: Iterável de (id, mensagem MIME serializada ou None, erro ou None);
+                mensagens sem conteúdo deixam de ser enviadas e ficam registradas
+                como falhas (fora da lista de falhas)
+        """
+        agora = _agora()
+        atualizar = []
+        remover = []
+        for mensagem_id, conteudo, erro in mensagens:
+            if conteudo is not None:
+                atualizar.append((conteudo, agora, mensagem_id, ESTADO_PENDENTE))
+            else:
+                remover.append((ESTADO_FALHOU, erro, agora, mensagem_id, ESTADO_PENDENTE))
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE mensagem SET conteudo = ?, atualizada_em = ? WHERE id = ? AND estado = ?', atualizar
+            )
+            self.conn.executemany(
+                'UPDATE mensagem SET estado = ?, erro = ?, conteudo = NULL, atualizada_em = ? '
+                'WHERE id = ? AND estado = ?',
+                remover
+            )
+
+    def counts(self, campanha):
+        """Quantidade de mensagens da campanha em cada estado."""
+        with self._lock:
+            linhas = self.conn.execute(
+                'SELECT estado, COUNT(*) FROM mensagem WHERE campanha = ? GROUP BY estado', (campanha,)
+            ).fetchall()
+        contagem = {ESTADO_PENDENTE: 0, ESTADO_ENVIANDO: 0, ESTADO_ENVIADA: 0, ESTADO_FALHOU: 0}
+        contagem.update(dict(linhas))
+        return contagem
+
+    def errors(self, campanha):
+        """Erros das mensagens que falharam, na ordem da campanha."""
+        with self._lock:
+            return [
+                erro for (erro,) in self.conn.execute(
+                    'SELECT erro FROM mensagem WHERE campanha = ? AND estado = ? ORDER BY posicao',
+                    (campanha, ESTADO_FALHOU)
+                )
+            ]
+
+    def dead_letters(self):
+        """
+        Lista de falhas: mensagens que falharam de vez e ainda podem ser reenviadas.
+
+        Returns:
+            Lista de dicionários (id, campanha, email, tentativas, erro, atualizada_em),
+            das falhas mais recentes para as mais antigas
+        """
+        with self._lock:
+            linhas = self.conn.execute(
+                'SELECT id, campanha, email, tentativas, erro, atualizada_em FROM mensagem '
+                'WHERE estado = ? AND conteudo IS NOT NULL ORDER BY atualizada_em DESC, id DESC',
+                (ESTADO_FALHOU,)
+            ).fetchall()
+        campos = ('id', 'campanha', 'email', 'tentativas', 'erro', 'atualizada_em')
+        return [dict(zip(campos, linha)) for linha in linhas]
+
+    def requeue(self, mensagem_ids):
+        """
+        Devolve mensagens da lista de falhas para envio, reativando as suas campanhas.
+
+        Args:
+            mensagem_ids: Identificadores das mensagens
+
+        Returns:
+            Número de mensagens devolvidas
+        """
+        quantidade = 0
+        with self._lock, self.conn:
+            for mensagem_id in mensagem_ids:
+                cursor = self.conn.execute(
+                    'UPDATE mensagem SET estado = ?, tentativas = 0, erro = NULL, proxima_tentativa = 0, '
+                    'atualizada_em = ? WHERE id = ? AND estado = ? AND conteudo IS NOT NULL',
+                    (ESTADO_PENDENTE, _agora(), mensagem_id, ESTADO_FALHOU)
+                )
+                if cursor.rowcount:
+                    quantidade += 1
+                    self.conn.execute(
+                        'UPDATE campanha SET status = ? WHERE id = (SELECT campanha FROM mensagem WHERE id = ?)',
+                        (CAMPANHA_ATIVA, mensagem_id)
+                    )
+        return quantidade
+
+    def discard(self, mensagem_ids):
+        """Remove mensagens da lista de falhas (o registro da falha é mantido)."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE mensagem SET conteudo = NULL WHERE id = ? AND estado = ?',
+                [(mensagem_id, ESTADO_FALHOU) for mensagem_id in mensagem_ids]
+            )
+
+    def unfinished_campaign(self):
+        """
+        Retorna a campanha ativa mais recente que ainda tem mensagens a enviar.
+
+        Returns:
+            Dicionário (id, criada_em, remetente, modo_teste, total, gravadas, restantes) ou None;
+            'gravadas' é menor que 'total' se a gravação do lote foi interrompida
+        """
+        with self._lock:
+            linha = self.conn.execute(
+                'SELECT c.id, c.criada_em, c.remetente, c.modo_teste, c.total, '
+                '(SELECT COUNT(*) FROM mensagem WHERE campanha = c.id), COUNT(m.id) FROM campanha c '
+                'JOIN mensagem m ON m.campanha = c.id AND m.estado IN (?, ?) '
+                'WHERE c.status = ? GROUP BY c.id ORDER BY c.id DESC LIMIT 1',
+                (ESTADO_PENDENTE, ESTADO_ENVIANDO, CAMPANHA_ATIVA)
+            ).fetchone()
+        if linha is None:
+            return None
+        campanha = dict(zip(('id', 'criada_em', 'remetente', 'modo_teste', 'total', 'gravadas', 'restantes'), linha))
+        campanha['modo_teste'] = bool(campanha['modo_teste'])
+        return campanha
+
+    def finish_campaign(self, campanha, status=CAMPANHA_CONCLUIDA):
+        """
+        Encerra uma campanha, descartando o conteúdo das mensagens já resolvidas.
+
+        As mensagens que falharam continuam na lista de falhas, a menos que a
+        campanha seja descartada.
+
+        Args:
+            campanha: Identificador da campanha
+            status: CAMPANHA_CONCLUIDA ou CAMPANHA_DESCARTADA
+        """
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE campanha SET status = ? WHERE id = ?', (status, campanha))
+            # O corpo das mensagens não é mais necessário; estados e erros ficam como registro
+            if status == CAMPANHA_DESCARTADA:
+                self.conn.execute('UPDATE mensagem SET conteudo = NULL WHERE campanha = ?', (campanha,))
+            else:
+                self.conn.execute(
+                    'UPDATE mensagem SET conteudo = NULL WHERE campanha = ? AND estado != ?',
+                    (campanha, ESTADO_FALHOU)
+                )
@@ -0,0 +1,132 @@
+"""
+Métricas do envio em lote (renderização → fila → SMTP).
+
+Cada etapa registra quantos itens processou e quanto tempo passou
+trabalhando; a fila entre as etapas registra a sua ocupação a cada item
+retirado. Uma fila quase sempre cheia indica que o envio é o gargalo
+(a renderização está à frente); quase sempre vazia, que a renderização é.
+A fila pode passar da capacidade de referência quando é um armazenamento
+sem limite (a caixa de saída do envio); a ocupação acima de 1 também indica
+que o envio é o gargalo.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Ocupação média da fila (fração da capacidade) que caracteriza cada gargalo
+LIMITE_FILA_CHEIA = 0.75
+LIMITE_FILA_VAZIA = 0.10
+
+
+class StageMetrics:
+    """Itens processados e tempo de trabalho de uma etapa (segura entre threads)."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.itens = 0
+        self.ocupado = 0.0  # Soma dos tempos de trabalho (s), somando as threads
+        self.inicio = None
+        self.fim = None
+        self._lock = threading.Lock()
+
+    def record(self, duracao):
+        """Registra um item processado em 'duracao' segundos."""
+        agora = time.monotonic()
+        with self._lock:
+            if self.inicio is None:
+                self.inicio = agora - duracao
+            self.itens += 1
+            self.ocupado += duracao
+            self.fim = agora
+
+    @contextmanager
+    def measure(self):
+        """Mede o processamento de um item (uso: with metricas.measure(): ...)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - inicio)
+
+    def throughput(self):
+        """Itens por segundo desde o primeiro item registrado."""
+        with self._lock:
+            if self.inicio is None:
+                return 0.0
+            decorrido = max(self.fim - self.inicio, 1e-6)
+            return self.itens / decorrido
+
+    def mean_time(self):
+        """Tempo médio de trabalho por item (s)."""
+        with self._lock:
+            return self.ocupado / self.itens if self.itens else 0.0
+
+
+class QueueMetrics:
+    """Ocupação da fila entre duas etapas, amostrada a cada item retirado."""
+
+    def __init__(self, capacidade):
+        self.capacidade = max(1, capacidade)
+        self.amostras = 0
+        self.soma = 0
+        self.maximo = 0
+        self.atual = 0
+        self._lock = threading.Lock()
+
+    def sample(self, profundidade):
+        """Registra a profundidade atual da fila."""
+        with self._lock:
+            self.amostras += 1
+            self.soma += profundidade
+            self.maximo = max(self.maximo, profundidade)
+            self.atual = profundidade
+
+    def mean_depth(self):
+        """Profundidade média da fila."""
+        with self._lock:
+            return self.soma / self.amostras if self.amostras else 0.0
+
+    def occupancy(self):
+        """Ocupação média como fração da capacidade (pode passar de 1)."""
+        return self.mean_depth() / self.capacidade
+
+
+def bottleneck(fila):
+    """
+    Indica a etapa que limita o lote pela ocupação média da fila.
+
+    Returns:
+        'envio', 'renderização' ou None se nenhuma etapa predominar
+    """
+    if not fila.amostras:
+        return None
+    ocupacao = fila.occupancy()
+    if ocupacao >= LIMITE_FILA_CHEIA:
+        return 'envio'
+    if ocupacao <= LIMITE_FILA_VAZIA:
+        return 'renderização'
+    return None
+
+
+def format_metrics(render, envio, fila):
+    """
+    Resume as métricas do lote em uma linha.
+
+    Args:
+        render: StageMetrics da renderização
+        envio: StageMetrics do envio
+        fila: QueueMetrics da fila entre as etapas
+
+    Returns:
+        Texto do resumo
+    """
+    texto = (
+        f"Renderização: {render.throughput():.1f}/s · "
+        f"Envio: {envio.throughput():.1f}/s · "
+        f"Fila: {fila.atual}/{fila.capacidade} (média {fila.mean_depth():.0f})"
+    )
+    gargalo = bottleneck(fila)
+    if gargalo:
+        texto += f" · Gargalo: {gargalo}"
+    return texto
@@ -0,0 +1,169 @@
+"""
+Registro dos placeholders aceitos nos templates de e-mail.
+
+Cada placeholder ({NOME}, {LIVROS_MULTA}, ...) é associado a uma função que
+calcula o seu valor a partir dos dados do usuário. Os templates são
+analisados ao salvar (placeholders desconhecidos ou indisponíveis para a
+categoria são recusados) e, na renderização, apenas os placeholders que o
+template realmente usa são calculados. Um novo campo é adicionado com
+register_placeholder, sem alterar a renderização.
+"""
+
+import re
+from collections import OrderedDict, namedtuple
+
+CATEGORIAS_MULTA = ('apenas_multa', 'multa_e_pendencia')
+CATEGORIAS_PENDENCIA = ('apenas_pendencia', 'multa_e_pendencia')
+TODAS_CATEGORIAS = ('apenas_multa', 'apenas_pendencia', 'multa_e_pendencia')
+
+# Linhas de templates antigos (placeholders por item) removidas após a lista
+MULTA_REMOCOES = (
+    "    - Data de Empréstimo: {DATA_EMPRESTIMO}",
+    "    - Data de Devolução Prevista: {DATA_PREVISTA}",
+    "    - Data de Devolução Efetiva: {DATA_EFETIVA}",
+    "    - Dias de Atraso: {DIAS_ATRASO}"
+)
+PENDENCIA_REMOCOES = (
+    "    - Data de Empréstimo: {DATA_EMPRESTIMO}",
+    "    - Data de Devolução Prevista: {DATA_PREVISTA}",
+    "    - Dias de Atraso: {DIAS_ATRASO}"
+)
+
+Placeholder = namedtuple('Placeholder', ['nome', 'descricao', 'resolver', 'categorias', 'remocoes', 'lista'])
+
+# Placeholders na ordem em que são substituídos
+PLACEHOLDERS = OrderedDict()
+
+_TAG = re.compile(r'\{[A-Z][A-Z0-9_]*\}')
+
+
+def register_placeholder(nome, descricao, resolver, categorias=TODAS_CATEGORIAS, remocoes=(), lista=False):
+    """
+    Registra um placeholder.
+
+    Args:
+        nome: Tag usada no template, com chaves (ex.: "{NOME}")
+        descricao: Texto exibido na ajuda da aba de templates
+        resolver: Função que recebe um ResolverContext e retorna o texto (ou ItemList)
+        categorias: Categorias de usuário em que o placeholder está disponível
+        remocoes: Trechos removidos do template logo após a substituição
+        lista: Indica se o valor é uma lista de itens (ItemList)
+    """
+    PLACEHOLDERS[nome] = Placeholder(nome, descricao, resolver, tuple(categorias), tuple(remocoes), lista)
+
+
+def placeholders_for(categoria):
+    """Retorna os placeholders disponíveis para a categoria, na ordem de substituição."""
+    return [placeholder for placeholder in PLACEHOLDERS.values() if categoria in placeholder.categorias]
+
+
+def find_placeholders(template):
+    """
+    Encontra as tags usadas em um template.
+
+    Returns:
+        Lista de tags distintas, na ordem em que aparecem
+    """
+    return list(OrderedDict.fromkeys(_TAG.findall(template)))
+
+
+def validate_template(template, categoria):
+    """
+    Confere se o template usa apenas placeholders disponíveis para a categoria.
+
+    Args:
+        template: Texto do template
+        categoria: Categoria de usuário do template
+
+    Returns:
+        Lista de mensagens de erro (vazia se o template for válido)
+    """
+    # Linhas antigas removidas automaticamente não contam como uso
+    for placeholder in placeholders_for(categoria):
+        for trecho in placeholder.remocoes:
+            template = template.replace(trecho, '')
+
+    erros = []
+    for tag in find_placeholders(template):
+        placeholder = PLACEHOLDERS.get(tag)
+        if placeholder is None:
+            erros.append(f"{tag}: placeholder desconhecido")
+        elif categoria not in placeholder.categorias:
+            erros.append(f"{tag}: não disponível neste template")
+    return erros
+
+
+class ResolverContext:
+    """Dados de um usuário durante a renderização, com as listas de itens montadas uma vez."""
+
+    def __init__(self, usuario, formatador):
+        """
+        Args:
+            usuario: Dicionário do usuário (nome, códigos, multas, pendências, ...)
+            formatador: Objeto que monta as listas de itens (multas_item_list e pendencias_item_list)
+        """
+        self.usuario = usuario
+        self.formatador = formatador
+        self._listas = {}
+
+    def multas(self):
+        """Lista de itens com multa (ItemList)."""
+        if 'multas' not in self._listas:
+            self._listas['multas'] = self.formatador.multas_item_list(self.usuario['multas'])
+        return self._listas['multas']
+
+    def pendencias(self):
+        """Lista de itens pendentes (ItemList)."""
+        if 'pendencias' not in self._listas:
+            self._listas['pendencias'] = self.formatador.pendencias_item_list(self.usuario['pendencias'])
+        return self._listas['pendencias']
+
+
+def _format_valor(valor):
+    """Formata um valor em reais no padrão 12,50."""
+    return f"{valor:.2f}".replace('.', ',')
+
+
+def _maior_atraso(contexto):
+    """Maior número de dias de atraso entre os itens exibidos no e-mail."""
+    # Dias de atraso já calculados nos itens (None nas pendências sem data prevista)
+    dias = [
+        item['dias_atraso']
+        for itens in (contexto.usuario['multas'], contexto.usuario['pendencias'])
+        for item in itens
+        if item['dias_atraso'] is not None
+    ]
+    return str(max(dias, default=0))
+
+
+register_placeholder(
+    "{NOME}", "Nome do usuário",
+    lambda contexto: contexto.usuario['nome'].upper()
+)
+register_placeholder(
+    "{VALOR_MULTA}", "Valor total das multas",
+    lambda contexto: _format_valor(contexto.usuario['valor_total_multas']),
+    categorias=CATEGORIAS_MULTA
+)
+register_placeholder(
+    "{MATRICULA}", "Matrícula(s) do usuário",
+    lambda contexto: ", ".join(str(codigo) for codigo in contexto.usuario.get('codigos', []))
+)
+register_placeholder(
+    "{MAIOR_ATRASO}", "Maior número de dias de atraso entre os itens",
+    _maior_atraso
+)
+register_placeholder(
+    "{QTD_ITENS}", "Quantidade de itens com multa ou pendentes",
+    lambda contexto: str(len(contexto.usuario['multas']) + len(contexto.usuario['pendencias']))
+)
+register_placeholder(
+    "{LIVROS_PENDENTES}", "Lista de itens pendentes",
+    ResolverContext.pendencias,
+    categorias=CATEGORIAS_PENDENCIA, remocoes=PENDENCIA_REMOCOES, lista=True
+)
+register_placeholder(
+    "{LIVROS_MULTA}", "Lista de itens com multa",
+    ResolverContext.multas,
+    categorias=CATEGORIAS_MULTA, remocoes=MULTA_REMOCOES, lista=True
+)
@@ -0,0 +1,132 @@
+"""
+Pré-renderização dos e-mails de um lote de envio.
+
+Quando um lote é confirmado, os e-mails de todos os destinatários são
+gerados por um pool de threads (a renderização compilada libera o GIL com
+frequência e intercala bem com a latência do SMTP). Os resultados são
+entregues, na ordem dos destinatários, numa fila limitada consumida pelo
+envio; a fila cheia segura a renderização, limitando a memória usada por
+lotes grandes. Erros de renderização são registrados assim que ocorrem.
+O tempo de renderização e a ocupação da fila são medidos (pipeline_metrics).
+"""
+
+import os
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.pipeline_metrics import StageMetrics, QueueMetrics
+
+# Quantidade máxima de e-mails renderizados aguardando envio
+CAPACIDADE_FILA = 256
+MAX_THREADS = 4
+
+RenderResult = namedtuple('RenderResult', ['indice', 'item', 'conteudo', 'erro'])
+
+_FIM = object()
+
+
+class PreRenderer:
+    """Renderiza um lote em segundo plano e entrega os resultados em ordem."""
+
+    def __init__(self, render, itens, max_workers=None, capacidade=CAPACIDADE_FILA):
+        """
+        Args:
+            render: Função que recebe um item e retorna o e-mail renderizado (None indica erro)
+            itens: Itens a renderizar, na ordem de envio
+            max_workers: Número de threads (padrão: até MAX_THREADS)
+            capacidade: Tamanho máximo da fila de resultados
+        """
+        self.render = render
+        self.itens = list(itens)
+        self.capacidade = max(1, capacidade)
+        self.fila = queue.Queue(maxsize=self.capacidade)
+        self.erros = []  # RenderResult dos itens que falharam
+        self.metricas = StageMetrics('renderização')
+        self.metricas_fila = QueueMetrics(self.capacidade)
+        self._lock = threading.Lock()
+        self._cancelado = threading.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(MAX_THREADS, os.cpu_count() or 1),
+            thread_name_prefix='prerender'
+        )
+        self._thread = threading.Thread(target=self._feed, name='prerender-fila', daemon=True)
+
+    def start(self):
+        """Inicia a renderização em segundo plano."""
+        self._thread.start()
+        return self
+
+    def _render_one(self, item):
+        """Renderiza um item, convertendo exceções em mensagem de erro."""
+        try:
+            with self.metricas.measure():
+                conteudo = self.render(item)
+        except Exception as e:
+            return None, str(e)
+        if not conteudo:
+            return None, "template não configurado para a categoria do usuário"
+        return conteudo, None
+
+    def _feed(self):
+        """Submete os itens ao pool e entrega os resultados em ordem na fila."""
+        pendentes = deque()
+        try:
+            for indice, item in enumerate(self.itens):
+                if self._cancelado.is_set():
+                    return
+                pendentes.append((indice, item, self._executor.submit(self._render_one, item)))
+                # No máximo 'capacidade' itens em andamento além dos que estão na fila
+                if len(pendentes) >= self.capacidade:
+                    self._deliver(*pendentes.popleft())
+
+            while pendentes and not self._cancelado.is_set():
+                self._deliver(*pendentes.popleft())
+        finally:
+            self._put(_FIM)
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _deliver(self, indice, item, futuro):
+        """Registra o resultado de um item e o coloca na fila."""
+        conteudo, erro = futuro.result()
+        resultado = RenderResult(indice, item, conteudo, erro)
+        if erro is not None:
+            with self._lock:
+                self.erros.append(resultado)
+        self._put(resultado)
+
+    def _put(self, valor):
+        """Coloca um valor na fila, desistindo se o lote for cancelado."""
+        while True:
+            try:
+                self.fila.put(valor, timeout=0.1)
+                return
+            except queue.Full:
+                if self._cancelado.is_set():
+                    return
+
+    def get(self, timeout=None):
+        """
+        Retorna o próximo resultado, na ordem dos itens.
+
+        Returns:
+            RenderResult, ou None quando todos os itens foram entregues
+        """
+        valor = self.fila.get(timeout=timeout)
+        self.metricas_fila.sample(self.fila.qsize())
+        if valor is _FIM:
+            # Manter o marcador para chamadas seguintes
+            self.fila.put(_FIM)
+            return None
+        return valor
+
+    def cancel(self):
+        """Interrompe a renderização e descarta os resultados pendentes."""
+        self._cancelado.set()
+        while True:
+            try:
+                self.fila.get_nowait()
+            except queue.Empty:
+                break
+        self._executor.shutdown(wait=False, cancel_futures=True)
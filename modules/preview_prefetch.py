@@ -0,0 +1,120 @@
+"""
+Pré-carregamento dos previews vizinhos na aba de e-mails.
+
+Depois de exibir o usuário i, os e-mails dos usuários i±1..k são
+renderizados por uma thread de trabalho. Quando o HTML fica pronto, o
+documento (QTextDocument) correspondente é montado e diagramado no thread
+da interface, fora do clique; ao navegar, o preview apenas troca o documento
+exibido, sem precisar converter o HTML.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QTextDocument
+
+# Quantidade de vizinhos pré-carregados em cada direção
+ALCANCE_PADRAO = 3
+# Quantidade máxima de documentos prontos guardados
+CAPACIDADE_DOCUMENTOS = 16
+
+
+class PreviewPrefetcher(QObject):
+    """Renderiza e diagrama em segundo plano os previews próximos ao atual."""
+
+    # Emitido pela thread de trabalho (entregue no thread da interface)
+    html_ready = pyqtSignal(int, str)  # geração, HTML
+
+    def __init__(self, render, editor, alcance=ALCANCE_PADRAO, capacidade=CAPACIDADE_DOCUMENTOS, parent=None):
+        """
+        Args:
+            render: Função que recebe um usuário e retorna o HTML do e-mail
+            editor: QTextEdit onde os previews são exibidos
+            alcance: Número de vizinhos pré-carregados em cada direção
+            capacidade: Número máximo de documentos prontos guardados
+        """
+        super().__init__(parent)
+        self.render = render
+        self.editor = editor
+        self.alcance = alcance
+        self.capacidade = capacidade
+        self.documentos = OrderedDict()  # HTML -> QTextDocument diagramado
+        self.documento_exibido = None
+        self.geracao = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+        self.html_ready.connect(self._build_document)
+
+    def prefetch(self, usuarios, indice):
+        """
+        Agenda a renderização dos vizinhos do usuário exibido.
+
+        Args:
+            usuarios: Lista de usuários navegável
+            indice: Índice do usuário exibido
+        """
+        # Pedidos de uma navegação anterior deixam de ser úteis
+        self.geracao += 1
+        geracao = self.geracao
+        for distancia in range(1, self.alcance + 1):
+            for vizinho in (indice + distancia, indice - distancia):
+                if 0 <= vizinho < len(usuarios):
+                    self._executor.submit(self._render, geracao, usuarios[vizinho])
+
+    def _render(self, geracao, usuario):
+        """Renderiza um vizinho na thread de trabalho."""
+        if geracao != self.geracao:
+            return
+        try:
+            html = self.render(usuario)
+        except Exception as e:
+            print(f"Erro ao pré-carregar preview: {e}")
+            return
+        if html:
+            self.html_ready.emit(geracao, html)
+
+    def _build_document(self, geracao, html):
+        """Monta e diagrama o documento de um HTML pronto (no thread da interface)."""
+        if geracao != self.geracao or html in self.documentos:
+            return
+
+        documento = QTextDocument(self)
+        documento.setDefaultFont(self.editor.font())
+        documento.setHtml(html)
+        documento.setTextWidth(self.editor.viewport().width())
+        # Forçar a diagramação agora, fora do clique de navegação
+        documento.size()
+
+        self.documentos[html] = documento
+        while len(self.documentos) > self.capacidade:
+            _, antigo = self.documentos.popitem(last=False)
+            antigo.deleteLater()
+
+    def show_html(self, html):
+        """
+        Exibe um HTML no editor, usando o documento pré-carregado se existir.
+
+        Args:
+            html: HTML do e-mail
+        """
+        documento = self.documentos.pop(html, None)
+        if documento is None:
+            documento = QTextDocument(self)
+            documento.setDefaultFont(self.editor.font())
+            documento.setHtml(html)
+        self._set_document(documento)
+
+    def _set_document(self, documento):
+        """Troca o documento exibido, liberando o anterior."""
+        anterior = self.documento_exibido
+        self.editor.setDocument(documento)
+        self.documento_exibido = documento
+        if anterior is not None and anterior is not documento:
+            anterior.deleteLater()
+
+    def clear(self):
+        """Descarta os documentos pré-carregados e os pedidos pendentes."""
+        self.geracao += 1
+        for documento in self.documentos.values():
+            documento.deleteLater()
+        self.documentos.clear()
@@ -0,0 +1,190 @@
+"""
+Limite adaptativo da taxa de envio, por domínio do destinatário.
+
+Cada grupo de domínios (ifc.edu.br, gmail.com e os demais) tem um balde de
+fichas próprio: cada envio consome uma ficha e as fichas são repostas à taxa
+atual do grupo. Quando o servidor responde com um código de limitação
+(421, 450, 451, 4.7.x), a taxa do grupo é reduzida e o grupo faz uma pausa;
+depois de uma sequência de envios bem-sucedidos, a taxa volta a subir aos
+poucos, até TAXA_MAXIMA. Assim o lote se mantém perto da maior taxa que o
+provedor aceita sem bloquear a conta.
+"""
+
+import re
+import smtplib
+import threading
+import time
+
+# Taxas em e-mails por segundo, por grupo de domínios
+TAXA_INICIAL = 2.0
+TAXA_MINIMA = 0.1
+TAXA_MAXIMA = 10.0
+# Envios acumulados de uma vez quando o grupo fica ocioso
+RAJADA = 3
+# Reação à limitação: fator aplicado à taxa e pausa do grupo (s)
+FATOR_RECUO = 0.5
+PAUSA_RECUO = 5.0
+# Sondagem: a taxa sobe por este fator após a sequência de sucessos
+FATOR_SUBIDA = 1.25
+SUCESSOS_PARA_SUBIR = 20
+
+# Domínios com balde próprio (subdomínios incluídos); os demais dividem um balde
+DOMINIOS_SEPARADOS = ('ifc.edu.br', 'gmail.com')
+GRUPO_OUTROS = 'outros'
+
+CODIGOS_LIMITACAO = (421, 450, 451)
+_CODIGO_ESTENDIDO_LIMITACAO = re.compile(r'\b4\.7\.\d{1,3}\b')
+
+
+def domain_group(destinatario):
+    """
+    Grupo de domínios do destinatário (chave do balde).
+
+    Args:
+        destinatario: Endereço de e-mail
+
+    Returns:
+        Um dos DOMINIOS_SEPARADOS ou GRUPO_OUTROS
+    """
+    dominio = str(destinatario or '').rsplit('@', 1)[-1].strip().lower()
+    for separado in DOMINIOS_SEPARADOS:
+        if dominio == separado or dominio.endswith('.' + separado):
+            return separado
+    return GRUPO_OUTROS
+
+
+def _throttling_reply(codigo, texto):
+    """Indica se uma resposta SMTP (código e texto) é de limitação de taxa."""
+    if isinstance(texto, bytes):
+        texto = texto.decode('utf-8', errors='replace')
+    return codigo in CODIGOS_LIMITACAO or bool(_CODIGO_ESTENDIDO_LIMITACAO.search(texto or ''))
+
+
+def is_throttling(erro):
+    """
+    Indica se um erro de envio é uma resposta de limitação do servidor.
+
+    Args:
+        erro: Exceção levantada pelo smtplib (ou None)
+
+    Returns:
+        True para 421/450/451 e códigos estendidos 4.7.x
+    """
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return any(_throttling_reply(codigo, texto) for codigo, texto in erro.recipients.values())
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return _throttling_reply(erro.smtp_code, erro.smtp_error)
+    if isinstance(erro, smtplib.SMTPServerDisconnected):
+        return _throttling_reply(None, str(erro))
+    return False
+
+
+class TokenBucket:
+    """Balde de fichas com taxa ajustável (seguro entre threads)."""
+
+    def __init__(self, taxa=TAXA_INICIAL, rajada=RAJADA):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.fichas = 1.0
+        self.sucessos = 0
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, agora):
+        """Repõe as fichas acumuladas desde a última atualização."""
+        self.fichas = min(self.rajada, self.fichas + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def reserve(self):
+        """
+        Reserva uma ficha.
+
+        Returns:
+            Tempo (s) a aguardar antes de usar a ficha reservada
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.fichas -= 1
+            return 0.0 if self.fichas >= 0 else -self.fichas / self.taxa
+
+    def throttled(self):
+        """Reduz a taxa e pausa o balde após uma resposta de limitação."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.taxa = max(TAXA_MINIMA, self.taxa * FATOR_RECUO)
+            self.fichas = min(self.fichas, 0.0) - PAUSA_RECUO * self.taxa
+            self.sucessos = 0
+
+    def succeeded(self):
+        """Registra um envio aceito; após a sequência de sucessos, a taxa sobe."""
+        with self._lock:
+            self.sucessos += 1
+            if self.sucessos >= SUCESSOS_PARA_SUBIR:
+                self.taxa = min(TAXA_MAXIMA, self.taxa * FATOR_SUBIDA)
+                self.sucessos = 0
+
+
+class DomainRateLimiter:
+    """Baldes de fichas por grupo de domínios, compartilhados pelas sessões de envio."""
+
+    def __init__(self, taxa_inicial=TAXA_INICIAL):
+        self.taxa_inicial = min(TAXA_MAXIMA, max(TAXA_MINIMA, taxa_inicial))
+        self.baldes = {}
+        self.limitacoes = 0  # Respostas de limitação recebidas
+        self._lock = threading.Lock()
+
+    def bucket(self, destinatario):
+        """Retorna o balde do grupo de domínios do destinatário."""
+        grupo = domain_group(destinatario)
+        with self._lock:
+            balde = self.baldes.get(grupo)
+            if balde is None:
+                balde = self.baldes[grupo] = TokenBucket(self.taxa_inicial)
+            return balde
+
+    def acquire(self, destinatario, cancelado=None):
+        """
+        Aguarda a vez de enviar para o destinatário.
+
+        Args:
+            destinatario: Endereço de e-mail
+            cancelado: threading.Event que interrompe a espera
+
+        Returns:
+            False se a espera foi interrompida pelo cancelamento
+        """
+        espera = self.bucket(destinatario).reserve()
+        if espera <= 0:
+            return True
+        if cancelado is None:
+            time.sleep(espera)
+            return True
+        return not cancelado.wait(espera)
+
+    def report(self, destinatario, erro=None):
+        """
+        Ajusta a taxa do grupo pelo resultado de um envio.
+
+        Args:
+            destinatario: Endereço de e-mail
+            erro: Exceção do envio (None se foi aceito)
+
+        Returns:
+            True se o erro foi uma resposta de limitação
+        """
+        balde = self.bucket(destinatario)
+        if erro is None:
+            balde.succeeded()
+            return False
+        if is_throttling(erro):
+            with self._lock:
+                self.limitacoes += 1
+            balde.throttled()
+            return True
+        return False
+
+    def describe(self):
+        """Taxas atuais por grupo de domínios, em uma linha."""
+        with self._lock:
+            baldes = sorted(self.baldes.items())
+        return " · ".join(f"{grupo}: {balde.taxa:.1f}/s" for grupo, balde in baldes)
@@ -0,0 +1,134 @@
+"""
+Política de novas tentativas dos envios que falharam.
+
+Cada falha de envio é classificada pelo código de resposta SMTP ou pelo tipo
+da exceção: respostas 4xx, quedas de conexão e timeouts são transitórias;
+respostas 5xx e erros na própria mensagem são permanentes. A recusa
+definitiva do STARTTLS ou do login (resposta 5xx, senha errada) é fatal: não
+depende da mensagem, e insistir com cada mensagem do lote repetiria o login
+recusado centenas de vezes (o que pode bloquear a conta). As demais falhas
+ao abrir a sessão (timeout, rede, 421, 454) são transitórias, mesmo com
+código 5xx na saudação: a sessão é reaberta depois de uma espera, sem
+contar como tentativa da mensagem. Uma mensagem com
+falha transitória é reagendada com espera exponencial (com variação
+aleatória, para que as mensagens adiadas não voltem todas ao mesmo tempo)
+enquanto as demais seguem sendo enviadas; as falhas permanentes e as que
+esgotam TENTATIVAS_MAXIMAS vão para a lista de falhas da caixa de saída,
+de onde podem ser reenviadas pela interface.
+"""
+
+import random
+import smtplib
+
+TRANSITORIA = 'transitória'
+PERMANENTE = 'permanente'
+FATAL = 'fatal'
+
+# Tentativas de envio de uma mensagem, contando a primeira
+TENTATIVAS_MAXIMAS = 5
+# Espera (s) antes da segunda tentativa; dobra a cada nova falha, até ESPERA_MAXIMA
+ESPERA_INICIAL = 10.0
+ESPERA_MAXIMA = 600.0
+FATOR_ESPERA = 2.0
+# Fração da espera sorteada (a espera efetiva fica entre (1 - VARIACAO) e 1 vez a calculada)
+VARIACAO = 0.5
+
+
+def _reply_class(codigo):
+    """Classificação de um código de resposta SMTP (4xx transitório, 5xx permanente)."""
+    if codigo is not None and 400 <= codigo < 500:
+        return TRANSITORIA
+    if codigo is not None and 500 <= codigo < 600:
+        return PERMANENTE
+    return None
+
+
+def _session_refused(erro):
+    """Indica se o STARTTLS ou o login foi recusado em definitivo (5xx ou recurso não oferecido)."""
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return _reply_class(erro.smtp_code) == PERMANENTE
+    return isinstance(erro, smtplib.SMTPNotSupportedError)
+
+
+def classify_error(erro, na_conexao=False, na_autenticacao=False):
+    """
+    Classifica uma falha de envio.
+
+    Args:
+        erro: Exceção levantada no envio (smtplib, socket, ...)
+        na_conexao: Indica se a falha ocorreu ao abrir a sessão SMTP
+        na_autenticacao: Indica se a falha ocorreu no STARTTLS ou no login
+
+    Returns:
+        TRANSITORIA, PERMANENTE ou FATAL (o lote deve ser interrompido)
+    """
+    if (na_autenticacao or isinstance(erro, smtplib.SMTPAuthenticationError)) and _session_refused(erro):
+        return FATAL
+    if na_conexao:
+        return TRANSITORIA
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        # Transitória só se todos os destinatários foram recusados temporariamente
+        classes = {_reply_class(codigo) for codigo, _ in erro.recipients.values()}
+        return TRANSITORIA if classes == {TRANSITORIA} else PERMANENTE
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return _reply_class(erro.smtp_code) or TRANSITORIA
+    if isinstance(erro, (smtplib.SMTPServerDisconnected, TimeoutError, ConnectionError)):
+        return TRANSITORIA
+    if isinstance(erro, smtplib.SMTPNotSupportedError):
+        return PERMANENTE
+    if isinstance(erro, (smtplib.SMTPException, OSError)):
+        # Falhas de protocolo ou de rede sem código de resposta
+        return TRANSITORIA
+    # Erros na própria mensagem (codificação, endereço malformado, ...)
+    return PERMANENTE
+
+
+class RetryPolicy:
+    """Decide se uma mensagem que falhou é reenviada e quando."""
+
+    def __init__(self, tentativas_maximas=TENTATIVAS_MAXIMAS, espera_inicial=ESPERA_INICIAL,
+                 espera_maxima=ESPERA_MAXIMA, sorteio=random.random):
+        """
+        Args:
+            tentativas_maximas: Tentativas de envio de uma mensagem, contando a primeira
+            espera_inicial: Espera (s) antes da segunda tentativa
+            espera_maxima: Limite da espera (s) entre tentativas
+            sorteio: Função que retorna um número entre 0 e 1 (variação da espera)
+        """
+        self.tentativas_maximas = tentativas_maximas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.sorteio = sorteio
+
+    def delay(self, tentativas):
+        """
+        Espera antes da próxima tentativa.
+
+        Args:
+            tentativas: Tentativas já feitas (1 após a primeira falha)
+
+        Returns:
+            Espera em segundos, com variação aleatória
+        """
+        espera = min(self.espera_maxima, self.espera_inicial * FATOR_ESPERA ** max(0, tentativas - 1))
+        return espera * (1 - VARIACAO * self.sorteio())
+
+    def next_attempt(self, erro, tentativas, na_conexao=False, na_autenticacao=False):
+        """
+        Decide o destino de uma mensagem que falhou.
+
+        Args:
+            erro: Exceção do envio
+            tentativas: Tentativas já feitas, incluindo a que falhou
+            na_conexao: Indica se a falha ocorreu ao abrir a sessão SMTP
+            na_autenticacao: Indica se a falha ocorreu no STARTTLS ou no login
+
+        Returns:
+            Tupla (classificação, espera): espera em segundos até a nova
+            tentativa, ou None se a mensagem não deve ser reagendada (lista de
+            falhas ou, para FATAL, interrupção do lote)
+        """
+        classificacao = classify_error(erro, na_conexao, na_autenticacao)
+        if classificacao in (PERMANENTE, FATAL) or tentativas >= self.tentativas_maximas:
+            return classificacao, None
+        return classificacao, self.delay(tentativas)
@@ -0,0 +1,314 @@
+"""
+Envio dos e-mails de um lote fora do thread da interface.
+
+As mensagens MIME montadas pelo PreRenderer são gravadas na caixa de saída
+persistente (Outbox) à medida que ficam prontas, em lotes, e as sessões SMTP
+retiram as mensagens de lá: cada envio confirmado é registrado no banco, de
+modo que um lote interrompido (programa fechado, queda de energia,
+cancelamento) pode ser retomado de onde parou, sem renderizar de novo.
+O envio usa algumas sessões SMTP simultâneas (uma thread por sessão, todas
+retirando mensagens da mesma campanha); enquanto uma sessão aguarda a
+confirmação do servidor, as outras continuam enviando. O número de sessões é
+limitado por MAX_CONEXOES para respeitar os limites do provedor, e o ritmo
+dos envios é controlado por um DomainRateLimiter compartilhado (taxa
+adaptativa por domínio do destinatário). Falhas transitórias são reagendadas
+pela RetryPolicy (espera exponencial com variação aleatória) sem segurar o
+resto do lote: as sessões seguem com as próximas mensagens e retomam as
+adiadas quando chega a hora; as demais falhas vão para a lista de falhas da
+caixa de saída. Quando a sessão não abre por uma falha transitória (rede,
+timeout), a mensagem volta a pendente e a sessão é reaberta após uma
+espera crescente; respostas de limitação (421, 4.7.x) ao abrir a sessão
+seguem o mesmo caminho das recebidas durante o envio (o domínio é
+desacelerado e a mensagem é reagendada); a recusa do login ou do STARTTLS,
+ou falhas seguidas demais ao abrir a sessão, interrompem o lote inteiro,
+com as mensagens ainda pendentes, para que a campanha seja retomada depois
+de corrigida a configuração.
+Progresso, erros de geração e o resumo final chegam à interface por sinais
+Qt (entregues no thread da interface), de modo que a janela continua
+responsiva, inclusive para navegar pelos previews, enquanto o lote é
+enviado.
+"""
+
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from modules.email_sender import SmtpSession
+from modules.outbox import TAMANHO_LOTE, ESTADO_PENDENTE, ESTADO_ENVIADA, ESTADO_FALHOU
+from modules.pipeline_metrics import StageMetrics, QueueMetrics
+from modules.prerender import CAPACIDADE_FILA
+from modules.rate_limiter import DomainRateLimiter, TAXA_INICIAL, is_throttling
+from modules.retry_policy import RetryPolicy, FATAL
+
+# Sessões SMTP simultâneas (padrão e limite; o Gmail recusa muitas conexões por conta)
+CONEXOES_PADRAO = 2
+MAX_CONEXOES = 5
+# Espera máxima (s) de uma sessão sem mensagens pendentes enquanto o lote é gravado
+ESPERA_GRAVACAO = 0.5
+
+
+class SendWorker(QObject):
+    """Envia uma campanha da caixa de saída em segundo plano, por uma ou mais sessões SMTP."""
+
+    # Sinais emitidos pela thread de trabalho
+    progress = pyqtSignal(int, int)  # e-mails processados, total
+    render_failed = pyqtSignal(list)  # erros de geração das mensagens de um lote gravado
+    finished = pyqtSignal(int, list)  # e-mails enviados, erros
+
+    def __init__(self, outbox, campanha, total, remetente, senha, prerender=None,
+                 taxa=TAXA_INICIAL, conexoes=CONEXOES_PADRAO, parent=None):
+        """
+        Args:
+            outbox: Outbox onde a campanha está (ou será) gravada
+            campanha: Identificador da campanha
+            total: Número de e-mails da campanha
+            remetente: E-mail do remetente
+            senha: Senha de app do remetente
+            prerender: PreRenderer do lote, com as mensagens serializadas a gravar
+                (None ao retomar uma campanha já gravada)
+            taxa: Taxa inicial de envio por domínio (e-mails por segundo)
+            conexoes: Número de sessões SMTP simultâneas (limitado a MAX_CONEXOES)
+        """
+        super().__init__(parent)
+        self.outbox = outbox
+        self.campanha = campanha
+        self.prerender = prerender
+        self.total = total
+        self.remetente = remetente
+        self.senha = senha
+        self.limitador = DomainRateLimiter(taxa)
+        self.politica = RetryPolicy()
+        self.reagendamentos = 0  # Novas tentativas agendadas após falhas transitórias
+        self.erro_fatal = None  # Falha que interrompeu o lote (login recusado, servidor inacessível)
+        # Não abrir mais sessões do que mensagens
+        self.conexoes = max(1, min(conexoes, MAX_CONEXOES, total or 1))
+        # Uma campanha retomada continua a contagem do ponto em que parou
+        contagem = outbox.counts(campanha)
+        self.enviados = contagem[ESTADO_ENVIADA]
+        self.erros = outbox.errors(campanha)
+        self.processados = contagem[ESTADO_ENVIADA] + contagem[ESTADO_FALHOU]
+        self.metricas = StageMetrics('envio')
+        # Mensagens gravadas e ainda não retiradas (a fila entre a renderização e o envio)
+        self.pendentes = contagem[ESTADO_PENDENTE]
+        self.metricas_fila = QueueMetrics(prerender.capacidade if prerender is not None else CAPACIDADE_FILA)
+        self._gravando = prerender is not None
+        # Sinaliza mensagens novas (gravação ou reagendamento) às sessões ociosas
+        self._disponivel = threading.Condition()
+        self._lock = threading.Lock()
+        self._cancelado = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='envio', daemon=True)
+
+    def start(self):
+        """Inicia o envio em segundo plano."""
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Interrompe o envio depois da mensagem em andamento (a campanha pode ser retomada)."""
+        self._cancelado.set()
+        with self._disponivel:
+            self._disponivel.notify_all()
+
+    @property
+    def cancelled(self):
+        """Indica se o envio foi interrompido."""
+        return self._cancelado.is_set()
+
+    def _run(self):
+        """Grava o lote na caixa de saída, distribui o envio entre as sessões e emite o resumo."""
+        threads = [
+            threading.Thread(target=self._send_loop, name=f'envio-{indice + 1}', daemon=True)
+            for indice in range(self.conexoes)
+        ]
+        if self._gravando:
+            threads.append(threading.Thread(target=self._enqueue_loop, name='envio-gravacao', daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.finished.emit(self.enviados, list(self.erros))
+
+    def _enqueue_loop(self):
+        """
+        Grava na caixa de saída as mensagens entregues pelo PreRenderer.
+
+        As mensagens são agrupadas em transações de até TAMANHO_LOTE; um lote
+        menor é gravado assim que a renderização não tem mais nada pronto, para
+        não atrasar as sessões. A gravação continua mesmo após o cancelamento,
+        para que a campanha completa possa ser retomada.
+        """
+        lote = []
+        try:
+            while True:
+                resultado = self.prerender.get()
+                if resultado is not None:
+                    lote.append(resultado)
+                    if len(lote) < TAMANHO_LOTE and not self.prerender.fila.empty():
+                        continue
+                if lote:
+                    self._enqueue(lote)
+                    lote = []
+                if resultado is None:
+                    break
+        except Exception as e:
+            with self._lock:
+                self.erros.append(f"Erro ao gravar o lote na caixa de saída: {e}")
+            self._cancelado.set()
+        finally:
+            with self._disponivel:
+                self._gravando = False
+                self._disponivel.notify_all()
+
+    def _enqueue(self, resultados):
+        """Grava um lote de resultados; os que falharam na renderização já entram como falhas."""
+        falhas = []
+        linhas = []
+        for resultado in resultados:
+            destinatario = resultado.item['email']
+            erro = None
+            if resultado.erro is not None:
+                erro = f"{destinatario}: erro ao gerar o email ({resultado.erro})"
+                falhas.append(erro)
+            linhas.append((resultado.indice, destinatario, resultado.conteudo, erro))
+        self.outbox.enqueue(self.campanha, linhas)
+
+        with self._disponivel:
+            self.pendentes += len(linhas) - len(falhas)
+            self._disponivel.notify_all()
+        for erro in falhas:
+            self._record(False, erro)
+        if falhas:
+            self.render_failed.emit(falhas)
+
+    def _claim(self):
+        """
+        Retira a próxima mensagem pendente, aguardando a gravação do lote ou a
+        hora de uma tentativa adiada, se preciso.
+
+        Returns:
+            Tupla (id, e-mail, tentativas, mensagem MIME), ou None ao fim da
+            campanha ou no cancelamento
+        """
+        while not self._cancelado.is_set():
+            pendente = self.outbox.claim(self.campanha)
+            if pendente is not None:
+                with self._disponivel:
+                    self.pendentes -= 1
+                    # Backlog real da caixa de saída (sem limite): acima da capacidade, a renderização está à frente
+                    self.metricas_fila.sample(max(self.pendentes, 0))
+                return pendente
+            with self._disponivel:
+                if self._gravando:
+                    self._disponivel.wait(ESPERA_GRAVACAO)
+                    continue
+                # Aguardar a próxima tentativa adiada; as mensagens em envio ficam com as suas sessões
+                espera = self.outbox.next_retry(self.campanha)
+                if espera is None:
+                    return None
+                self._disponivel.wait(espera)
+        return None
+
+    def _record(self, ok, msg):
+        """Contabiliza o resultado de uma mensagem e o informa à interface."""
+        with self._lock:
+            if ok:
+                self.enviados += 1
+            else:
+                self.erros.append(msg)
+            self.processados += 1
+            processados = self.processados
+        self.progress.emit(processados, self.total)
+
+    def _send_loop(self):
+        """Retira e-mails da caixa de saída e os envia por uma sessão SMTP própria."""
+        falhas_conexao = 0  # Falhas seguidas ao abrir a sessão
+        try:
+            with SmtpSession(self.remetente, self.senha) as sessao:
+                while (pendente := self._claim()) is not None:
+                    mensagem_id, _, tentativas, mensagem = pendente
+                    entrega = self._deliver(sessao, mensagem)
+                    if entrega is None:
+                        # Cancelado antes de enviar: a mensagem volta a pendente
+                        self.outbox.release(mensagem_id)
+                        break
+                    ok, msg, erro = entrega
+                    if ok:
+                        self.outbox.mark_sent(mensagem_id)
+                    else:
+                        classificacao, espera = self.politica.next_attempt(
+                            erro, tentativas, sessao.falha_na_conexao, sessao.falha_na_autenticacao
+                        )
+                        if classificacao == FATAL:
+                            # Login ou STARTTLS recusado: a mensagem volta a pendente e o lote para
+                            self.outbox.release(mensagem_id)
+                            self._abort(f"Envio interrompido: o servidor recusou a sessão SMTP: {erro}")
+                            break
+                        if sessao.falha_na_conexao and not is_throttling(erro):
+                            # A falha não é da mensagem: ela volta a pendente e a sessão é reaberta após a espera
+                            self._release(mensagem_id)
+                            falhas_conexao += 1
+                            if falhas_conexao >= self.politica.tentativas_maximas:
+                                self._abort(
+                                    f"Envio interrompido: não foi possível abrir a sessão SMTP "
+                                    f"após {falhas_conexao} tentativas: {erro}"
+                                )
+                                break
+                            self._cancelado.wait(self.politica.delay(falhas_conexao))
+                            continue
+                        if espera is not None:
+                            # Falha transitória ou limitação, inclusive ao abrir a sessão (nas
+                            # limitações, _deliver já desacelerou o domínio): nova tentativa após a espera
+                            self._reschedule(mensagem_id, f"{msg} (falha {classificacao})", espera)
+                            falhas_conexao = 0
+                            continue
+                        # Falha permanente ou tentativas esgotadas: lista de falhas
+                        msg = f"{msg} (falha {classificacao}, {tentativas} tentativa(s))"
+                        self.outbox.mark_failed(mensagem_id, msg)
+                    falhas_conexao = 0
+                    self._record(ok, msg)
+        except Exception as e:
+            with self._lock:
+                self.erros.append(f"Erro inesperado no envio: {e}")
+
+    def _abort(self, erro):
+        """Interrompe todas as sessões por uma falha fatal, registrando o erro uma única vez."""
+        with self._lock:
+            if self.erro_fatal is None:
+                self.erro_fatal = erro
+                self.erros.append(erro)
+        self.cancel()
+
+    def _release(self, mensagem_id):
+        """Devolve uma mensagem retirada à caixa de saída, sem contar a tentativa."""
+        self.outbox.release(mensagem_id)
+        with self._disponivel:
+            self.pendentes += 1
+            self._disponivel.notify_all()
+
+    def _reschedule(self, mensagem_id, msg, espera):
+        """Devolve uma mensagem com falha transitória à caixa de saída, para nova tentativa após 'espera' s."""
+        self.outbox.reschedule(mensagem_id, msg, espera)
+        with self._disponivel:
+            self.pendentes += 1
+            self.reagendamentos += 1
+            self._disponivel.notify_all()
+
+    def _deliver(self, sessao, mensagem):
+        """
+        Envia uma mensagem no ritmo do limitador do seu domínio.
+
+        Respostas de limitação também reduzem a taxa do domínio; a nova
+        tentativa fica a cargo da RetryPolicy.
+
+        Returns:
+            Tupla (sucesso, mensagem de status, exceção do envio ou None), ou
+            None se o envio foi cancelado
+        """
+        destino = mensagem['To']
+        if not self.limitador.acquire(destino, self._cancelado):
+            return None
+        with self.metricas.measure():
+            ok, status = sessao.send_message(mensagem)
+        erro = None if ok else sessao.ultimo_erro
+        self.limitador.report(destino, erro)
+        return ok, status, erro
@@ -0,0 +1,180 @@
+"""
+Execução particionada (sharding) dos agrupamentos por usuário.
+
+Para bases muito grandes, os dados são particionados por hash do código da
+pessoa, de forma que todas as linhas de uma pessoa caem na mesma partição. As
+colunas são gravadas uma única vez em buffers colunares (.npy) num diretório
+temporário, já ordenadas por partição; cada processo do pool abre os arquivos
+com memmap e lê apenas a fatia da sua partição, sem receber DataFrames
+serializados. Os resultados por usuário de cada partição são então unidos,
+preservando a ordem de primeira ocorrência dos códigos.
+"""
+
+import os
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# A partir deste número de linhas o agrupamento é distribuído entre processos
+LIMIAR_LINHAS = 100_000
+MAX_PARTICOES = 8
+
+# Formatos dos buffers colunares
+_NUMERICO = 'numerico'
+_DATA = 'data'
+_TEXTO = 'texto'
+_OBJETO = 'objeto'
+
+
+def default_num_shards(num_linhas):
+    """
+    Define o número de partições para um volume de dados.
+
+    Args:
+        num_linhas: Número de linhas a processar
+
+    Returns:
+        Número de partições (1 significa processamento serial)
+    """
+    nucleos = os.cpu_count() or 1
+    if num_linhas < LIMIAR_LINHAS or nucleos < 2:
+        return 1
+    return min(nucleos, MAX_PARTICOES)
+
+
+def partition_codes(codigos, num_shards):
+    """
+    Calcula a partição de cada linha a partir do código da pessoa.
+
+    Args:
+        codigos: Series com os códigos das pessoas
+        num_shards: Número de partições
+
+    Returns:
+        Array com o número da partição de cada linha
+    """
+    textos = codigos.map(str).to_numpy(dtype=object)
+    return (pd.util.hash_array(textos) % np.uint64(num_shards)).astype(np.int64)
+
+
+def _write_column(serie, caminho):
+    """Grava uma coluna como buffer colunar e retorna seus metadados."""
+    valores = serie.to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        np.save(caminho + '.npy', valores.view(np.int64))
+        return {'formato': _DATA, 'dtype': serie.dtype}
+
+    if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        np.save(caminho + '.npy', valores)
+        return {'formato': _NUMERICO, 'dtype': serie.dtype}
+
+    nulos = serie.isna().to_numpy()
+    if all(isinstance(valor, str) for valor in valores[~nulos]):
+        # Textos em UTF-8 concatenados + deslocamentos (sem largura fixa)
+        codificados = [b'' if nulo else valor.encode('utf-8') for valor, nulo in zip(valores, nulos)]
+        deslocamentos = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum([len(texto) for texto in codificados], out=deslocamentos[1:])
+        np.save(caminho + '.npy', np.frombuffer(b''.join(codificados), dtype=np.uint8))
+        np.save(caminho + '_deslocamentos.npy', deslocamentos)
+        np.save(caminho + '_nulos.npy', nulos)
+        return {'formato': _TEXTO, 'dtype': serie.dtype}
+
+    # Colunas com tipos misturados não têm representação colunar: ficam serializadas
+    np.save(caminho + '.npy', valores.astype(object), allow_pickle=True)
+    return {'formato': _OBJETO, 'dtype': serie.dtype}
+
+
+def _read_column(caminho, metadados, inicio, fim):
+    """Lê a fatia [inicio, fim) de uma coluna gravada por _write_column."""
+    formato = metadados['formato']
+
+    if formato == _OBJETO:
+        valores = np.load(caminho + '.npy', allow_pickle=True)[inicio:fim]
+        return pd.Series(valores, dtype=metadados['dtype'])
+
+    buffer = np.load(caminho + '.npy', mmap_mode='r')
+    if formato == _DATA:
+        return pd.Series(np.array(buffer[inicio:fim]).view(metadados['dtype']))
+    if formato == _NUMERICO:
+        return pd.Series(np.array(buffer[inicio:fim]), dtype=metadados['dtype'])
+
+    deslocamentos = np.load(caminho + '_deslocamentos.npy', mmap_mode='r')[inicio:fim + 1]
+    nulos = np.load(caminho + '_nulos.npy', mmap_mode='r')[inicio:fim]
+    base = int(deslocamentos[0])
+    dados = bytes(buffer[base:int(deslocamentos[-1])])
+    posicoes = (deslocamentos - base).tolist()
+    valores = [
+        np.nan if nulo else dados[posicoes[i]:posicoes[i + 1]].decode('utf-8')
+        for i, nulo in enumerate(nulos.tolist())
+    ]
+    return pd.Series(valores, dtype=metadados['dtype'])
+
+
+def _run_shard(diretorio, colunas, inicio, fim, funcao, contexto):
+    """Processa uma partição no processo do pool (lida via memmap)."""
+    df = pd.DataFrame({
+        coluna: _read_column(os.path.join(diretorio, str(indice)), metadados, inicio, fim)
+        for indice, (coluna, metadados) in enumerate(colunas)
+    })
+    return funcao(df, contexto)
+
+
+def run_sharded(df, funcao, contexto=None, num_shards=None, ao_receber=None):
+    """
+    Executa uma função de agrupamento por usuário em partições paralelas.
+
+    A função recebe (DataFrame da partição, contexto) e deve retornar um
+    dicionário indexado pelo código da pessoa (str). Como cada pessoa está
+    inteira em uma única partição, os dicionários são disjuntos e a união é
+    reordenada pela primeira ocorrência de cada código em df.
+
+    Args:
+        df: DataFrame com a coluna 'Código da pessoa'
+        funcao: Função de nível de módulo (precisa ser importável pelos processos)
+        contexto: Dados auxiliares repassados à função (pequenos)
+        num_shards: Número de partições (padrão: conforme o volume e os núcleos)
+        ao_receber: Função opcional (resultado, DataFrame da partição) chamada no
+            processo principal para cada partição recebida
+
+    Returns:
+        Dicionário com os resultados por usuário
+    """
+    if num_shards is None:
+        num_shards = default_num_shards(len(df))
+    if num_shards <= 1 or df.empty:
+        return funcao(df.reset_index(drop=True), contexto)
+
+    particoes = partition_codes(df['Código da pessoa'], num_shards)
+    ordem = np.argsort(particoes, kind='stable')
+    limites = np.concatenate(([0], np.cumsum(np.bincount(particoes, minlength=num_shards))))
+    df_ordenado = df.iloc[ordem].reset_index(drop=True)
+
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix='shards_') as diretorio:
+        colunas = [
+            (coluna, _write_column(df_ordenado[coluna], os.path.join(diretorio, str(indice))))
+            for indice, coluna in enumerate(df_ordenado.columns)
+        ]
+
+        # 'spawn' evita copiar o estado da interface gráfica para os processos
+        contexto_mp = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=num_shards, mp_context=contexto_mp) as executor:
+            tarefas = [
+                (int(limites[i]), int(limites[i + 1]), executor.submit(
+                    _run_shard, diretorio, colunas, int(limites[i]), int(limites[i + 1]), funcao, contexto
+                ))
+                for i in range(num_shards) if limites[i + 1] > limites[i]
+            ]
+            for inicio, fim, tarefa in tarefas:
+                resultado = tarefa.result()
+                if ao_receber is not None:
+                    ao_receber(resultado, df_ordenado.iloc[inicio:fim])
+                resultados.update(resultado)
+
+    # Reordenar pela primeira ocorrência (mesma ordem do processamento serial)
+    ordem_codigos = pd.unique(df['Código da pessoa'].map(str))
+    return {codigo: resultados[codigo] for codigo in ordem_codigos if codigo in resultados}
@@ -0,0 +1,271 @@
+"""
+Base analítica SQLite em memória.
+
+Este módulo carrega os dados unificados em um banco SQLite embutido, com as
+tabelas rel86 e rel76 no mesmo formato dos relatórios originais, e cria
+automaticamente as views de conciliação documentadas em "consultas sql.txt".
+Assim as consultas podem ser executadas diretamente pela aplicação, sem
+exportar e importar os dados em uma ferramenta externa.
+"""
+
+import sqlite3
+import pandas as pd
+
+from modules.date_utils import parse_date_column
+
+# Colunas das tabelas, mantendo os nomes dos relatórios originais
+# (inclusive o espaço final em "Código da pessoa " do relatório 86)
+COLUNAS_REL86 = {
+    'Código da pessoa ': 'Código da pessoa',
+    'Nome da pessoa': 'Nome da pessoa',
+    'Email': 'Email',
+    'Título': 'Título',
+    'Número chave': 'Número chave',
+    'Valor multa': 'Valor multa',
+    'Data de empréstimo': 'Data de empréstimo',
+    'Data devolução prevista': 'Data devolução prevista',
+    'Data devolução efetivada': 'Data devolução efetivada'
+}
+
+COLUNAS_REL76 = {
+    'Código pessoa': 'Código da pessoa',
+    'Nome da pessoa': 'Nome da pessoa',
+    'Email': 'Email',
+    'Título': 'Título',
+    'Data de empréstimo': 'Data de empréstimo',
+    'Data devolução prevista': 'Data devolução prevista'
+}
+
+COLUNAS_REAIS = {'Valor multa', 'Número chave'}
+
+# Views de conciliação (transcritas de "consultas sql.txt")
+VIEWS = {
+    'somente_multados_rel86': '''
+        CREATE VIEW somente_multados_rel86 AS
+        SELECT
+            r86."Código da pessoa " AS "Código pessoa",
+            r86."Nome da pessoa",
+            r86."Email",
+            COUNT(*) AS contagem_rel86
+        FROM rel86 r86
+        WHERE
+            r86."Email" IS NOT NULL AND TRIM(r86."Email") != ''
+            AND NOT EXISTS (
+                SELECT 1
+                FROM rel76 r76_sub
+                WHERE r76_sub."Código pessoa" = r86."Código da pessoa "
+            )
+        GROUP BY
+            r86."Código da pessoa ",
+            r86."Nome da pessoa",
+            r86."Email"
+    ''',
+    'somente_pendentes_rel76': '''
+        CREATE VIEW somente_pendentes_rel76 AS
+        SELECT
+            r76."Código pessoa",
+            r76."Nome da pessoa",
+            r76."Email",
+            COUNT(*) AS contagem_rel76
+        FROM rel76 r76
+        WHERE
+            r76."Email" IS NOT NULL AND TRIM(r76."Email") != ''
+            AND NOT EXISTS (
+                SELECT 1
+                FROM rel86 r86_sub
+                WHERE r86_sub."Código da pessoa " = r76."Código pessoa"
+            )
+        GROUP BY
+            r76."Código pessoa",
+            r76."Nome da pessoa",
+            r76."Email"
+    ''',
+    'pessoa_count_view': '''
+        CREATE VIEW pessoa_count_view AS
+        SELECT
+            r76."Código pessoa",
+            r76."Nome da pessoa",
+            r76."Email",
+            COUNT(r76."Código pessoa") AS contagem_rel76,
+            (
+                SELECT COUNT(*)
+                FROM rel86 r86_sub
+                WHERE
+                    r86_sub."Código da pessoa " = r76."Código pessoa"
+            ) AS contagem_rel86
+        FROM rel76 r76
+        WHERE
+            r76."Email" IS NOT NULL AND TRIM(r76."Email") != '' AND
+            EXISTS (
+                SELECT 1
+                FROM rel86 r86_sub
+                WHERE r86_sub."Código da pessoa " = r76."Código pessoa"
+            )
+        GROUP BY
+            r76."Código pessoa",
+            r76."Nome da pessoa",
+            r76."Email"
+    ''',
+    'pessoas_sem_email': '''
+        CREATE VIEW pessoas_sem_email AS
+        SELECT DISTINCT
+            pessoa."Código pessoa",
+            pessoa."Nome da pessoa"
+        FROM (
+            SELECT
+                r76."Código pessoa",
+                r76."Nome da pessoa",
+                r76."Email"
+            FROM rel76 r76
+            WHERE r76."Email" IS NULL OR TRIM(r76."Email") = ''
+
+            UNION
+
+            SELECT
+                r86."Código da pessoa " AS "Código pessoa",
+                r86."Nome da pessoa",
+                r86."Email"
+            FROM rel86 r86
+            WHERE r86."Email" IS NULL OR TRIM(r86."Email") = ''
+        ) AS pessoa
+    '''
+}
+
+# Coluna com o código da pessoa em cada view (para contagens de pessoas distintas)
+COLUNA_CODIGO_VIEW = {
+    'somente_multados_rel86': 'Código pessoa',
+    'somente_pendentes_rel76': 'Código pessoa',
+    'pessoa_count_view': 'Código pessoa',
+    'pessoas_sem_email': 'Código pessoa'
+}
+
+DESCRICAO_VIEWS = {
+    'somente_multados_rel86': 'Somente multas (86), com e-mail',
+    'somente_pendentes_rel76': 'Somente pendências (76), com e-mail',
+    'pessoa_count_view': 'Multas e pendências, com e-mail',
+    'pessoas_sem_email': 'Pessoas sem e-mail'
+}
+
+
+def _quote(identificador):
+    """Delimita um identificador SQL entre aspas duplas."""
+    return '"' + identificador.replace('"', '""') + '"'
+
+
+def _column_values(df, coluna):
+    """Converte uma coluna do DataFrame para valores aceitos pelo SQLite."""
+    if coluna not in df.columns:
+        return [None] * len(df)
+
+    serie = df[coluna]
+    if coluna.startswith('Data'):
+        datas = parse_date_column(serie)
+        return datas.dt.strftime('%Y-%m-%d').astype(object).where(datas.notna(), None).tolist()
+
+    if coluna in COLUNAS_REAIS:
+        numeros = pd.to_numeric(serie, errors='coerce')
+        return numeros.astype(object).where(numeros.notna(), None).tolist()
+
+    if coluna == 'Código da pessoa':
+        # Mesmo formato de código usado no restante da aplicação (str do valor original)
+        return [None if pd.isna(valor) else str(valor) for valor in serie.tolist()]
+
+    textos = serie.astype(object).where(serie.notna(), None)
+    return [None if valor is None else str(valor) for valor in textos.tolist()]
+
+
+class AnalyticsStore:
+    """Banco SQLite embutido com os relatórios unificados e as views de conciliação."""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self._create_schema()
+
+    def _create_schema(self):
+        """Cria tabelas, índices e views."""
+        with self.conn:
+            for tabela, colunas in (('rel86', COLUNAS_REL86), ('rel76', COLUNAS_REL76)):
+                definicoes = ", ".join(
+                    f"{_quote(coluna)} {'REAL' if colunas[coluna] in COLUNAS_REAIS else 'TEXT'}"
+                    for coluna in colunas
+                )
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {tabela} ({definicoes})")
+
+            coluna_codigo = {'rel86': 'Código da pessoa ', 'rel76': 'Código pessoa'}
+            for tabela, coluna in coluna_codigo.items():
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{tabela}_codigo ON {tabela} ({_quote(coluna)})"
+                )
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{tabela}_email ON {tabela} (\"Email\")"
+                )
+
+            for nome, sql in VIEWS.items():
+                self.conn.execute(f"DROP VIEW IF EXISTS {nome}")
+                self.conn.execute(sql)
+
+    def load(self, df):
+        """
+        Substitui o conteúdo das tabelas pelos dados unificados.
+
+        Args:
+            df: DataFrame unificado (com a coluna 'Relatório')
+
+        Returns:
+            Dicionário com o número de linhas inseridas em cada tabela
+        """
+        inseridos = {}
+        with self.conn:
+            for tabela, colunas in (('rel86', COLUNAS_REL86), ('rel76', COLUNAS_REL76)):
+                df_relatorio = df[df['Relatório'] == tabela] if 'Relatório' in df.columns else df.iloc[0:0]
+                valores = [_column_values(df_relatorio, origem) for origem in colunas.values()]
+                linhas = list(zip(*valores)) if valores else []
+
+                nomes = ", ".join(_quote(coluna) for coluna in colunas)
+                marcadores = ", ".join("?" for _ in colunas)
+                self.conn.execute(f"DELETE FROM {tabela}")
+                self.conn.executemany(f"INSERT INTO {tabela} ({nomes}) VALUES ({marcadores})", linhas)
+                inseridos[tabela] = len(linhas)
+
+        # Atualizar estatísticas do planejador para as novas cargas
+        self.conn.execute("ANALYZE")
+        return inseridos
+
+    def query(self, sql, params=()):
+        """
+        Executa uma consulta e retorna o resultado como DataFrame.
+
+        Args:
+            sql: Comando SQL (SELECT)
+            params: Parâmetros da consulta
+
+        Returns:
+            DataFrame com o resultado
+        """
+        cursor = self.conn.execute(sql, params)
+        colunas = [descricao[0] for descricao in cursor.description or []]
+        return pd.DataFrame(cursor.fetchall(), columns=colunas)
+
+    def view_names(self):
+        """Retorna os nomes das views de conciliação disponíveis."""
+        return list(VIEWS)
+
+    def get_view_counts(self):
+        """
+        Conta as pessoas distintas em cada view de conciliação.
+
+        Returns:
+            Dicionário {nome_da_view: quantidade_de_pessoas}
+        """
+        contagens = {}
+        for nome in VIEWS:
+            coluna = _quote(COLUNA_CODIGO_VIEW[nome])
+            contagens[nome] = self.conn.execute(
+                f"SELECT COUNT(DISTINCT {coluna}) FROM {nome}"
+            ).fetchone()[0]
+        return contagens
+
+    def close(self):
+        """Fecha a conexão com o banco."""
+        self.conn.close()
@@ -78,6 +78,9 @@ def setup_tabs(main_interface):
     main_interface.tabs.addTab(email_tab, "✉️ Emails")
     tabs.append(email_tab)
 
+    # Preview dos templates com usuários e renderização da aba de emails
+    template_tab.set_preview_source(email_tab)
+
     # Aba de Configurações
     config_tab = ConfigTab(main_interface)
     config_tab.show_message.connect(main_interface.show_message)
@@ -1,12 +1,15 @@
 from PyQt6.QtWidgets import (
     QLabel, QVBoxLayout, QWidget, QFrame, QPushButton,
-    QHBoxLayout, QMessageBox, QLineEdit, QFormLayout, QGroupBox, QCheckBox
+    QHBoxLayout, QMessageBox, QLineEdit, QFormLayout, QGroupBox, QCheckBox, QSpinBox,
+    QDoubleSpinBox
 )
 from PyQt6.QtCore import pyqtSignal
 
 from modules.tabs.base_tab import BaseTab
 from modules.styles_fix import StyleManager
 from modules.config_manager import ConfigManager
+from modules.send_worker import CONEXOES_PADRAO, MAX_CONEXOES
+from modules.rate_limiter import TAXA_INICIAL, TAXA_MINIMA, TAXA_MAXIMA
 
 class ConfigTab(BaseTab):
     """Aba para configuração geral da aplicação."""
@@ -53,6 +56,24 @@ class ConfigTab(BaseTab):
 
         self.email_assunto_padrao_input = QLineEdit()
         email_layout.addRow("Assunto Padrão do Email:", self.email_assunto_padrao_input)
+
+        self.smtp_conexoes_input = QSpinBox()
+        self.smtp_conexoes_input.setRange(1, MAX_CONEXOES)
+        self.smtp_conexoes_input.setToolTip(
+            "Número de conexões SMTP abertas ao mesmo tempo durante o envio. "
+            "Mais conexões enviam mais rápido, dentro do limite do provedor."
+        )
+        email_layout.addRow("Conexões SMTP Simultâneas:", self.smtp_conexoes_input)
+
+        self.taxa_envio_input = QDoubleSpinBox()
+        self.taxa_envio_input.setRange(TAXA_MINIMA, TAXA_MAXIMA)
+        self.taxa_envio_input.setSingleStep(0.5)
+        self.taxa_envio_input.setSuffix(" emails/s")
+        self.taxa_envio_input.setToolTip(
+            "Taxa inicial de envio para cada domínio (ifc.edu.br, gmail.com e demais). "
+            "A taxa é reduzida quando o servidor limita os envios e volta a subir aos poucos."
+        )
+        email_layout.addRow("Taxa Inicial de Envio:", self.taxa_envio_input)
         
         # Checkbox para modo de teste
         self.modo_teste_check = QCheckBox("Habilitar modo de teste (envia apenas para o destinatário de teste)")
@@ -61,6 +82,14 @@ class ConfigTab(BaseTab):
         )
         email_layout.addRow(self.modo_teste_check)
 
+        # Checkbox para mesclar usuários duplicados
+        self.mesclar_duplicados_check = QCheckBox("Mesclar usuários duplicados (mesma pessoa com vários códigos)")
+        self.mesclar_duplicados_check.setToolTip(
+            "Se marcado, códigos com nomes e e-mails equivalentes são tratados como uma única pessoa, "
+            "evitando notificações duplicadas."
+        )
+        email_layout.addRow(self.mesclar_duplicados_check)
+
         self.layout.addWidget(email_group)
 
         # Botões de ação
@@ -83,7 +112,10 @@ class ConfigTab(BaseTab):
             self.email_senha_app_input.setText(self.config_manager.get_value('email_senha_app', ''))
             self.email_destinatario_padrao_input.setText(self.config_manager.get_value('email_destinatario_padrao', ''))
             self.email_assunto_padrao_input.setText(self.config_manager.get_value('email_assunto_padrao', ''))
+            self.smtp_conexoes_input.setValue(int(self.config_manager.get_value('smtp_conexoes', CONEXOES_PADRAO)))
+            self.taxa_envio_input.setValue(float(self.config_manager.get_value('taxa_envio', TAXA_INICIAL)))
             self.modo_teste_check.setChecked(self.config_manager.get_value('modo_teste', True))
+            self.mesclar_duplicados_check.setChecked(self.config_manager.get_value('mesclar_duplicados', False))
 
     def save_config(self):
         """Salva as configurações a partir dos campos."""
@@ -92,7 +124,10 @@ class ConfigTab(BaseTab):
             self.config_manager.set_value('email_senha_app', self.email_senha_app_input.text())
             self.config_manager.set_value('email_destinatario_padrao', self.email_destinatario_padrao_input.text())
             self.config_manager.set_value('email_assunto_padrao', self.email_assunto_padrao_input.text())
+            self.config_manager.set_value('smtp_conexoes', self.smtp_conexoes_input.value())
+            self.config_manager.set_value('taxa_envio', self.taxa_envio_input.value())
             self.config_manager.set_value('modo_teste', self.modo_teste_check.isChecked())
+            self.config_manager.set_value('mesclar_duplicados', self.mesclar_duplicados_check.isChecked())
 
             self.config_updated.emit()
             self.show_message_box("Sucesso", "Configurações salvas com sucesso!")
@@ -1,22 +1,260 @@
 from PyQt6.QtWidgets import (
     QLabel, QVBoxLayout, QWidget, QFrame, QPushButton,
     QHBoxLayout, QMessageBox, QTableWidget, QTableWidgetItem,
-    QProgressBar, QTextEdit, QComboBox, QGroupBox, QCheckBox
+    QProgressBar, QTextEdit, QComboBox, QGroupBox, QCheckBox,
+    QDialog, QDoubleSpinBox, QLineEdit, QHeaderView, QAbstractItemView, QFileDialog
 )
-from PyQt6.QtCore import pyqtSignal, Qt, QDate, QTimer
+from PyQt6.QtCore import pyqtSignal, Qt, QDate
 import pandas as pd
 import re
 import json
 import os
 import datetime
-import markdown
+import threading
 from datetime import datetime
 
 from modules.tabs.base_tab import BaseTab
 from modules.styles_fix import StyleManager, AppColors
 from modules.config_manager import ConfigManager
-from modules.data_processor import filter_users_by_category
-from modules.email_sender import send_email
+from modules.data_processor import filter_users_by_category, group_items_by_person
+from modules.duplicate_detector import find_duplicate_patrons, apply_merge_map
+from modules.email_validation import validate_emails, INVALIDO
+from modules.lazy_items import LazyItems
+from modules.date_utils import format_date_br
+from modules.email_sender import send_email, build_message
+from modules.email_export import export_messages, FORMATO_MBOX, FORMATO_EML
+from modules.template_renderer import (
+    CompiledTemplate, ItemList, RenderCache, content_fingerprint, normalize_line_breaks
+)
+from modules.prerender import PreRenderer
+from modules.pipeline_metrics import format_metrics
+from modules.send_worker import SendWorker, CONEXOES_PADRAO
+from modules.outbox import Outbox, CAMPANHA_DESCARTADA, ESTADO_PENDENTE, ESTADO_ENVIANDO
+from modules.rate_limiter import TAXA_INICIAL
+from modules.placeholders import PLACEHOLDERS, ResolverContext, placeholders_for
+from modules.preview_prefetch import PreviewPrefetcher
+
+
+class LedgerDialog(QDialog):
+    """Diálogo de atendimento: devoluções, pagamentos e correção de e-mail de uma pessoa."""
+
+    def __init__(self, ledger, codigos, nome, parent=None):
+        super().__init__(parent)
+        self.ledger = ledger
+        self.codigos = [str(codigo) for codigo in codigos]
+        self.setWindowTitle(f"Atendimento - {nome}")
+        self.resize(760, 480)
+
+        layout = QVBoxLayout(self)
+
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        # Itens em aberto da pessoa
+        self.items_table = QTableWidget()
+        self.items_table.setColumnCount(4)
+        self.items_table.setHorizontalHeaderLabels(["Relatório", "Título", "Valor", "Devolução prevista"])
+        self.items_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.items_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.items_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.items_table)
+
+        # Devolução e pagamento
+        actions_layout = QHBoxLayout()
+        return_button = QPushButton("Marcar como devolvido")
+        StyleManager.configure_button(return_button, 'secondary')
+        return_button.clicked.connect(self.mark_returned)
+        actions_layout.addWidget(return_button)
+        actions_layout.addStretch()
+
+        self.payment_spin = QDoubleSpinBox()
+        self.payment_spin.setPrefix("R$ ")
+        self.payment_spin.setRange(0, 100000)
+        self.payment_spin.setDecimals(2)
+        self.payment_spin.setSpecialValueText("Valor total")
+        actions_layout.addWidget(self.payment_spin)
+
+        payment_button = QPushButton("Registrar pagamento")
+        StyleManager.configure_button(payment_button, 'primary')
+        payment_button.clicked.connect(self.register_payment)
+        actions_layout.addWidget(payment_button)
+        layout.addLayout(actions_layout)
+
+        # Correção de e-mail
+        email_layout = QHBoxLayout()
+        email_layout.addWidget(QLabel("E-mail:"))
+        self.email_edit = QLineEdit()
+        email_layout.addWidget(self.email_edit, 1)
+        email_button = QPushButton("Salvar e-mail")
+        StyleManager.configure_button(email_button, 'secondary')
+        email_button.clicked.connect(self.update_email)
+        email_layout.addWidget(email_button)
+        layout.addLayout(email_layout)
+
+        close_button = QPushButton("Fechar")
+        StyleManager.configure_button(close_button, 'secondary')
+        close_button.clicked.connect(self.accept)
+        layout.addWidget(close_button, 0, Qt.AlignmentFlag.AlignRight)
+
+        self.email_edit.setText(next(
+            (self.ledger.emails.get(codigo, '') for codigo in self.codigos if self.ledger.emails.get(codigo)), ''
+        ))
+        self.refresh()
+
+    def refresh(self):
+        """Recarrega os itens em aberto e o resumo da pessoa."""
+        linhas = pd.concat([self.ledger.rows(codigo) for codigo in self.codigos])
+        self.items_table.setRowCount(len(linhas))
+        for i, (posicao, linha) in enumerate(linhas.iterrows()):
+            relatorio = 'Multa' if linha['Relatório'] == 'rel86' else 'Pendência'
+            valor = f"R$ {self.ledger.amount_due(posicao):.2f}" if linha['Relatório'] == 'rel86' else ''
+            prevista = linha.get('Data devolução prevista')
+            prevista = format_date_br(prevista) if isinstance(prevista, pd.Timestamp) else ''
+            titulo = '' if pd.isna(linha.get('Título')) else str(linha.get('Título'))
+
+            for coluna, texto in enumerate([relatorio, titulo, valor, prevista]):
+                item = QTableWidgetItem(texto)
+                item.setData(Qt.ItemDataRole.UserRole, int(posicao))
+                self.items_table.setItem(i, coluna, item)
+
+        valor_total = sum(self.ledger.agregados[codigo]['valor_multas'] for codigo in self.codigos
+                          if codigo in self.ledger.agregados)
+        self.info_label.setText(
+            f"Matrícula(s): {', '.join(self.codigos)} | Itens em aberto: {len(linhas)} | "
+            f"Valor em aberto: R$ {valor_total:.2f}".replace('.', ',')
+        )
+
+    def mark_returned(self):
+        """Registra a devolução do item selecionado."""
+        linha = self.items_table.currentRow()
+        if linha < 0:
+            QMessageBox.warning(self, "Aviso", "Selecione um item na tabela.")
+            return
+        try:
+            self.ledger.mark_returned(self.items_table.item(linha, 0).data(Qt.ItemDataRole.UserRole))
+        except ValueError as e:
+            QMessageBox.warning(self, "Erro", str(e))
+        self.refresh()
+
+    def register_payment(self):
+        """Registra o pagamento informado (ou o valor total) nas multas da pessoa."""
+        restante = self.payment_spin.value() or None
+        abatido = 0.0
+        try:
+            for codigo in self.codigos:
+                if restante is not None and restante <= 0:
+                    break
+                pago = self.ledger.register_payment(codigo, restante)
+                abatido += pago
+                if restante is not None:
+                    restante -= pago
+        except ValueError as e:
+            QMessageBox.warning(self, "Erro", str(e))
+        self.payment_spin.setValue(0)
+        self.refresh()
+        QMessageBox.information(self, "Pagamento", f"Valor abatido: R$ {abatido:.2f}".replace('.', ','))
+
+    def update_email(self):
+        """Grava o e-mail informado para todos os códigos da pessoa."""
+        try:
+            for codigo in self.codigos:
+                email = self.ledger.update_email(codigo, self.email_edit.text())
+            self.email_edit.setText(email)
+        except ValueError as e:
+            QMessageBox.warning(self, "Erro", str(e))
+        self.refresh()
+
+
+class DeadLetterDialog(QDialog):
+    """Lista de falhas da caixa de saída: consulta, reenvio e descarte das mensagens que falharam."""
+
+    def __init__(self, outbox, permitir_reenvio=True, parent=None):
+        super().__init__(parent)
+        self.outbox = outbox
+        self.reenviadas = 0
+        self.setWindowTitle("Falhas de Envio")
+        self.resize(860, 480)
+
+        layout = QVBoxLayout(self)
+
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        self.failures_table = QTableWidget()
+        self.failures_table.setColumnCount(4)
+        self.failures_table.setHorizontalHeaderLabels(["Destinatário", "Tentativas", "Erro", "Data"])
+        self.failures_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.failures_table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.failures_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.failures_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.failures_table)
+
+        actions_layout = QHBoxLayout()
+        self.requeue_button = QPushButton("Reenviar selecionadas")
+        StyleManager.configure_button(self.requeue_button, 'primary')
+        self.requeue_button.clicked.connect(self.requeue_selected)
+        # Durante um envio, as mensagens só podem ser consultadas
+        self.requeue_button.setEnabled(permitir_reenvio)
+        actions_layout.addWidget(self.requeue_button)
+
+        discard_button = QPushButton("Descartar selecionadas")
+        StyleManager.configure_button(discard_button, 'secondary')
+        discard_button.clicked.connect(self.discard_selected)
+        actions_layout.addWidget(discard_button)
+        actions_layout.addStretch()
+
+        close_button = QPushButton("Fechar")
+        StyleManager.configure_button(close_button, 'secondary')
+        close_button.clicked.connect(self.accept)
+        actions_layout.addWidget(close_button)
+        layout.addLayout(actions_layout)
+
+        self.refresh()
+
+    def refresh(self):
+        """Recarrega a lista de falhas."""
+        falhas = self.outbox.dead_letters()
+        self.failures_table.setRowCount(len(falhas))
+        for i, falha in enumerate(falhas):
+            data = (falha['atualizada_em'] or '').replace('T', ' ')
+            for coluna, texto in enumerate([falha['email'], str(falha['tentativas']), falha['erro'] or '', data]):
+                item = QTableWidgetItem(texto)
+                item.setData(Qt.ItemDataRole.UserRole, falha['id'])
+                self.failures_table.setItem(i, coluna, item)
+        self.info_label.setText(f"Mensagens que falharam: {len(falhas)}")
+
+    def selected_ids(self):
+        """Identificadores das mensagens selecionadas na tabela."""
+        linhas = {indice.row() for indice in self.failures_table.selectionModel().selectedRows()}
+        return [self.failures_table.item(linha, 0).data(Qt.ItemDataRole.UserRole) for linha in sorted(linhas)]
+
+    def requeue_selected(self):
+        """Devolve as mensagens selecionadas para a caixa de saída."""
+        ids = self.selected_ids()
+        if not ids:
+            QMessageBox.warning(self, "Aviso", "Selecione ao menos uma mensagem na tabela.")
+            return
+        quantidade = self.outbox.requeue(ids)
+        self.reenviadas += quantidade
+        self.refresh()
+        QMessageBox.information(
+            self, "Reenvio",
+            f"{quantidade} mensagens voltaram para a caixa de saída. Use \"Retomar Envio\" para enviá-las."
+        )
+
+    def discard_selected(self):
+        """Remove as mensagens selecionadas da lista de falhas."""
+        ids = self.selected_ids()
+        if not ids:
+            QMessageBox.warning(self, "Aviso", "Selecione ao menos uma mensagem na tabela.")
+            return
+        confirm = QMessageBox.question(
+            self, "Descartar", f"Descartar {len(ids)} mensagens? Elas não poderão mais ser reenviadas.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if confirm == QMessageBox.StandardButton.Yes:
+            self.outbox.discard(ids)
+            self.refresh()
 
 
 class EmailTab(BaseTab):
@@ -24,6 +262,7 @@ class EmailTab(BaseTab):
 
     # Sinais específicos desta aba
     email_sent = pyqtSignal(int)  # Número de emails enviados
+    test_email_finished = pyqtSignal(bool, str, str)  # Sucesso, mensagem e destinatário do e-mail de teste
 
     def __init__(self, parent=None):
         self.config_manager = ConfigManager()
@@ -33,17 +272,30 @@ class EmailTab(BaseTab):
         self.filtered_users = []  # Lista de usuários filtrados para navegação
         self.current_preview_index = 0  # Índice do usuário atual no preview
         self.users_without_email = []  # Lista de usuários sem email
+        self.users_invalid_email = []  # Lista de usuários com email inválido
+        self.merge_map = {}  # Códigos duplicados mesclados {código: código_canônico}
+        self.ledger = None  # Livro de lançamentos (atualizações pontuais do atendimento)
+        self.person_data = {}  # Registros por código canônico
+        self.codigos_por_email = {}  # Índice {email: [códigos canônicos]}
+        self.compiled_templates = {}  # Templates compilados por categoria
+        self.render_cache = RenderCache()  # E-mails renderizados (preview e envio)
         
         # Variáveis para controle de envio em lote
         self.selected_users = []
-        self.current_email_index = 0
         self.enviados = 0
         self.erros = []
-        self.email_timer = QTimer()
-        self.email_timer.timeout.connect(self.send_next_email)
-        
+        self.prerender = None  # Renderização antecipada do lote em envio
+        self.send_worker = None  # Envio do lote em segundo plano
+        self.render_failures_reported = False  # Erros de geração do lote em envio já informados
+        self.outbox = Outbox()  # Caixa de saída persistente (lotes retomáveis)
+        self.campanha = None  # Campanha da caixa de saída em envio
+
         super().__init__(parent)
+        self.test_email_finished.connect(self.on_test_email_finished)
+        # Renderiza e diagrama em segundo plano os previews vizinhos ao exibido
+        self.preview_prefetcher = PreviewPrefetcher(self.process_template, self.email_preview, parent=self)
         self.load_templates()
+        self.update_resume_button()
 
     def setup_ui(self):
         """Configura a interface da aba de emails."""
@@ -82,6 +334,7 @@ class EmailTab(BaseTab):
         self.user_type_combo.addItem("Apenas com Pendências", "pendencias")
         self.user_type_combo.addItem("Com Multas e Pendências", "ambos")
         self.user_type_combo.addItem("Sem Email", "sem_email")
+        self.user_type_combo.addItem("Email Inválido", "email_invalido")
         user_type_layout.addWidget(self.user_type_combo)
 
         filter_layout.addWidget(user_type_container)
@@ -138,11 +391,38 @@ class EmailTab(BaseTab):
         self.test_button.clicked.connect(self.test_send_email)
         actions_layout.addWidget(self.test_button)
 
+        self.ledger_button = QPushButton("Registrar Atendimento")
+        StyleManager.configure_button(self.ledger_button, 'secondary')
+        self.ledger_button.clicked.connect(self.open_ledger_dialog)
+        actions_layout.addWidget(self.ledger_button)
+
+        self.export_button = QPushButton("Exportar Emails")
+        StyleManager.configure_button(self.export_button, 'secondary')
+        self.export_button.clicked.connect(self.export_emails)
+        actions_layout.addWidget(self.export_button)
+
         self.send_button = QPushButton("Enviar Emails")
         StyleManager.configure_button(self.send_button, 'primary')
         self.send_button.clicked.connect(self.send_emails)
         actions_layout.addWidget(self.send_button)
 
+        self.resume_button = QPushButton("Retomar Envio")
+        StyleManager.configure_button(self.resume_button, 'info')
+        self.resume_button.clicked.connect(self.resume_email_sending)
+        self.resume_button.setVisible(False)
+        actions_layout.addWidget(self.resume_button)
+
+        self.failures_button = QPushButton("Falhas de Envio")
+        StyleManager.configure_button(self.failures_button, 'secondary')
+        self.failures_button.clicked.connect(self.open_dead_letters)
+        actions_layout.addWidget(self.failures_button)
+
+        self.cancel_button = QPushButton("Cancelar Envio")
+        StyleManager.configure_button(self.cancel_button, 'secondary')
+        self.cancel_button.clicked.connect(self.cancel_email_sending)
+        self.cancel_button.setVisible(False)
+        actions_layout.addWidget(self.cancel_button)
+
         self.layout.addWidget(actions_container)
 
         # Barra de progresso
@@ -156,6 +436,11 @@ class EmailTab(BaseTab):
         StyleManager.configure_progress_bar(self.progress_bar)
         progress_layout.addWidget(self.progress_bar)
 
+        # Vazão de cada etapa e ocupação da fila durante o envio
+        self.pipeline_label = QLabel("")
+        self.pipeline_label.setVisible(False)
+        progress_layout.addWidget(self.pipeline_label)
+
         self.layout.addWidget(progress_container)
 
     def load_templates(self):
@@ -168,6 +453,11 @@ class EmailTab(BaseTab):
                 self.templates['apenas_pendencia'] = self.config_manager.get_value('template_apenas_pendencia', '')
                 self.templates['multa_e_pendencia'] = self.config_manager.get_value('template_multa_e_pendencia', '')
 
+            # E-mails renderizados com os templates anteriores não servem mais
+            self.render_cache.clear()
+            if hasattr(self, 'preview_prefetcher'):
+                self.preview_prefetcher.clear()
+
             # Limpar o preview atual quando os templates são recarregados
             if hasattr(self, 'email_preview'):
                 self.email_preview.clear()
@@ -187,8 +477,14 @@ class EmailTab(BaseTab):
         except Exception as e:
             self.show_message_box("Erro", f"Erro ao carregar templates: {str(e)}", QMessageBox.Icon.Critical)
 
-    def update_data(self, unified_data=None):
+    def update_data(self, unified_data=None, ledger=None):
         """Atualiza os dados exibidos na aba."""
+        if ledger is not None:
+            if self.ledger is not None:
+                self.ledger.remove_listener(self.on_ledger_changed)
+            self.ledger = ledger
+            self.ledger.add_listener(self.on_ledger_changed)
+
         if unified_data is not None:
             self.unified_data = unified_data
             self.process_user_data()
@@ -214,80 +510,67 @@ class EmailTab(BaseTab):
 
             self._printed_columns = True  # Para imprimir apenas uma vez
 
-        # Primeiro agrupamos por código de pessoa
-        temp_user_data = {}
-        self.users_without_email = []  # Lista de usuários sem email
+        # Com o livro de lançamentos, os itens baixados no atendimento ficam de fora
+        base = self.ledger.df if self.ledger is not None else self.unified_data
+        ativos = self.ledger.ativo if self.ledger is not None else pd.Series(True, index=base.index)
 
-        # Passo 1: Agrupar por código de pessoa primeiro (para organização interna)
-        for _, row in self.unified_data.iterrows():
-            codigo = str(row.get('Código da pessoa', ''))
-            if not codigo or pd.isna(codigo):
-                continue
+        # Normalizar e validar os e-mails antes do agrupamento (inválidos não chegam ao SMTP)
+        validacao = validate_emails(base['Email'])
+        dados = base.copy()
+        dados['Email'] = validacao['email']
 
-            nome = row.get('Nome da pessoa', '')
-            if pd.isna(nome):
-                nome = ''
+        invalidos = dados[validacao['status'].eq(INVALIDO) & dados['Código da pessoa'].notna() & ativos]
+        self.users_invalid_email = [
+            {'codigo': str(codigo), 'nome': '' if pd.isna(nome) else nome, 'email_original': original}
+            for codigo, nome, original in zip(
+                invalidos['Código da pessoa'], invalidos['Nome da pessoa'], validacao.loc[invalidos.index, 'original']
+            )
+        ]
+        self.users_invalid_email = list({user['codigo']: user for user in self.users_invalid_email}.values())
+        codigos_invalidos = {user['codigo'] for user in self.users_invalid_email}
+
+        # Detectar pessoas com mais de um código (e-mails diferentes ou ausentes)
+        self.merge_map = {}
+        if self.config_manager.get_value('mesclar_duplicados', False):
+            self.merge_map, _ = find_duplicate_patrons(dados)
+            if self.merge_map:
+                print(f"{len(self.merge_map)} códigos mesclados como duplicados.")
+        dados = apply_merge_map(dados, self.merge_map)[ativos]
 
-            email = row.get('Email', '')
-            if pd.isna(email):
-                email = ''
+        # Passo 1: Agrupar por código de pessoa primeiro (para organização interna)
+        self.person_data = group_items_by_person(dados)
 
-            # Criar ou atualizar registro do usuário
-            if codigo not in temp_user_data:
-                temp_user_data[codigo] = {
-                    'codigo': codigo,
-                    'nome': nome,
-                    'email': email.strip().lower(),  # Normalizar email para agrupar corretamente
-                    'multas': [],
-                    'pendencias': [],
-                    'valor_total_multas': 0.0
-                }
-                # NOVO: se não tem email, adiciona na lista
-                if email.strip() == '':
-                    self.users_without_email.append({'codigo': codigo, 'nome': nome})
-
-            # Se for multa (rel86)
-            relatorio = row.get('Relatório', '')
-            if relatorio == 'rel86':
-                titulo = row.get('Título', '')
-                valor = row.get('Valor multa', 0.0)
-                if pd.isna(valor):
-                    valor = 0.0
-
-                data_emprestimo = row.get('Data de empréstimo', '')
-                data_prevista = row.get('Data devolução prevista', '')
-                data_efetivada = row.get('Data devolução efetivada', '')
-
-                temp_user_data[codigo]['multas'].append({
-                    'titulo': titulo,
-                    'valor': valor,
-                    'data_emprestimo': data_emprestimo,
-                    'data_prevista': data_prevista,
-                    'data_efetivada': data_efetivada
-                })
-
-                temp_user_data[codigo]['valor_total_multas'] += valor
-
-            # Se for pendência (rel76)
-            elif relatorio == 'rel76':
-                titulo = row.get('Título', '')
-
-                # Usar o nome correto da coluna conforme identificado na saída de depuração
-                data_emprestimo = row.get('Data de empréstimo', '')
-                data_prevista = row.get('Data devolução prevista', '')
-
-                temp_user_data[codigo]['pendencias'].append({
-                    'titulo': titulo,
-                    'data_emprestimo': data_emprestimo,
-                    'data_prevista': data_prevista
-                })
+        # Usuários sem email (inválidos ficam em lista própria)
+        self.users_without_email = [
+            {'codigo': usuario['codigo'], 'nome': usuario['nome']}
+            for usuario in self.person_data.values()
+            if usuario['email'] == '' and usuario['codigo'] not in codigos_invalidos
+        ]
+
+        self.codigos_por_email = {}
+        for usuario in self.person_data.values():
+            if usuario['email']:
+                self.codigos_por_email.setdefault(usuario['email'], []).append(usuario['codigo'])
 
         # Passo 2: Agrupar por email
+        self.user_data = self.group_by_email(self.person_data.values())
+        self.render_cache.clear()
+
+    def group_by_email(self, usuarios):
+        """
+        Consolida os registros por código em registros por e-mail.
+
+        Args:
+            usuarios: Registros por código (gerados por group_items_by_person)
+
+        Returns:
+            Dicionário {email: registro consolidado}
+        """
         # Se uma pessoa tiver várias contas/códigos mas o mesmo email,
         # consolidamos para enviar apenas um email
         email_grouped_data = {}
 
-        for usuario in temp_user_data.values():
+        for usuario in usuarios:
             email = usuario['email']
             if not email:  # Pular usuários sem email
                 continue
@@ -303,22 +586,118 @@ class EmailTab(BaseTab):
                     'valor_total_multas': 0.0
                 }
 
-            # Adicionar o código da pessoa à lista de códigos
-            email_grouped_data[email]['codigos'].append(usuario['codigo'])
+            # Adicionar os códigos da pessoa à lista de códigos
+            email_grouped_data[email]['codigos'].extend(usuario['codigos'])
 
-            # Adicionar multas
-            for multa in usuario['multas']:
-                email_grouped_data[email]['multas'].append(multa)
-
-            # Adicionar pendências
-            for pendencia in usuario['pendencias']:
-                email_grouped_data[email]['pendencias'].append(pendencia)
+            # Adicionar multas e pendências (partes encadeadas, sem materializar os itens)
+            email_grouped_data[email]['multas'].append(usuario['multas'])
+            email_grouped_data[email]['pendencias'].append(usuario['pendencias'])
 
             # Somar o valor total de multas
             email_grouped_data[email]['valor_total_multas'] += usuario['valor_total_multas']
 
-        # Atribuir os dados agrupados por email à variável principal
-        self.user_data = email_grouped_data
+        for registro in email_grouped_data.values():
+            registro['multas'] = LazyItems.chain(registro['multas'])
+            registro['pendencias'] = LazyItems.chain(registro['pendencias'])
+
+        return email_grouped_data
+
+    def on_ledger_changed(self, codigo, evento):
+        """Atualiza apenas a pessoa afetada por um lançamento do atendimento."""
+        canonico = self.merge_map.get(codigo, codigo)
+        anterior = self.person_data.pop(canonico, None)
+        codigos = set(anterior['codigos']) if anterior else set()
+        codigos.update({codigo, canonico})
+
+        # Reprocessar somente as linhas desta pessoa (todas, para manter a mesclagem estável)
+        linhas = pd.concat([self.ledger.rows(c, apenas_ativas=False) for c in codigos])
+        validacao = validate_emails(linhas['Email'])
+        linhas = linhas.copy()
+        linhas['Email'] = validacao['email']
+        linhas = apply_merge_map(linhas, self.merge_map)
+        linhas = linhas[self.ledger.ativo[linhas.index.to_numpy()]]
+        atual = group_items_by_person(linhas, num_shards=1).get(canonico)
+        if atual:
+            self.person_data[canonico] = atual
+
+        # Índice por e-mail
+        email_anterior = anterior['email'] if anterior else ''
+        email_atual = atual['email'] if atual else ''
+        if email_anterior and canonico in self.codigos_por_email.get(email_anterior, []):
+            self.codigos_por_email[email_anterior].remove(canonico)
+            if not self.codigos_por_email[email_anterior]:
+                del self.codigos_por_email[email_anterior]
+        if email_atual:
+            self.codigos_por_email.setdefault(email_atual, []).append(canonico)
+
+        # Listas de pessoas sem email / com email inválido
+        self.users_without_email = [user for user in self.users_without_email if user['codigo'] != canonico]
+        if atual and not email_atual:
+            self.users_without_email.append({'codigo': canonico, 'nome': atual['nome']})
+        if evento == 'email':
+            self.users_invalid_email = [user for user in self.users_invalid_email if user['codigo'] not in codigos]
+
+        # Regrupar apenas os e-mails afetados
+        user_type = self.user_type_combo.currentData()
+        for email in {email_anterior, email_atual} - {''}:
+            self.render_cache.discard_group(email)
+            grupo_anterior = self.user_data.get(email)
+            pessoas = [self.person_data[c] for c in self.codigos_por_email.get(email, [])]
+            grupo_atual = self.group_by_email(pessoas).get(email)
+            if grupo_atual:
+                self.user_data[email] = grupo_atual
+            else:
+                self.user_data.pop(email, None)
+
+            if user_type in ('sem_email', 'email_invalido'):
+                continue
+            if grupo_anterior is not None and any(user is grupo_anterior for user in self.filtered_users):
+                indice = next(i for i, user in enumerate(self.filtered_users) if user is grupo_anterior)
+                if grupo_atual and self.matches_user_type(grupo_atual, user_type):
+                    self.filtered_users[indice] = grupo_atual
+                else:
+                    del self.filtered_users[indice]
+                    if self.current_preview_index > indice:
+                        self.current_preview_index -= 1
+            elif grupo_anterior is None and grupo_atual and self.filtered_users and \
+                    self.matches_user_type(grupo_atual, user_type):
+                self.filtered_users.append(grupo_atual)
+
+        if user_type == 'sem_email':
+            self.filtered_users = self.users_without_email.copy()
+        elif user_type == 'email_invalido':
+            self.filtered_users = self.users_invalid_email.copy()
+
+        # Atualizar o preview exibido
+        if self.filtered_users:
+            self.current_preview_index = min(self.current_preview_index, len(self.filtered_users) - 1)
+            self.show_current_preview()
+            self.update_navigation_buttons()
+
+    def open_ledger_dialog(self):
+        """Abre o diálogo de atendimento para o usuário exibido no preview."""
+        user_type = self.user_type_combo.currentData()
+        if (self.ledger is None or user_type in ('sem_email', 'email_invalido') or
+                not self.filtered_users or self.current_preview_index >= len(self.filtered_users)):
+            self.show_message_box(
+                "Aviso",
+                "Gere o preview e selecione um usuário para registrar o atendimento.",
+                QMessageBox.Icon.Warning
+            )
+            return
+
+        usuario = self.filtered_users[self.current_preview_index]
+        dialog = LedgerDialog(self.ledger, usuario['codigos'], usuario['nome'], self)
+        dialog.exec()
+
+    def matches_user_type(self, user, user_type):
+        """Verifica se o usuário corresponde ao filtro selecionado."""
+        if user_type == 'all':
+            return True
+        category = self.get_user_category(user)
+        return ((user_type == 'multas' and category == 'apenas_multa') or
+                (user_type == 'pendencias' and category == 'apenas_pendencia') or
+                (user_type == 'ambos' and category == 'multa_e_pendencia'))
 
     def get_user_category(self, user_data):
         """Determina a categoria do usuário para selecionar o template correto."""
@@ -339,351 +718,124 @@ class EmailTab(BaseTab):
 
     def process_template(self, user_data):
         """Processa o template com os dados do usuário."""
+        mensagem = self.render_message(user_data)
+        return mensagem[0] if mensagem else None
+
+    def render_message(self, user_data):
+        """
+        Renderiza o e-mail do usuário nas versões HTML e texto simples.
+
+        Returns:
+            Tupla (html, texto), ou None se a categoria não tiver template
+        """
         category = self.get_user_category(user_data)
         if not category or category not in self.templates:
             return None
 
+        compilado = self.compiled_template(category)
+
+        # Mesmo conteúdo com a mesma versão do template (e no mesmo dia, pois os dias
+        # de atraso das pendências contam até hoje) reaproveita o e-mail já gerado
+        chave = (
+            content_fingerprint(
+                user_data['nome'], user_data['valor_total_multas'], user_data.get('codigos', []),
+                user_data['multas'], user_data['pendencias']
+            ),
+            compilado.versao,
+            datetime.now().date()
+        )
+        mensagem = self.render_cache.get(chave)
+        if mensagem is not None:
+            return mensagem
+
+        mensagem = self.fill_template(compilado, user_data)
+        self.render_cache.put(chave, mensagem, user_data.get('email'))
+        return mensagem
+
+    def fill_template(self, compilado, user_data):
+        """
+        Renderiza um template compilado com os dados do usuário (sem passar pelo cache).
+
+        Returns:
+            Tupla (html, texto)
+        """
+        # Calcular apenas os placeholders que o template usa
+        contexto = ResolverContext(user_data, self)
+        valores = {placeholder: PLACEHOLDERS[placeholder].resolver(contexto) for placeholder in compilado.usados}
+        return compilado.render(valores), compilado.render_text(valores)
+
+    def compiled_template(self, category):
+        """Retorna o template compilado da categoria (recompilado quando o texto muda)."""
         template = self.templates[category]
+        compilado = self.compiled_templates.get(category)
+        if compilado is not None and compilado.template == template:
+            return compilado
+
+        compilado = self.compile_template(template, category)
+        if not compilado.compiled:
+            print(f"Aviso: template '{category}' será convertido por completo a cada e-mail.")
+        self.compiled_templates[category] = compilado
+        return compilado
+
+    def compile_template(self, template, category):
+        """Compila um template com os placeholders disponíveis para a categoria."""
+        # Substituições na ordem do registro de placeholders
+        disponiveis = placeholders_for(category)
+        return CompiledTemplate(
+            template,
+            [(placeholder.nome, placeholder.remocoes) for placeholder in disponiveis],
+            listas=[placeholder.nome for placeholder in disponiveis if placeholder.lista]
+        )
 
-        # Substituir nome (comum a todos os templates)
-        template = template.replace("{NOME}", user_data['nome'].upper())
-
-        # Formatação comum dependendo da categoria
-        if category in ['apenas_multa', 'multa_e_pendencia']:
-            # Substituir valor da multa
-            template = template.replace("{VALOR_MULTA}",
-                                    f"{user_data['valor_total_multas']:.2f}".replace('.', ','))
-
-        # Template para apenas multa
-        if category == 'apenas_multa':
-            livros_multa = self.format_multas_text(user_data['multas'])
-            template = self.replace_multa_placeholders(template, livros_multa)
-
-        # Template para apenas pendências
-        elif category == 'apenas_pendencia':
-            livros_pendentes = self.format_pendencias_text(user_data['pendencias'])
-            template = self.replace_pendencia_placeholders(template, livros_pendentes)
-
-        # Template para multas e pendências
-        elif category == 'multa_e_pendencia':
-            # Substituir informações de pendências
-            livros_pendentes = self.format_pendencias_text(user_data['pendencias'])
-            template = self.replace_pendencia_placeholders(template, livros_pendentes)
-
-            # Substituir informações de multas
-            livros_multa = self.format_multas_text(user_data['multas'])
-            template = self.replace_multa_placeholders(template, livros_multa)
-
-        # Garantir que as quebras de linha estão normalizadas antes da conversão
-        template = self.normalizar_quebras_de_linha(template)
-
-        # Converter Markdown para HTML
-        try:
-            # Usar a extensão nl2br (newline to <br>) para preservar quebras de linha
-            # Isso converte quebras de linha simples em <br> no HTML resultante
-            html_content = markdown.markdown(template, extensions=['nl2br'])
-
-            # Adicionar estilos CSS para melhorar a aparência do email
-            css_styles = """
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    line-height: 1.4;
-                    margin: 0;
-                    padding: 10px;
-                }
-                p { margin: 0 0 8px 0; }
-                ul { margin: 5px 0; padding-left: 20px; }
-                li { margin-bottom: 3px; }
-                strong { font-weight: bold; }
-                a { color: #0066cc; }
-                br { line-height: 1; }
-            </style>
-            """
-
-            # Garantir que o conteúdo HTML seja renderizado corretamente com espaçamento adequado
-            html_content = f"<html><head>{css_styles}</head><body>{html_content}</body></html>"
-
-            return html_content
-        except Exception as e:
-            print(f"Erro ao converter Markdown para HTML: {e}")
-            # Fallback para o template original - substituir todas as quebras de linha por <br>
-            return f"<html><body>{template.replace('\n', '<br>')}</body></html>"
+    def sample_user(self, category):
+        """Retorna o primeiro usuário da categoria (usado como exemplo no preview dos templates)."""
+        for user in self.user_data.values():
+            if self.get_user_category(user) == category:
+                return user
+        return None
 
     def normalizar_quebras_de_linha(self, texto):
         """Normaliza as quebras de linha no texto para garantir compatibilidade."""
-        # Primeiro substituir CRLF (\r\n) por LF (\n)
-        texto = texto.replace('\r\n', '\n')
-        # Depois substituir CR (\r) sozinhos por LF (\n)
-        texto = texto.replace('\r', '\n')
-
-        # Remover a conversão especial que estava causando espaçamento excessivo
-        # texto = texto.replace('\n\n', '\n<br>\n')
-
-        return texto
+        return normalize_line_breaks(texto)
 
     def format_multas_text(self, multas):
         """Formata o texto das multas para o template."""
-        if not multas:
-            return "Nenhuma multa encontrada"
-
-        multas_text = []
-        for multa in multas:
-            titulo = multa.get('titulo', 'Item sem título')
-
-            # Verificação mais rigorosa da data de empréstimo
-            data_emp_raw = multa.get('data_emprestimo', '')
-            data_emp = 'Data não disponível'
-
-            if data_emp_raw and not pd.isna(data_emp_raw) and data_emp_raw != '':
-                data_emp = self.format_date(data_emp_raw)
-
-            # Verificação para data prevista
-            data_prev_raw = multa.get('data_prevista', '')
-            data_prev = 'Data não disponível'
-
-            if data_prev_raw and not pd.isna(data_prev_raw) and data_prev_raw != '':
-                data_prev = self.format_date(data_prev_raw)
-
-            # Verificação para data efetivada
-            data_efet_raw = multa.get('data_efetivada', '')
-            data_efet = 'Data não disponível'
-
-            if data_efet_raw and not pd.isna(data_efet_raw) and data_efet_raw != '':
-                data_efet = self.format_date(data_efet_raw)
-
-            # Se for uma chave e não tiver data efetivada, calcular a data efetivada baseada no valor da multa
-            eh_chave = multa.get('eh_chave', False) or 'Chave:' in titulo
-            if eh_chave and (not data_efet_raw or pd.isna(data_efet_raw) or data_efet_raw == ''):
-                try:
-                    # Se tiver data prevista, calcular a data efetivada
-                    if data_prev_raw and not pd.isna(data_prev_raw) and data_prev_raw != '':
-                        # Converter data prevista para objeto de data
-                        if isinstance(data_prev_raw, str):
-                            try:
-                                data_obj = datetime.strptime(data_prev_raw, "%d/%m/%Y")
-                            except ValueError:
-                                try:
-                                    data_obj = datetime.strptime(data_prev_raw, "%Y-%m-%d")
-                                except ValueError:
-                                    data_obj = None
-                        elif isinstance(data_prev_raw, datetime):
-                            data_obj = data_prev_raw
-                        else:
-                            data_obj = None
-
-                        # Se conseguiu converter, calcular a data efetivada
-                        if data_obj:
-                            valor_multa = int(multa.get('valor', 1))
-                            # Se o valor da multa for 1, adicionar 1 dia
-                            if valor_multa == 1:
-                                data_devolucao = data_obj + pd.Timedelta(days=1)
-                            else:
-                                data_devolucao = data_obj + pd.Timedelta(days=valor_multa)
-                            data_efet = data_devolucao.strftime("%d/%m/%Y")
-                except Exception as e:
-                    print(f"Erro ao calcular data efetivada: {e}")
-
-            # Calcular dias de atraso
-            dias_atraso = ''
-
-            # Caso seja uma chave, usar o valor da multa diretamente como dias de atraso
-            if eh_chave:
-                # Para chaves, usar o valor da multa como dias de atraso (R$ 1,00 por dia)
-                valor_multa = float(multa.get('valor', 0))
-                dias_atraso = str(int(valor_multa))
-            # Caso contrário, calcular normalmente pelos dias
-            elif data_prev_raw and data_efet_raw and data_efet != 'Data não disponível':
-                try:
-                    dias_atraso = str(self.calculate_days_difference(data_prev_raw, data_efet_raw))
-                except Exception as e:
-                    print(f"Erro ao calcular dias de atraso: {e}")
-
-            # Se ainda estiver vazio e temos as duas datas, tenta novamente com as strings formatadas
-            if dias_atraso == '' and data_prev != 'Data não disponível' and data_efet != 'Data não disponível':
-                try:
-                    dias_atraso = str(self.calculate_days_difference(data_prev, data_efet))
-                except Exception as e:
-                    print(f"Erro no segundo cálculo de dias de atraso: {e}")
-
-            # Se mesmo assim dias_atraso estiver vazio, calcular com as datas convertidas manualmente
-            if dias_atraso == '' and data_prev != 'Data não disponível' and data_efet != 'Data não disponível':
-                try:
-                    # Converter manualmente e garantir o formato correto
-                    data_prev_obj = None
-                    data_efet_obj = None
-
-                    # Tenta converter data_prev
-                    if isinstance(data_prev, str):
-                        try:
-                            data_prev_obj = datetime.strptime(data_prev, '%d/%m/%Y')
-                        except ValueError:
-                            pass
-
-                    # Tenta converter data_efet
-                    if isinstance(data_efet, str):
-                        try:
-                            data_efet_obj = datetime.strptime(data_efet, '%d/%m/%Y')
-                        except ValueError:
-                            pass
-
-                    # Se conseguiu converter ambas, calcula a diferença
-                    if data_prev_obj and data_efet_obj:
-                        delta = data_efet_obj - data_prev_obj
-                        dias_atraso = str(max(0, delta.days))
-                except Exception as e:
-                    print(f"Erro no terceiro cálculo de dias de atraso: {e}")
-
-            # Se ainda estiver vazio, verificar se existe o campo dias_atraso diretamente no dicionário
-            if dias_atraso == '':
-                dias_atraso = str(multa.get('dias_atraso', ''))
-
-            # Garantir que não fique vazio mesmo que falhe todo o resto
-            if dias_atraso == '':
-                # Tenta calcular os dias diretamente do valor da multa, considerando R$1,00 por dia
-                valor_multa = float(multa.get('valor', 0))
-                if valor_multa > 0:
-                    dias_atraso = str(int(valor_multa))  # Considerando R$1,00 por dia
-                else:
-                    dias_atraso = "0"  # Valor padrão se não conseguir calcular
-
-            # Montar o texto completo para este item no formato Markdown
-            item_text = (
-                f"**{titulo}**\n"
-                f"\t- Data de Empréstimo: {data_emp}\n"
-                f"\t- Data de Devolução Prevista: {data_prev}\n"
-                f"\t- Data de Devolução Efetiva: {data_efet}\n"
-                f"\t- Dias de Atraso: {dias_atraso}"
-            )
-            multas_text.append(item_text)
-
-        return "- " + "\n\n- ".join(multas_text)
+        return self.multas_item_list(multas).markdown_text()
+
+    def multas_item_list(self, multas):
+        """Monta a lista de itens com multa (título e linhas de detalhe)."""
+        # Datas e dias de atraso já vêm formatados nos itens (group_items_by_person)
+        return ItemList([
+            (multa['titulo'], [
+                f"Data de Empréstimo: {multa['texto_emprestimo']}",
+                f"Data de Devolução Prevista: {multa['texto_prevista']}",
+                f"Data de Devolução Efetiva: {multa['texto_efetivada']}",
+                f"Dias de Atraso: {multa['texto_dias_atraso']}"
+            ])
+            for multa in multas
+        ], "Nenhuma multa encontrada")
 
     def format_pendencias_text(self, pendencias):
         """Formata o texto das pendências para o template."""
-        if not pendencias:
-            return "Nenhuma pendência encontrada"
-
-        pendencias_text = []
-        for pendencia in pendencias:
-            titulo = pendencia.get('titulo', 'Item sem título')
-
-            # Verificação mais rigorosa da data de empréstimo
-            data_emp_raw = pendencia.get('data_emprestimo', '')
-            data_emp = 'Data não disponível'
-
-            if data_emp_raw and not pd.isna(data_emp_raw) and data_emp_raw != '':
-                data_emp = self.format_date(data_emp_raw)
-
-            # Verificação similar para data prevista
-            data_prev_raw = pendencia.get('data_prevista', '')
-            data_prev = 'Data não disponível'
-
-            if data_prev_raw and not pd.isna(data_prev_raw) and data_prev_raw != '':
-                data_prev = self.format_date(data_prev_raw)
-
-            # Calcular dias de atraso até hoje
-            dias_atraso = ''
-            if data_prev_raw and not pd.isna(data_prev_raw) and data_prev_raw != '':
-                hoje = datetime.now()
-                dias_atraso = str(self.calculate_days_difference(data_prev_raw, hoje))
-
-            # Montar o texto completo para este item no formato Markdown
-            item_text = (
-                f"**{titulo}**\n"
-                f"\t- Data de Empréstimo: {data_emp}\n"
-                f"\t- Data de Devolução Prevista: {data_prev}\n"
-                f"\t- Dias de Atraso: {dias_atraso}"
-            )
-            pendencias_text.append(item_text)
-
-        return "- " + "\n\n- ".join(pendencias_text)
-
-    def replace_multa_placeholders(self, template, livros_multa):
-        """Substitui os placeholders relacionados a multas no template."""
-        # Substituir a lista completa de multas no template
-        # Como agora já formatamos todas as informações no método format_multas_text,
-        # não precisamos mais substituir os placeholders individuais de DATA_EMPRESTIMO, etc.
-        template = template.replace("{LIVROS_MULTA}", livros_multa)
-
-        # Remover qualquer placeholder de multa restante
-        template = template.replace("    - Data de Empréstimo: {DATA_EMPRESTIMO}", "")
-        template = template.replace("    - Data de Devolução Prevista: {DATA_PREVISTA}", "")
-        template = template.replace("    - Data de Devolução Efetiva: {DATA_EFETIVA}", "")
-        template = template.replace("    - Dias de Atraso: {DIAS_ATRASO}", "")
-
-        return template
-
-    def replace_pendencia_placeholders(self, template, livros_pendentes):
-        """Substitui os placeholders relacionados a pendências no template."""
-        # Substituir a lista completa de pendências no template
-        # Como agora já formatamos todas as informações no método format_pendencias_text,
-        # não precisamos mais substituir os placeholders individuais de DATA_EMPRESTIMO, etc.
-        template = template.replace("{LIVROS_PENDENTES}", livros_pendentes)
-
-        # Remover qualquer placeholder de pendência restante
-        template = template.replace("    - Data de Empréstimo: {DATA_EMPRESTIMO}", "")
-        template = template.replace("    - Data de Devolução Prevista: {DATA_PREVISTA}", "")
-        template = template.replace("    - Dias de Atraso: {DIAS_ATRASO}", "")
-
-        return template
+        return self.pendencias_item_list(pendencias).markdown_text()
+
+    def pendencias_item_list(self, pendencias):
+        """Monta a lista de itens pendentes (título e linhas de detalhe)."""
+        # Datas e dias de atraso (até hoje) já vêm formatados nos itens (group_items_by_person)
+        return ItemList([
+            (pendencia['titulo'], [
+                f"Data de Empréstimo: {pendencia['texto_emprestimo']}",
+                f"Data de Devolução Prevista: {pendencia['texto_prevista']}",
+                f"Dias de Atraso: {pendencia['texto_dias_atraso']}"
+            ])
+            for pendencia in pendencias
+        ], "Nenhuma pendência encontrada")
 
     def format_date(self, date_value):
         """Formata uma data para o padrão DD/MM/YYYY."""
-        if isinstance(date_value, pd.Timestamp):
-            return date_value.strftime('%d/%m/%Y')
-        elif isinstance(date_value, datetime) or isinstance(date_value, QDate):
-            return date_value.strftime('%d/%m/%Y')
-        elif isinstance(date_value, str):
-            # Tentar converter string para data e depois formatar
-            try:
-                date_obj = datetime.strptime(date_value, '%Y-%m-%d')
-                return date_obj.strftime('%d/%m/%Y')
-            except ValueError:
-                try:
-                    date_obj = datetime.strptime(date_value, '%d/%m/%Y')
-                    return date_value  # Já está no formato correto
-                except ValueError:
-                    return date_value  # Retornar como está se não conseguir converter
-        return str(date_value)  # Fallback para qualquer outro caso
-
-    def calculate_days_difference(self, date1, date2):
-        """Calcula a diferença em dias entre duas datas."""
-        # Converter para objetos datetime
-        if isinstance(date1, str):
-            try:
-                date1 = datetime.strptime(date1, '%d/%m/%Y')
-            except ValueError:
-                try:
-                    date1 = datetime.strptime(date1, '%Y-%m-%d')
-                except ValueError:
-                    return 0
-
-        if isinstance(date2, str):
-            try:
-                date2 = datetime.strptime(date2, '%d/%m/%Y')
-            except ValueError:
-                try:
-                    date2 = datetime.strptime(date2, '%Y-%m-%d')
-                except ValueError:
-                    return 0
-
-        # Garantir que são objetos datetime
-        if not isinstance(date1, datetime):
-            if hasattr(date1, 'to_pydatetime'):
-                date1 = date1.to_pydatetime()
-            else:
-                return 0
-
-        if not isinstance(date2, datetime):
-            if hasattr(date2, 'to_pydatetime'):
-                date2 = date2.to_pydatetime()
-            else:
-                return 0
-
-        # Calcular diferença
-        delta = date2 - date1
-        return max(0, delta.days)  # Garantir que não seja negativo
+        if isinstance(date_value, QDate):
+            return date_value.toString('dd/MM/yyyy')
+        return format_date_br(date_value)
 
     def generate_preview(self):
         """Gera um preview do email para o usuário selecionado."""
@@ -704,18 +856,14 @@ class EmailTab(BaseTab):
         if user_type == 'sem_email':
             # Mostrar lista de usuários sem email
             self.filtered_users = self.users_without_email.copy() if hasattr(self, 'users_without_email') else []
+        elif user_type == 'email_invalido':
+            # Mostrar lista de usuários com email inválido
+            self.filtered_users = self.users_invalid_email.copy()
         else:
             # Filtrar os usuários de acordo com o tipo selecionado
-            for email, user in self.user_data.items():
-                # Verificar se corresponde ao tipo selecionado
-                category = self.get_user_category(user)
-                if user_type != 'all':
-                    if (user_type == 'multas' and category != 'apenas_multa') or \
-                       (user_type == 'pendencias' and category != 'apenas_pendencia') or \
-                       (user_type == 'ambos' and category != 'multa_e_pendencia'):
-                        continue
-
-                self.filtered_users.append(user)
+            self.filtered_users = [
+                user for user in self.user_data.values() if self.matches_user_type(user, user_type)
+            ]
 
         if not self.filtered_users:
             self.show_message_box(
@@ -755,6 +903,20 @@ class EmailTab(BaseTab):
             self.email_preview.setPlainText(users_text)
             
             # Desabilitar botões de navegação para pessoas sem email
+            self.prev_button.setEnabled(False)
+            self.next_button.setEnabled(False)
+        elif user_type == 'email_invalido':
+            # Exibir todas as pessoas com email inválido de uma vez
+            self.preview_info_label.setText(
+                f"Total de {len(self.filtered_users)} pessoas com email inválido (não serão notificadas)"
+            )
+
+            users_text = "Pessoas com email inválido:\n\n"
+            for i, user in enumerate(self.filtered_users, 1):
+                users_text += f"{i:3d}. Matrícula: {user['codigo']:<10} | Nome: {user['nome']} | Email: {user['email_original']}\n"
+
+            self.email_preview.setPlainText(users_text)
+
             self.prev_button.setEnabled(False)
             self.next_button.setEnabled(False)
         else:
@@ -766,10 +928,11 @@ class EmailTab(BaseTab):
                 f"{current_user['nome']} ({current_user['email']})"
             )
 
-            # Processar template
+            # Processar template (documento pré-carregado, se já estiver pronto)
             preview_html = self.process_template(current_user)
             if preview_html:
-                self.email_preview.setHtml(preview_html)
+                self.preview_prefetcher.show_html(preview_html)
+                self.preview_prefetcher.prefetch(self.filtered_users, self.current_preview_index)
             else:
                 self.email_preview.setPlainText("Não foi possível gerar o preview. Verifique se os templates estão configurados corretamente.")
 
@@ -791,8 +954,8 @@ class EmailTab(BaseTab):
         """Atualiza o estado dos botões de navegação."""
         user_type = self.user_type_combo.currentData() if hasattr(self, 'user_type_combo') else None
         
-        if user_type == 'sem_email':
-            # Para pessoas sem email, não precisamos de navegação
+        if user_type in ('sem_email', 'email_invalido'):
+            # Para pessoas sem email (ou com email inválido), não precisamos de navegação
             self.prev_button.setEnabled(False)
             self.next_button.setEnabled(False)
         else:
@@ -827,19 +990,26 @@ class EmailTab(BaseTab):
             )
             return
 
-        # Pegar os filtros
-        user_type = self.user_type_combo.currentData()
+        # Um lote interrompido pode ser retomado em vez de começar outro
+        pendente = self.outbox.unfinished_campaign()
+        if pendente:
+            escolha = QMessageBox.question(
+                self,
+                "Envio Interrompido",
+                f"Há um envio interrompido com {pendente['restantes']} emails ainda não enviados.\n\n"
+                "Deseja retomá-lo? (Não: descarta o envio interrompido e inicia um novo)",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel
+            )
+            if escolha == QMessageBox.StandardButton.Yes:
+                self.resume_email_sending()
+                return
+            if escolha != QMessageBox.StandardButton.No:
+                return
+            self.outbox.finish_campaign(pendente['id'], CAMPANHA_DESCARTADA)
+            self.update_resume_button()
 
         # Filtrar usuários
-        self.selected_users = []
-        for email, user in self.user_data.items():
-            category = self.get_user_category(user)
-            if user_type != 'all':
-                if (user_type == 'multas' and category != 'apenas_multa') or \
-                   (user_type == 'pendencias' and category != 'apenas_pendencia') or \
-                   (user_type == 'ambos' and category != 'multa_e_pendencia'):
-                    continue
-            self.selected_users.append(user)
+        self.selected_users = self.select_users()
 
         if not self.selected_users:
             self.show_message_box(
@@ -867,92 +1037,354 @@ class EmailTab(BaseTab):
         if confirm == QMessageBox.StandardButton.No:
             return
 
-        # Inicializar variáveis de controle
-        self.current_email_index = 0
-        self.enviados = 0
-        self.erros = []
-        
-        # Configurar barra de progresso
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setValue(0)
-        self.progress_bar.setMaximum(len(self.selected_users))
-        
-        # Armazenar configurações para uso no timer
-        self.remetente = remetente
-        self.senha = senha
-        self.destinatario_teste = destinatario_teste
-        self.assunto_padrao = assunto_padrao
+        # Renderizar o lote em segundo plano; o envio consome as mensagens já prontas
+        self.prerender = self.start_prerender(
+            self.selected_users, remetente, assunto_padrao, modo_teste, destinatario_teste, serializar=True
+        )
+
+        # As mensagens são gravadas na caixa de saída e enviadas a partir dela
+        campanha = self.outbox.create_campaign(len(self.selected_users), remetente, modo_teste)
+        self.start_send_worker(campanha, len(self.selected_users), remetente, senha, modo_teste, self.prerender)
+
+    def resume_email_sending(self):
+        """Retoma o envio interrompido, gerando de novo as mensagens pendentes com os dados atuais."""
+        pendente = self.outbox.unfinished_campaign()
+        if not pendente or self.send_worker is not None:
+            self.update_resume_button()
+            return
+
+        if not self.user_data:
+            self.show_message_box(
+                "Aviso",
+                "Carregue os dados antes de retomar o envio: as mensagens pendentes são geradas "
+                "de novo com os dados atuais.",
+                QMessageBox.Icon.Warning
+            )
+            return
+
+        remetente = self.config_manager.get_value('email_remetente', '')
+        senha = self.config_manager.get_value('email_senha_app', '')
+        if not remetente or not senha:
+            self.show_message_box(
+                "Configuração de Email",
+                "Configure o e-mail do remetente e a senha de app nas configurações.",
+                QMessageBox.Icon.Warning
+            )
+            return
+
+        confirm_text = (
+            f"Retomar o envio iniciado em {pendente['criada_em'].replace('T', ' ')}: "
+            f"{pendente['restantes']} de {pendente['total']} emails ainda não foram enviados.\n\n"
+            f"O MODO DE TESTE estava {'ATIVADO' if pendente['modo_teste'] else 'DESATIVADO'} nesse envio.\n\n"
+            "Os emails pendentes serão gerados de novo com os dados atuais."
+        )
+        if pendente['gravadas'] < pendente['total']:
+            confirm_text += (
+                f"\n\nA gravação do lote foi interrompida: {pendente['total'] - pendente['gravadas']} "
+                "emails não foram gravados e não serão enviados nesta retomada."
+            )
+        confirm = QMessageBox.question(
+            self,
+            "Retomar Envio",
+            confirm_text,
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if confirm == QMessageBox.StandardButton.No:
+            return
+
+        # Mensagens que estavam em envio quando o programa foi interrompido voltam à fila
+        self.outbox.recover(pendente['id'])
+        atualizadas, removidas = self.refresh_pending_messages(pendente['id'], remetente, pendente['modo_teste'])
+        print(f"Retomada: {atualizadas} emails gerados de novo, {removidas} removidos (sem itens a notificar).")
+        self.start_send_worker(pendente['id'], pendente['gravadas'], remetente, senha, pendente['modo_teste'])
+
+    def start_send_worker(self, campanha, total, remetente, senha, modo_teste, prerender=None):
+        """Prepara a interface e inicia o envio de uma campanha da caixa de saída."""
+        self.campanha = campanha
         self.modo_teste = modo_teste
-        
-        # Desabilitar botões durante o envio
+
+        # Enviar em segundo plano; progresso e resumo chegam por sinais
+        self.send_worker = SendWorker(
+            self.outbox, campanha, total, remetente, senha, prerender=prerender,
+            taxa=float(self.config_manager.get_value('taxa_envio', TAXA_INICIAL)),
+            conexoes=int(self.config_manager.get_value('smtp_conexoes', CONEXOES_PADRAO)), parent=self
+        )
+        self.send_worker.progress.connect(self.on_send_progress)
+        self.send_worker.render_failed.connect(self.on_render_failed)
+        self.send_worker.finished.connect(self.finish_email_sending)
+        self.render_failures_reported = False
+
+        # Configurar barra de progresso (uma campanha retomada começa do ponto em que parou)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(self.send_worker.processados)
+        self.pipeline_label.setText("")
+        self.pipeline_label.setVisible(True)
+
+        # Desabilitar as ações que conflitam com o envio (o preview continua disponível)
         self.send_button.setEnabled(False)
         self.test_button.setEnabled(False)
-        self.preview_button.setEnabled(False)
-        
-        # Iniciar o envio do primeiro email
-        self.send_next_email()
-
-    def send_next_email(self):
-        """Envia o próximo email da lista com delay."""
-        if self.current_email_index >= len(self.selected_users):
-            # Finalizar envio
-            self.finish_email_sending()
+        self.export_button.setEnabled(False)
+        self.resume_button.setVisible(False)
+        self.cancel_button.setVisible(True)
+
+        self.send_worker.start()
+
+    def open_dead_letters(self):
+        """Abre a lista de falhas de envio (reenvio disponível fora de um envio)."""
+        dialog = DeadLetterDialog(self.outbox, permitir_reenvio=self.send_worker is None, parent=self)
+        dialog.exec()
+        if dialog.reenviadas:
+            self.update_resume_button()
+
+    def update_resume_button(self):
+        """Exibe o botão de retomada quando há um envio interrompido na caixa de saída."""
+        pendente = self.outbox.unfinished_campaign()
+        self.resume_button.setVisible(bool(pendente) and self.send_worker is None)
+        if pendente:
+            self.resume_button.setText(f"Retomar Envio ({pendente['restantes']} restantes)")
+
+    def select_users(self):
+        """Retorna os usuários que atendem ao filtro de tipo selecionado."""
+        user_type = self.user_type_combo.currentData()
+
+        selecionados = []
+        for email, user in self.user_data.items():
+            category = self.get_user_category(user)
+            if user_type != 'all':
+                if (user_type == 'multas' and category != 'apenas_multa') or \
+                   (user_type == 'pendencias' and category != 'apenas_pendencia') or \
+                   (user_type == 'ambos' and category != 'multa_e_pendencia'):
+                    continue
+            selecionados.append(user)
+        return selecionados
+
+    def start_prerender(self, usuarios, remetente, assunto, modo_teste, destinatario_teste, serializar=False):
+        """
+        Compila os templates usados e inicia a preparação antecipada do lote.
+
+        As threads de renderização também montam as mensagens MIME (e, para o
+        envio, já as serializam para a caixa de saída), de modo que o envio (ou
+        a exportação) só precisa transmiti-las.
+        """
+        # Compilar os templates antes de distribuir a renderização entre as threads
+        for category in {self.get_user_category(user) for user in usuarios}:
+            if category in self.templates:
+                self.compiled_template(category)
+
+        def preparar(user):
+            return self.prepare_message(user, remetente, assunto, modo_teste, destinatario_teste, serializar)
+
+        return PreRenderer(preparar, usuarios).start()
+
+    def prepare_message(self, user, remetente, assunto, modo_teste, destinatario_teste, serializar=False):
+        """Renderiza o e-mail do usuário e monta a mensagem MIME (None se não houver template)."""
+        mensagem = self.render_message(user)
+        if not mensagem:
+            return None
+        html, texto = mensagem
+        mensagem = build_message(
+            remetente, user['email'], assunto, html, texto,
+            modo_teste=modo_teste, destinatario_teste=destinatario_teste
+        )
+        return mensagem.as_bytes() if serializar else mensagem
+
+    def refresh_pending_messages(self, campanha, remetente, modo_teste):
+        """
+        Gera de novo, com os dados atuais, as mensagens pendentes de uma campanha retomada.
+
+        Dias de atraso e lançamentos do atendimento (devoluções, pagamentos)
+        podem ter mudado desde a gravação; mensagens de quem não tem mais itens
+        a notificar deixam de ser enviadas.
+
+        Returns:
+            Tupla (mensagens atualizadas, mensagens removidas)
+        """
+        destinatario_teste = self.config_manager.get_value('email_destinatario_padrao', remetente)
+        assunto = self.config_manager.get_value('email_assunto_padrao', 'Notificação da Biblioteca')
+        mensagens = []
+        removidas = 0
+        for mensagem_id, email in self.outbox.pending(campanha):
+            user = self.user_data.get(email)
+            conteudo = None
+            if user is not None:
+                try:
+                    conteudo = self.prepare_message(user, remetente, assunto, modo_teste, destinatario_teste, True)
+                except Exception as e:
+                    print(f"Erro ao gerar novamente o email de {email}: {e}")
+            if conteudo is None:
+                removidas += 1
+            mensagens.append((mensagem_id, conteudo, f"{email}: não enviado na retomada (sem itens a notificar)"))
+        self.outbox.refresh(mensagens)
+        return len(mensagens) - removidas, removidas
+
+    def export_emails(self):
+        """Grava em disco (mbox ou .eml) os emails que seriam enviados, sem enviá-los."""
+        if not self.user_data:
+            self.show_message_box(
+                "Aviso",
+                "Não há dados de usuários para exportar. Carregue os dados primeiro.",
+                QMessageBox.Icon.Warning
+            )
             return
-            
-        user = self.selected_users[self.current_email_index]
-        email_content = self.process_template(user)
-        assunto = self.assunto_padrao
-        destinatario = user['email']
-        
-        # Enviar email
-        ok, msg = send_email(
-            self.remetente, 
-            self.senha, 
-            destinatario, 
-            assunto, 
-            email_content, 
-            modo_teste=self.modo_teste, 
-            destinatario_teste=self.destinatario_teste
+
+        usuarios = self.select_users()
+        if not usuarios:
+            self.show_message_box(
+                "Aviso",
+                "Não foi encontrado nenhum usuário que atenda aos filtros para exportar emails.",
+                QMessageBox.Icon.Warning
+            )
+            return
+
+        filtro_mbox = "Arquivo mbox (*.mbox)"
+        filtro_eml = "Pasta de arquivos .eml (*)"
+        destino, filtro = QFileDialog.getSaveFileName(
+            self, "Exportar Emails", "emails.mbox", f"{filtro_mbox};;{filtro_eml}"
         )
-        
-        if ok:
-            self.enviados += 1
-        else:
-            self.erros.append(msg)
-        
-        # Atualizar progresso
-        self.progress_bar.setValue(self.current_email_index + 1)
-        
-        # Próximo email
-        self.current_email_index += 1
-        
-        # Agendar próximo envio com delay de 0,5 segundos
-        if self.current_email_index < len(self.selected_users):
-            self.email_timer.start(500)  # 0,5 segundos de delay
+        if not destino:
+            return
+        formato = FORMATO_EML if filtro == filtro_eml else FORMATO_MBOX
+
+        # As mesmas configurações usadas no envio
+        remetente = self.config_manager.get_value('email_remetente', '')
+        destinatario_teste = self.config_manager.get_value('email_destinatario_padrao', remetente)
+        assunto = self.config_manager.get_value('email_assunto_padrao', 'Notificação da Biblioteca')
+        modo_teste = self.config_manager.get_value('modo_teste', True)
+
+        prerender = self.start_prerender(usuarios, remetente, assunto, modo_teste, destinatario_teste)
+
+        def mensagens():
+            """Mensagens MIME na ordem do lote, à medida que ficam prontas."""
+            while (resultado := prerender.get()) is not None:
+                if resultado.erro is None:
+                    yield resultado.item['email'], resultado.conteudo
+
+        try:
+            quantidade = export_messages(mensagens(), destino, formato)
+        except OSError as e:
+            self.show_message_box("Erro na Exportação", f"Não foi possível gravar os emails: {e}", QMessageBox.Icon.Critical)
+            return
+        finally:
+            prerender.cancel()
+
+        resumo = f"Foram exportados {quantidade} emails para:\n{destino}"
+        if modo_teste:
+            resumo += "\n\n(Modo de Teste: endereçados ao destinatário de teste)"
+        if prerender.erros:
+            falhas = "\n".join(
+                f"{resultado.item['email']}: {resultado.erro}" for resultado in prerender.erros[:10]
+            )
+            resumo += f"\n\nNão foi possível gerar {len(prerender.erros)} emails:\n{falhas}"
+        self.show_message_box(
+            "Exportação Concluída",
+            resumo,
+            QMessageBox.Icon.Information if quantidade else QMessageBox.Icon.Warning
+        )
+
+    def on_send_progress(self, processados, total):
+        """Atualiza a barra de progresso e as métricas do envio."""
+        self.progress_bar.setValue(processados)
+        if self.send_worker is not None:
+            self.pipeline_label.setText(self.pipeline_summary())
+
+    def on_render_failed(self, falhas):
+        """
+        Informa os primeiros e-mails que não puderam ser gerados, sem interromper o envio.
+
+        O envio dos demais continua enquanto a pergunta é exibida; erros
+        seguintes aparecem apenas nas métricas e no resumo final.
+        """
+        if self.render_failures_reported or self.send_worker is None:
+            return
+        self.render_failures_reported = True
+        confirm = QMessageBox.question(
+            self,
+            "Erros na Geração dos Emails",
+            "Não foi possível gerar alguns emails:\n\n" + "\n".join(falhas[:10]) + "\n\n"
+            "O envio dos demais continua. Deseja cancelar o envio? (Ele poderá ser retomado depois.)",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if confirm == QMessageBox.StandardButton.Yes:
+            self.cancel_email_sending()
+
+    def pipeline_summary(self):
+        """Resumo da vazão da renderização e do envio, da ocupação da fila e das taxas por domínio."""
+        if self.prerender is not None:
+            resumo = format_metrics(self.prerender.metricas, self.send_worker.metricas, self.send_worker.metricas_fila)
         else:
-            # Último email enviado, finalizar
-            self.finish_email_sending()
+            # Campanha retomada: as mensagens já estavam gravadas
+            resumo = f"Envio: {self.send_worker.metricas.throughput():.1f}/s"
+        limitador = self.send_worker.limitador
+        if limitador.baldes:
+            resumo += f"\nTaxas: {limitador.describe()}"
+        if limitador.limitacoes:
+            resumo += f" · Limitações do servidor: {limitador.limitacoes}"
+        if self.send_worker.reagendamentos:
+            resumo += f" · Novas tentativas agendadas: {self.send_worker.reagendamentos}"
+        if self.prerender is not None and self.prerender.erros:
+            resumo += f" · Erros de geração: {len(self.prerender.erros)}"
+        return resumo
+
+    def cancel_email_sending(self):
+        """Interrompe o envio em andamento depois da mensagem atual."""
+        if self.send_worker is not None:
+            self.cancel_button.setEnabled(False)
+            self.send_worker.cancel()
+
+    def finish_email_sending(self, enviados, erros):
+        """Finaliza o processo de envio de emails (resultado do SendWorker)."""
+        self.enviados = enviados
+        self.erros = erros
+        cancelado = self.send_worker is not None and self.send_worker.cancelled
+        erro_fatal = self.send_worker.erro_fatal if self.send_worker is not None else None
+        if erro_fatal:
+            # A falha da sessão é informada à parte, não como erro de uma mensagem
+            self.erros = [erro for erro in erros if erro != erro_fatal]
+        if self.send_worker is not None:
+            print(f"Métricas do envio: {self.pipeline_summary()}")
+        self.send_worker = None
+
+        # A campanha é encerrada quando não restam mensagens; senão, pode ser retomada
+        restantes = 0
+        if self.campanha is not None:
+            contagem = self.outbox.counts(self.campanha)
+            restantes = contagem[ESTADO_PENDENTE] + contagem[ESTADO_ENVIANDO]
+            if not restantes:
+                self.outbox.finish_campaign(self.campanha)
+            self.campanha = None
+
+        # Encerrar a renderização antecipada
+        if self.prerender is not None:
+            self.prerender.cancel()
+            self.prerender = None
 
-    def finish_email_sending(self):
-        """Finaliza o processo de envio de emails."""
-        # Parar timer
-        self.email_timer.stop()
-        
         # Reabilitar botões
         self.send_button.setEnabled(True)
         self.test_button.setEnabled(True)
-        self.preview_button.setEnabled(True)
-        
+        self.export_button.setEnabled(True)
+        self.cancel_button.setVisible(False)
+        self.cancel_button.setEnabled(True)
+        self.update_resume_button()
+
         # Ocultar barra de progresso
         self.progress_bar.setVisible(False)
-        
+        self.pipeline_label.setVisible(False)
+
         # Mostrar resumo
         resumo = f"Foram enviados {self.enviados} emails."
         if self.modo_teste:
             resumo += " (Modo de Teste)"
+        if erro_fatal:
+            resumo += f"\n\n{erro_fatal}\nConfira a conexão com a internet, o e-mail do remetente e a senha de app nas configurações."
+        elif cancelado:
+            resumo += "\n\nO envio foi cancelado."
+        if restantes:
+            resumo += f"\n\n{restantes} emails não foram enviados e podem ser enviados com \"Retomar Envio\"."
 
         if self.erros:
             resumo += f"\n\nOcorreram erros em {len(self.erros)} envios:\n" + "\n".join(self.erros)
+            resumo += "\n\nAs mensagens que falharam podem ser reenviadas em \"Falhas de Envio\"."
         
         self.show_message_box(
             "Envio de Emails Concluído",
@@ -977,7 +1409,19 @@ class EmailTab(BaseTab):
                 QMessageBox.Icon.Warning
             )
             return
-        ok, msg = send_email(remetente, senha, destinatario_teste, assunto, corpo, modo_teste=True, destinatario_teste=destinatario_teste)
+
+        def enviar():
+            """Envia o teste (thread de trabalho) e devolve o resultado por sinal."""
+            ok, msg = send_email(remetente, senha, destinatario_teste, assunto, corpo, modo_teste=True, destinatario_teste=destinatario_teste)
+            self.test_email_finished.emit(ok, msg, destinatario_teste)
+
+        # A conexão SMTP é feita fora do thread da interface
+        self.test_button.setEnabled(False)
+        threading.Thread(target=enviar, name='email-teste', daemon=True).start()
+
+    def on_test_email_finished(self, ok, msg, destinatario_teste):
+        """Exibe o resultado do e-mail de teste."""
+        self.test_button.setEnabled(self.send_worker is None)
         if ok:
             self.show_message_box("Teste de Email", f"Email de teste enviado para {destinatario_teste}.", QMessageBox.Icon.Information)
         else:
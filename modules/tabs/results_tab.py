@@ -1,16 +1,20 @@
 from PyQt6.QtWidgets import (
     QLabel, QVBoxLayout, QWidget, QFrame, QTextBrowser,
     QHBoxLayout, QToolButton, QScrollArea, QPushButton,
-    QGridLayout, QSizePolicy
+    QGridLayout, QSizePolicy, QDialog, QComboBox, QTextEdit,
+    QTableWidget, QTableWidgetItem
 )
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtCore import pyqtSignal, Qt, QRectF
 from PyQt6.QtGui import QIcon, QFont, QColor
-from PyQt6.QtGui import QPalette
+from PyQt6.QtGui import QPalette, QPainter, QPixmap
 import pandas as pd
 
 from modules.tabs.base_tab import BaseTab
 from modules.styles_fix import StyleManager, AppColors
-from modules.data_processor import categorize_users
+from modules.data_processor import categorize_users, compute_aging_histograms, data_fingerprint
+from modules.sql_store import DESCRICAO_VIEWS
+from modules.date_utils import format_date_column
+from modules.email_validation import validate_emails, INVALIDO, CORRIGIVEL
 
 class ExpandableCard(QFrame):
     """Widget de card expansível para exibir estatísticas."""
@@ -105,12 +109,193 @@ class StatisticsLabel(QLabel):
         self.setFont(font)
         self.setWordWrap(True)
 
+class HistogramChart(QWidget):
+    """Gráfico de barras leve desenhado com QPainter.
+
+    O desenho é feito uma única vez em um QPixmap, guardado em um cache
+    compartilhado indexado pela impressão digital dos dados e pelo tamanho
+    do widget. Recriar o dashboard com os mesmos dados não redesenha o gráfico.
+    """
+
+    # Cache compartilhado entre instâncias: (chave, largura, altura, dpr) -> QPixmap
+    _pixmap_cache = {}
+    MAX_CACHE = 16
+
+    def __init__(self, labels, series, cache_key, value_format=str, parent=None):
+        super().__init__(parent)
+        self.labels = labels
+        self.series = series  # Lista de tuplas (nome, contagens, QColor)
+        self.cache_key = cache_key
+        self.value_format = value_format  # Formatação do valor exibido acima das barras
+        self.setMinimumHeight(180)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+
+    def paintEvent(self, event):
+        dpr = self.devicePixelRatioF()
+        key = (self.cache_key, self.width(), self.height(), dpr)
+        pixmap = self._pixmap_cache.get(key)
+        if pixmap is None:
+            pixmap = self.render_pixmap(dpr)
+            if len(self._pixmap_cache) >= self.MAX_CACHE:
+                self._pixmap_cache.pop(next(iter(self._pixmap_cache)))
+            self._pixmap_cache[key] = pixmap
+
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, pixmap)
+        painter.end()
+
+    def render_pixmap(self, dpr):
+        """Desenha o gráfico completo em um QPixmap."""
+        pixmap = QPixmap(int(self.width() * dpr), int(self.height() * dpr))
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(AppColors.CARD)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        metrics = painter.fontMetrics()
+        line_height = metrics.height()
+        left, right = 10, 10
+        top = line_height + 10  # Espaço para a legenda
+        bottom = line_height + 8  # Espaço para os rótulos das faixas
+        plot = QRectF(left, top, self.width() - left - right, self.height() - top - bottom)
+
+        # Legenda
+        x = left
+        for name, _, color in self.series:
+            painter.fillRect(QRectF(x, 4, 10, 10), color)
+            painter.setPen(AppColors.TEXT)
+            painter.drawText(int(x + 14), 4 + metrics.ascent() - 2, name)
+            x += 24 + metrics.horizontalAdvance(name)
+
+        # Eixo base
+        painter.setPen(AppColors.BORDER)
+        painter.drawLine(int(plot.left()), int(plot.bottom()), int(plot.right()), int(plot.bottom()))
+
+        max_value = max((max(counts) for _, counts, _ in self.series if counts), default=0)
+        if not self.labels or max_value <= 0 or plot.height() <= line_height:
+            painter.setPen(AppColors.TEXT_LIGHT)
+            painter.drawText(plot, Qt.AlignmentFlag.AlignCenter, "Sem dados")
+            painter.end()
+            return pixmap
+
+        group_width = plot.width() / len(self.labels)
+        bar_width = max(2.0, (group_width * 0.7) / max(1, len(self.series)))
+        bar_area = plot.height() - line_height  # Reserva espaço para o valor acima da barra
+
+        for i, label in enumerate(self.labels):
+            group_left = plot.left() + i * group_width + (group_width - bar_width * len(self.series)) / 2
+
+            for j, (_, counts, color) in enumerate(self.series):
+                value = counts[i] if i < len(counts) else 0
+                height = bar_area * value / max_value
+                bar = QRectF(group_left + j * bar_width, plot.bottom() - height, bar_width - 1, height)
+                painter.fillRect(bar, color)
+
+                if value:
+                    painter.setPen(AppColors.TEXT)
+                    painter.drawText(
+                        QRectF(bar.left() - 20, bar.top() - line_height, bar.width() + 40, line_height),
+                        Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignBottom,
+                        self.value_format(value)
+                    )
+
+            painter.setPen(AppColors.TEXT_LIGHT)
+            painter.drawText(
+                QRectF(plot.left() + i * group_width, plot.bottom() + 2, group_width, line_height),
+                Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop,
+                metrics.elidedText(label, Qt.TextElideMode.ElideRight, int(group_width))
+            )
+
+        painter.end()
+        return pixmap
+
+class SqlQueryDialog(QDialog):
+    """Diálogo para executar consultas na base analítica SQLite."""
+
+    MAX_LINHAS = 1000  # Limite de linhas exibidas na tabela
+
+    def __init__(self, analytics_store, parent=None):
+        super().__init__(parent)
+        self.analytics_store = analytics_store
+        self.setWindowTitle("Consultas de Conciliação (SQL)")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+
+        # Seleção rápida das views de conciliação
+        view_container = QWidget()
+        view_layout = QHBoxLayout(view_container)
+        view_layout.setContentsMargins(0, 0, 0, 0)
+        view_layout.addWidget(QLabel("View:"))
+
+        self.view_combo = QComboBox()
+        for nome in analytics_store.view_names():
+            self.view_combo.addItem(f"{DESCRICAO_VIEWS.get(nome, nome)} ({nome})", nome)
+        self.view_combo.currentIndexChanged.connect(self.select_view)
+        view_layout.addWidget(self.view_combo, 1)
+        layout.addWidget(view_container)
+
+        self.sql_edit = QTextEdit()
+        self.sql_edit.setMaximumHeight(120)
+        layout.addWidget(self.sql_edit)
+
+        self.run_button = QPushButton("Executar Consulta")
+        StyleManager.configure_button(self.run_button, 'primary')
+        self.run_button.clicked.connect(self.run_query)
+        layout.addWidget(self.run_button)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.result_table = QTableWidget()
+        layout.addWidget(self.result_table, 1)
+
+        self.select_view()
+
+    def select_view(self):
+        """Preenche o editor com a consulta da view selecionada e a executa."""
+        nome = self.view_combo.currentData()
+        if nome:
+            self.sql_edit.setPlainText(f"SELECT * FROM {nome}")
+            self.run_query()
+
+    def run_query(self):
+        """Executa a consulta do editor e exibe o resultado."""
+        try:
+            resultado = self.analytics_store.query(self.sql_edit.toPlainText())
+        except Exception as e:
+            self.status_label.setText(f"Erro na consulta: {e}")
+            return
+
+        exibidas = resultado.head(self.MAX_LINHAS)
+        self.result_table.clear()
+        self.result_table.setColumnCount(len(exibidas.columns))
+        self.result_table.setRowCount(len(exibidas))
+        self.result_table.setHorizontalHeaderLabels([str(coluna) for coluna in exibidas.columns])
+
+        for i, linha in enumerate(exibidas.itertuples(index=False)):
+            for j, valor in enumerate(linha):
+                texto = "" if valor is None or (isinstance(valor, float) and pd.isna(valor)) else str(valor)
+                self.result_table.setItem(i, j, QTableWidgetItem(texto))
+
+        self.status_label.setText(
+            f"{len(resultado)} linha(s)" +
+            (f" (exibindo as primeiras {self.MAX_LINHAS})" if len(resultado) > self.MAX_LINHAS else "")
+        )
+
 class ResultsTab(BaseTab):
     """Aba para exibição dos resultados da unificação dos relatórios."""
 
     def __init__(self, parent=None):
         self.unified_data = None
+        self.analytics_store = None  # Base SQLite com as views de conciliação
+        self.history_store = None  # Histórico diário para as tendências
         self.cards = {}  # Armazena referências aos cards criados
+        self.histograms = None  # Histogramas calculados para os dados atuais
+        self.histograms_fingerprint = None  # Impressão digital dos dados usados nos histogramas
+        self.ledger = None  # Livro de lançamentos do atendimento
+        self.ledger_labels = {}  # Rótulos de valor do card de situação atual
         super().__init__(parent)
 
     def setup_ui(self):
@@ -147,11 +332,41 @@ class ResultsTab(BaseTab):
         # Criar mensagem de boas-vindas
         self.show_welcome_message()
 
-    def update_data(self, unified_data):
+    def update_data(self, unified_data, analytics_store=None, history_store=None, ledger=None):
         """Atualiza os dados exibidos na aba com o dataframe unificado."""
         self.unified_data = unified_data
+        if analytics_store is not None:
+            self.analytics_store = analytics_store
+        if history_store is not None:
+            self.history_store = history_store
+        if ledger is not None:
+            if self.ledger is not None:
+                self.ledger.remove_listener(self.on_ledger_changed)
+            self.ledger = ledger
+            self.ledger.add_listener(self.on_ledger_changed)
         self.display_unified_results()
 
+    def ledger_statistics(self):
+        """Estatísticas do card de situação atual, a partir do resumo incremental do livro."""
+        resumo = self.ledger.summary()
+        return [
+            ("Pessoas com itens em aberto:", str(resumo['pessoas'])),
+            ("Apenas multa:", str(resumo['apenas_multa'])),
+            ("Apenas pendência:", str(resumo['apenas_pendencia'])),
+            ("Multa e pendência:", str(resumo['multa_e_pendencia'])),
+            ("Sem e-mail:", str(resumo['sem_email'])),
+            ("Multas em aberto:", str(resumo['qtd_multas'])),
+            ("Pendências em aberto:", str(resumo['qtd_pendencias'])),
+            ("Valor em aberto:", f"R$ {resumo['valor_multas']:.2f}"),
+            ("Atualizações no atendimento:", str(resumo['atualizacoes']))
+        ]
+
+    def on_ledger_changed(self, codigo, evento):
+        """Atualiza apenas os valores do card de situação atual após um lançamento."""
+        for label, value in self.ledger_statistics():
+            if label in self.ledger_labels:
+                self.ledger_labels[label].setText(value)
+
     def display_unified_results(self):
         """Exibe os resultados da unificação usando widgets nativos"""
         if self.unified_data is None:
@@ -203,12 +418,20 @@ class ResultsTab(BaseTab):
         self.dashboard_layout.addWidget(rel76_card, 0, 1)
         self.cards['rel76'] = rel76_card
 
+        # Validação dos e-mails (pessoas distintas por situação)
+        validacao = validate_emails(self.unified_data['Email'])
+        codigos = self.unified_data['Código da pessoa']
+        emails_invalidos = codigos[validacao['status'].eq(INVALIDO)].nunique()
+        emails_corrigidos = codigos[validacao['status'].eq(CORRIGIVEL)].nunique()
+
         # Card Pessoas Sem Email
         sem_email_card = self.create_card("Pessoas Sem Email", "👤", AppColors.ACCENT)
         sem_email_content = self.create_statistics_widget([
             ("Total de pessoas sem email:", str(len(categories['sem_email']['pessoas']))),
             ("Pessoas do rel86 sem email:", str(len(categories['rel86']['pessoas_sem_email']))),
-            ("Pessoas do rel76 sem email:", str(len(categories['rel76']['pessoas_sem_email'])))
+            ("Pessoas do rel76 sem email:", str(len(categories['rel76']['pessoas_sem_email']))),
+            ("Pessoas com email inválido:", str(emails_invalidos)),
+            ("Pessoas com email corrigido:", str(emails_corrigidos))
         ])
         sem_email_card.add_content(sem_email_content)
         self.dashboard_layout.addWidget(sem_email_card, 1, 0)
@@ -224,14 +447,113 @@ class ResultsTab(BaseTab):
         self.dashboard_layout.addWidget(chaves_card, 1, 1)
         self.cards['chaves'] = chaves_card
 
+        # Histogramas de atraso e de multas (recalculados apenas se os dados mudarem)
+        fingerprint = data_fingerprint(self.unified_data)
+        if fingerprint != self.histograms_fingerprint:
+            self.histograms = compute_aging_histograms(self.unified_data)
+            self.histograms_fingerprint = fingerprint
+
+        atraso = self.histograms['atraso']
+        atraso_card = self.create_card("Distribuição de Atraso", "⏱️", AppColors.INFO)
+        atraso_card.add_content(HistogramChart(
+            atraso['rotulos'],
+            [
+                ("Multas (86)", atraso['rel86'], AppColors.MULTAS),
+                ("Pendências (76)", atraso['rel76'], AppColors.PENDENCIAS)
+            ],
+            cache_key=(fingerprint, 'atraso')
+        ))
+        self.dashboard_layout.addWidget(atraso_card, 2, 0)
+        self.cards['atraso'] = atraso_card
+
+        multas = self.histograms['multas']
+        multas_card = self.create_card("Distribuição de Multas (Relatório 86)", "💰", AppColors.MULTAS)
+        multas_card.add_content(HistogramChart(
+            multas['rotulos'],
+            [("Itens com multa", multas['rel86'], AppColors.MULTAS)],
+            cache_key=(fingerprint, 'multas')
+        ))
+        self.dashboard_layout.addWidget(multas_card, 2, 1)
+        self.cards['multas'] = multas_card
+
+        # Card de situação atual (atualizado a cada lançamento do atendimento)
+        if self.ledger is not None:
+            situacao_card = self.create_card("Situação Atual (Atendimento)", "🧾", AppColors.ACCENT_DARK)
+            self.ledger_labels = {}
+            situacao_card.add_content(self.create_statistics_widget(self.ledger_statistics(), self.ledger_labels))
+            self.dashboard_layout.addWidget(situacao_card, 3, 0, 1, 2)
+            self.cards['situacao'] = situacao_card
+
+        # Card de conciliação com as views da base SQLite
+        if self.analytics_store is not None:
+            contagens = self.analytics_store.get_view_counts()
+            conciliacao_card = self.create_card("Conciliação (SQL)", "🗄️", AppColors.PRIMARY)
+            conciliacao_card.add_content(self.create_statistics_widget([
+                (f"{DESCRICAO_VIEWS.get(nome, nome)}:", str(quantidade))
+                for nome, quantidade in contagens.items()
+            ]))
+
+            query_button = QPushButton("Consultar SQL...")
+            StyleManager.configure_button(query_button, 'secondary')
+            query_button.clicked.connect(self.open_sql_dialog)
+            conciliacao_card.add_content(query_button)
+
+            self.dashboard_layout.addWidget(conciliacao_card, 4, 0, 1, 2)
+            self.cards['conciliacao'] = conciliacao_card
+
+        # Card de tendências com os totais diários do histórico
+        if self.history_store is not None:
+            historico_card = self.create_history_card()
+            if historico_card is not None:
+                self.dashboard_layout.addWidget(historico_card, 5, 0, 1, 2)
+                self.cards['historico'] = historico_card
+
+    def create_history_card(self, dias=30):
+        """Cria o card com a evolução dos totais diários registrados no histórico."""
+        inicio = pd.Timestamp.now().normalize() - pd.Timedelta(days=dias)
+        totais = self.history_store.get_daily_totals(inicio=inicio)
+        if totais.empty:
+            return None
+
+        atual = totais.iloc[-1]
+        stats = [
+            ("Dias registrados:", str(len(totais))),
+            ("Valor total de multas:", f"R$ {atual['valor_total_multas']:.2f}"),
+            ("Pessoas com pendências:", str(atual['pessoas']))
+        ]
+        if len(totais) > 1:
+            anterior = totais.iloc[-2]
+            variacao = atual['valor_total_multas'] - anterior['valor_total_multas']
+            stats.append(("Variação do valor:", f"{'+' if variacao >= 0 else '-'}R$ {abs(variacao):.2f}"))
+            stats.append(("Variação de pessoas:", f"{int(atual['pessoas'] - anterior['pessoas']):+d}"))
+
+        historico_card = self.create_card(f"Histórico (últimos {dias} dias)", "📈", AppColors.PRIMARY_DARK)
+        historico_card.add_content(self.create_statistics_widget(stats))
+
+        rotulos = format_date_column(totais['data'], '%d/%m').tolist()
+        historico_card.add_content(HistogramChart(
+            rotulos,
+            [("Valor total de multas (R$)", totais['valor_total_multas'].round(2).tolist(), AppColors.MULTAS)],
+            cache_key=('historico', tuple(totais['data']), tuple(totais['valor_total_multas'])),
+            value_format=lambda valor: f"{valor:.0f}"
+        ))
+        return historico_card
+
+    def open_sql_dialog(self):
+        """Abre o diálogo de consultas na base analítica."""
+        if self.analytics_store is None:
+            return
+        dialog = SqlQueryDialog(self.analytics_store, self)
+        dialog.exec()
+
     def create_card(self, title, icon, bg_color):
         """Cria um card expansível"""
         card = ExpandableCard(title, icon, bg_color)
         card.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
         return card
 
-    def create_statistics_widget(self, stats_data):
-        """Cria um widget com estatísticas formatadas"""
+    def create_statistics_widget(self, stats_data, value_labels=None):
+        """Cria um widget com estatísticas formatadas (value_labels recebe os rótulos de valor)"""
         widget = QWidget()
         layout = QVBoxLayout(widget)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -254,6 +576,8 @@ class ResultsTab(BaseTab):
 
             row_layout.addWidget(label_widget)
             row_layout.addWidget(value_widget, 1)
+            if value_labels is not None:
+                value_labels[label] = value_widget
 
             layout.addWidget(row_widget)
 
@@ -1,18 +1,30 @@
 from PyQt6.QtWidgets import (
     QLabel, QVBoxLayout, QWidget, QFrame, QTextEdit, QPushButton,
-    QHBoxLayout, QMessageBox, QTabWidget, QGroupBox
+    QHBoxLayout, QMessageBox, QTabWidget, QGroupBox, QSplitter
 )
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtCore import pyqtSignal, Qt, QTimer
 import os
+from html import escape
 
 from modules.tabs.base_tab import BaseTab
 from modules.styles_fix import StyleManager, AppColors
 from modules.config_manager import ConfigManager
+from modules.placeholders import PLACEHOLDERS, validate_template
 
 
 class TemplateTab(BaseTab):
     """Aba para configuração de templates de email para notificações."""
 
+    # Nomes das categorias exibidos nas mensagens
+    NOMES_CATEGORIAS = {
+        'apenas_multa': "Apenas Multa",
+        'apenas_pendencia': "Apenas Pendência",
+        'multa_e_pendencia': "Multa e Pendência"
+    }
+
+    # Pausa na digitação (ms) antes de atualizar o preview
+    ATRASO_PREVIEW = 400
+
     # Sinais específicos desta aba
     templates_updated = pyqtSignal(dict)  # Dicionário com todos os templates
 
@@ -23,6 +35,8 @@ class TemplateTab(BaseTab):
             'apenas_pendencia': '',
             'multa_e_pendencia': ''
         }
+        self.preview_source = None  # Aba de e-mails (usuários de exemplo e renderização)
+        self.preview_compilados = {}  # Categoria -> template compilado exibido no preview
         super().__init__(parent)
         self.load_templates()
 
@@ -54,17 +68,15 @@ class TemplateTab(BaseTab):
         help_title = QLabel("<b>Tags Disponíveis:</b>")
         help_layout.addWidget(help_title)
 
-        tags_text = QLabel(
-            "<b>{NOME}</b>: Nome do usuário<br>"
-            "<b>{VALOR_MULTA}</b>: Valor total das multas<br>"
-            "<b>{LIVROS_MULTA}</b>: Lista de itens com multa<br>"
-            "<b>{LIVROS_PENDENTES}</b>: Lista de itens pendentes<br>"
-        )
+        tags_text = QLabel("".join(
+            f"<b>{placeholder.nome}</b>: {placeholder.descricao}<br>" for placeholder in PLACEHOLDERS.values()
+        ))
         tags_text.setTextFormat(Qt.TextFormat.RichText)
         help_layout.addWidget(tags_text)
 
         # Área de edição de templates usando abas
         template_tabs = QTabWidget()
+        self.template_tabs = template_tabs
 
         # Template para apenas multas
         multa_tab = QWidget()
@@ -105,7 +117,39 @@ class TemplateTab(BaseTab):
 
         template_tabs.addTab(ambos_tab, "Multa e Pendência")
 
-        self.layout.addWidget(template_tabs, 1)
+        # Editor e categoria de cada aba, na ordem das abas
+        self.editores = [
+            (self.multa_template, 'apenas_multa'),
+            (self.pendencia_template, 'apenas_pendencia'),
+            (self.ambos_template, 'multa_e_pendencia')
+        ]
+
+        # Preview ao lado do editor, atualizado quando a digitação pausa
+        preview_group = QGroupBox("Preview")
+        preview_layout = QVBoxLayout(preview_group)
+
+        self.preview_info_label = QLabel("")
+        self.preview_info_label.setWordWrap(True)
+        self.preview_info_label.setTextFormat(Qt.TextFormat.RichText)
+        preview_layout.addWidget(self.preview_info_label)
+
+        self.template_preview = QTextEdit()
+        self.template_preview.setReadOnly(True)
+        preview_layout.addWidget(self.template_preview)
+
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        splitter.addWidget(template_tabs)
+        splitter.addWidget(preview_group)
+        self.layout.addWidget(splitter, 1)
+
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.ATRASO_PREVIEW)
+        self.preview_timer.timeout.connect(self.update_preview)
+
+        for editor, _ in self.editores:
+            editor.textChanged.connect(self.preview_timer.start)
+        template_tabs.currentChanged.connect(self.update_preview)
 
         # Botões de ação
         actions_container = QFrame()
@@ -143,9 +187,26 @@ class TemplateTab(BaseTab):
             # Obter os templates diretamente dos campos de texto
             # Garantir que as quebras de linha sejam normalizadas para \n
             # QTextEdit pode usar diferentes tipos de quebras de linha em diferentes sistemas
-            self.templates['apenas_multa'] = self.normalizar_quebras_de_linha(self.multa_template.toPlainText())
-            self.templates['apenas_pendencia'] = self.normalizar_quebras_de_linha(self.pendencia_template.toPlainText())
-            self.templates['multa_e_pendencia'] = self.normalizar_quebras_de_linha(self.ambos_template.toPlainText())
+            templates = {
+                'apenas_multa': self.normalizar_quebras_de_linha(self.multa_template.toPlainText()),
+                'apenas_pendencia': self.normalizar_quebras_de_linha(self.pendencia_template.toPlainText()),
+                'multa_e_pendencia': self.normalizar_quebras_de_linha(self.ambos_template.toPlainText())
+            }
+
+            # Recusar templates com placeholders desconhecidos ou indisponíveis para a categoria
+            erros = [
+                f"{self.NOMES_CATEGORIAS[categoria]}: {erro}"
+                for categoria, template in templates.items()
+                for erro in validate_template(template, categoria)
+            ]
+            if erros:
+                self.show_message_box(
+                    "Placeholders Inválidos",
+                    "Os templates não foram salvos:\n\n" + "\n".join(erros),
+                    QMessageBox.Icon.Warning
+                )
+                return
+            self.templates.update(templates)
 
             # Salvar no ConfigManager
             self.config_manager.set_value('template_apenas_multa', self.templates['apenas_multa'])
@@ -238,7 +299,58 @@ class TemplateTab(BaseTab):
                 "Atenciosamente,"
             )
 
+    def set_preview_source(self, email_tab):
+        """
+        Define a aba de e-mails usada no preview (usuários de exemplo e renderização).
+
+        Args:
+            email_tab: Instância de EmailTab
+        """
+        self.preview_source = email_tab
+        self.preview_compilados.clear()
+        self.preview_timer.start()
+
+    def showEvent(self, event):
+        """Atualiza o preview ao exibir a aba (os dados podem ter mudado no atendimento)."""
+        super().showEvent(event)
+        self.preview_timer.start()
+
+    def update_preview(self):
+        """Renderiza o template da aba atual com um usuário de exemplo."""
+        self.preview_timer.stop()
+        editor, categoria = self.editores[self.template_tabs.currentIndex()]
+        template = self.normalizar_quebras_de_linha(editor.toPlainText())
+
+        erros = validate_template(template, categoria)
+        aviso = ("<br><span style='color: #c62828;'>" + "<br>".join(escape(erro) for erro in erros) + "</span>") if erros else ""
+
+        usuario = self.preview_source.sample_user(categoria) if self.preview_source is not None else None
+        if usuario is None:
+            self.preview_info_label.setText(
+                "Carregue e unifique os relatórios para ver o preview com um usuário real." + aviso
+            )
+            self.template_preview.clear()
+            return
+
+        # Recompilar apenas o template que mudou
+        compilado = self.preview_compilados.get(categoria)
+        if compilado is None or compilado.template != template:
+            compilado = self.preview_source.compile_template(template, categoria)
+            self.preview_compilados[categoria] = compilado
+
+        try:
+            html, _ = self.preview_source.fill_template(compilado, usuario)
+        except Exception as e:
+            self.preview_info_label.setText(f"Erro ao gerar o preview: {escape(str(e))}")
+            return
+
+        self.preview_info_label.setText(f"Exemplo: {escape(str(usuario['nome']))} ({escape(str(usuario['email']))})" + aviso)
+        # Manter a posição de leitura entre as atualizações
+        rolagem = self.template_preview.verticalScrollBar().value()
+        self.template_preview.setHtml(html)
+        self.template_preview.verticalScrollBar().setValue(rolagem)
+
     def update_data(self, unified_data=None):
         """Atualiza os dados exibidos na aba."""
-        # Esta aba não precisa atualizar dados baseado no dataframe unificado
-        pass
\ No newline at end of file
+        # Os usuários de exemplo do preview vêm da aba de e-mails
+        self.preview_timer.start()
\ No newline at end of file
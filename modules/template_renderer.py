@@ -0,0 +1,465 @@
+"""
+Renderização compilada dos templates de e-mail.
+
+O caminho original substituía os placeholders no texto do template e
+convertia a carta inteira de Markdown para HTML a cada destinatário (e a cada
+preview). Aqui cada template é convertido uma única vez por versão, com
+marcadores no lugar dos placeholders; por destinatário apenas os fragmentos
+dinâmicos (nome, valor, listas de itens) são montados e encaixados no HTML
+pré-compilado.
+
+O resultado é idêntico, byte a byte, ao da conversão completa: na compilação
+o template é conferido com valores de exemplo contra o caminho original, e
+valores com caracteres que o Markdown interpretaria (ou que dependem do
+contexto) fazem aquela mensagem usar a conversão completa.
+
+A versão em texto simples (parte text/plain dos e-mails) também é derivada
+uma única vez do Markdown do template, com os fragmentos de cada
+destinatário encaixados em texto.
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+
+from modules.lazy_items import LazyItems
+
+# Estilos CSS incluídos em todos os e-mails
+CSS_STYLES = """
+            <style>
+                body {
+                    font-family: Arial, sans-serif;
+                    line-height: 1.4;
+                    margin: 0;
+                    padding: 10px;
+                }
+                p { margin: 0 0 8px 0; }
+                ul { margin: 5px 0; padding-left: 20px; }
+                li { margin-bottom: 3px; }
+                strong { font-weight: bold; }
+                a { color: #0066cc; }
+                br { line-height: 1; }
+            </style>
+            """
+
+# Texto que o Markdown mantém literal: começa com letra/dígito, palavras separadas
+# por um único espaço e nenhum caractere de marcação, HTML ou de link
+_TEXTO_SEGURO = re.compile(r'[^\W_][^\s\\`*_\[\]<>&#!{}()|~"]*(?: [^\s\\`*_\[\]<>&#!{}()|~"]+)*')
+_INICIO_LISTA_NUMERADA = re.compile(r'\d+[.)](\s|$)')
+
+# Caracteres que obrigam a usar a conversão completa (mudam a estrutura do texto
+# ou interagem com as demais substituições)
+_CARACTERES_ESTRUTURAIS = ('\n', '\r', '{')
+
+# Quantidade máxima de e-mails renderizados guardados no cache
+CAPACIDADE_CACHE = 512
+
+# Marcação Markdown removida na versão em texto simples
+_LINK = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+_NEGRITO = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+_ITALICO = re.compile(r'(?<![\w*])(\*|_)(?=[^\s*])(.+?)(?<=[^\s*])\1(?![\w*])')
+_TITULO = re.compile(r'^#{1,6}[ \t]+', re.MULTILINE)
+_CITACAO = re.compile(r'^>[ \t]?', re.MULTILINE)
+_CODIGO = re.compile(r'`([^`]*)`')
+_ESCAPE = re.compile(r'\\([\\`*_{}\[\]()#+\-.!])')
+# Área de uso privado do Unicode usada para proteger os caracteres escapados
+_BASE_PROTEGIDOS = 0xE000
+_PROTEGIDOS = re.compile('[\ue000-\ue07f]')
+
+_local = threading.local()
+
+
+def render_markdown(texto):
+    """
+    Converte Markdown para HTML (mesmo resultado de markdown.markdown com nl2br).
+
+    A instância do conversor é reaproveitada (uma por thread).
+    """
+    conversor = getattr(_local, 'conversor', None)
+    if conversor is None:
+        conversor = _local.conversor = markdown.Markdown(extensions=['nl2br'])
+    return conversor.reset().convert(texto)
+
+
+def wrap_html(html_content):
+    """Envolve o conteúdo no documento HTML com os estilos do e-mail."""
+    return f"<html><head>{CSS_STYLES}</head><body>{html_content}</body></html>"
+
+
+def markdown_to_text(texto):
+    """
+    Remove a marcação Markdown usada nos templates (negrito, itálico, links,
+    títulos, citações e código), mantendo o texto e as listas.
+
+    Links viram "texto (endereço)".
+    """
+    # Caracteres escapados (\\*) ficam protegidos durante a remoção da marcação
+    texto = _ESCAPE.sub(lambda encontrado: chr(_BASE_PROTEGIDOS + ord(encontrado.group(1))), texto)
+    texto = _LINK.sub(r'\1 (\2)', texto)
+    texto = _NEGRITO.sub(r'\2', texto)
+    texto = _ITALICO.sub(r'\2', texto)
+    texto = _TITULO.sub('', texto)
+    texto = _CITACAO.sub('', texto)
+    texto = _CODIGO.sub(r'\1', texto)
+    return _PROTEGIDOS.sub(lambda encontrado: chr(ord(encontrado.group()) - _BASE_PROTEGIDOS), texto)
+
+
+def normalize_line_breaks(texto):
+    """Normaliza as quebras de linha (CRLF e CR viram LF)."""
+    return texto.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def is_plain_text(valor):
+    """Indica se o texto é reproduzido literalmente pelo Markdown."""
+    return (
+        isinstance(valor, str)
+        and _TEXTO_SEGURO.fullmatch(valor) is not None
+        and _INICIO_LISTA_NUMERADA.match(valor) is None
+    )
+
+
+class ItemList:
+    """Lista de itens (título em negrito e linhas de detalhe) inserida num template."""
+
+    def __init__(self, entradas, vazio):
+        """
+        Args:
+            entradas: Lista de tuplas (título, [linhas de detalhe])
+            vazio: Texto usado quando não há itens
+        """
+        self.entradas = entradas
+        self.vazio = vazio
+
+    def markdown_text(self):
+        """Texto Markdown da lista (formato usado no template)."""
+        if not self.entradas:
+            return self.vazio
+        return "- " + "\n\n- ".join(
+            f"**{titulo}**\n" + "\n".join(f"\t- {linha}" for linha in linhas)
+            for titulo, linhas in self.entradas
+        )
+
+    def plain_text(self):
+        """Texto simples da lista (títulos sem marcação, detalhes indentados)."""
+        if not self.entradas:
+            return self.vazio
+        return "\n\n".join(
+            f"- {titulo}\n" + "\n".join(f"    - {linha}" for linha in linhas)
+            for titulo, linhas in self.entradas
+        )
+
+    def is_structural(self):
+        """Indica se algum texto altera a estrutura do Markdown (exige conversão completa)."""
+        textos = [self.vazio] + [
+            texto for titulo, linhas in self.entradas for texto in (titulo, *linhas)
+        ]
+        return any(caractere in str(texto) for texto in textos for caractere in _CARACTERES_ESTRUTURAIS)
+
+    def html(self):
+        """Fragmento HTML da lista, igual ao gerado pelo Markdown."""
+        if not self.entradas or not all(
+            is_plain_text(texto) for titulo, linhas in self.entradas for texto in (titulo, *linhas)
+        ):
+            return render_markdown(self.markdown_text())
+
+        if len(self.entradas) == 1:
+            titulo, linhas = self.entradas[0]
+            detalhes = ''.join(f"<li>{linha}</li>\n" for linha in linhas)
+            return f"<ul>\n<li><strong>{titulo}</strong><ul>\n{detalhes}</ul>\n</li>\n</ul>"
+
+        # Itens separados por linha em branco formam uma lista com parágrafos
+        partes = ["<ul>\n"]
+        for titulo, linhas in self.entradas:
+            detalhes = ''.join(f"<li>{linha}</li>\n" for linha in linhas)
+            partes.append(f"<li>\n<p><strong>{titulo}</strong></p>\n<ul>\n{detalhes}</ul>\n</li>\n")
+        partes.append("</ul>")
+        return ''.join(partes)
+
+
+# Valores de exemplo usados para conferir a compilação com o caminho original
+_EXEMPLOS = (
+    (("MARIA DA SILVA", "12,50"), ItemList([
+        ("Livro de Exemplo: volume 1", ["Data de Empréstimo: 01/02/2024", "Dias de Atraso: 3"]),
+        ("Outro Livro", ["Data de Empréstimo: 02/03/2024", "Dias de Atraso: 10"])
+    ], "Nenhum item")),
+    (("JOÃO D'ÁVILA", "1234,00"), ItemList([
+        ("Chave: 12", ["Data de Devolução Prevista: 05/02/2024", "Dias de Atraso: 1"])
+    ], "Nenhum item")),
+)
+
+
+class CompiledTemplate:
+    """Template convertido para HTML uma única vez, com os placeholders como encaixes."""
+
+    def __init__(self, template, etapas, listas=()):
+        """
+        Args:
+            template: Texto Markdown do template
+            etapas: Sequência de (placeholder, trechos removidos logo após a sua
+                substituição), na ordem em que são aplicadas
+            listas: Placeholders que recebem listas de itens (ItemList)
+        """
+        self.template = template
+        self.etapas = [(placeholder, list(remocoes)) for placeholder, remocoes in etapas]
+        self.placeholders = [placeholder for placeholder, _ in self.etapas]
+        # Placeholders presentes no texto (os únicos cujos valores precisam ser calculados)
+        self.usados = [placeholder for placeholder in self.placeholders if placeholder in template]
+        self.listas = set(listas)
+        self.partes = None
+        self.partes_texto = None
+        # Identifica a versão do template (texto e substituições) nas chaves do cache
+        self.versao = hashlib.blake2b(
+            repr((template, self.etapas, sorted(self.listas))).encode('utf-8'), digest_size=16
+        ).hexdigest()
+        self._compile()
+
+    def _sentinel(self, indice):
+        """Marcador de um placeholder (texto que o Markdown mantém intacto)."""
+        return f"zqzSLOT{indice}zqz"
+
+    def _compile(self):
+        """Converte o template com marcadores e separa as partes fixas dos encaixes."""
+        if any(self._sentinel(i) in self.template for i in range(len(self.placeholders))):
+            return
+
+        texto = self.template
+        for indice, (placeholder, remocoes) in enumerate(self.etapas):
+            texto = texto.replace(placeholder, self._sentinel(indice))
+            for trecho in remocoes:
+                texto = texto.replace(trecho, '')
+        texto = normalize_line_breaks(texto)
+
+        # Versão em texto simples: marcação removida uma vez, encaixes de texto
+        self.partes_texto = self._split_sentinels(markdown_to_text(texto))
+
+        try:
+            html = render_markdown(texto)
+        except Exception as e:
+            print(f"Erro ao compilar template: {e}")
+            return
+
+        # Encaixes de bloco: o marcador sozinho em um parágrafo é trocado pelo fragmento
+        # inteiro; os demais são encaixes de texto dentro de uma linha
+        padrao = re.compile('|'.join(
+            f"(?P<b{i}><p>{self._sentinel(i)}</p>)|(?P<t{i}>{self._sentinel(i)})"
+            for i in range(len(self.placeholders))
+        )) if self.placeholders else None
+
+        partes = []
+        inicio = 0
+        if padrao is not None:
+            for encontrado in padrao.finditer(html):
+                partes.append(html[inicio:encontrado.start()])
+                nome = encontrado.lastgroup
+                partes.append((nome[0] == 'b', self.placeholders[int(nome[1:])]))
+                inicio = encontrado.end()
+        partes.append(html[inicio:])
+        self.partes = partes
+
+        # Conferir com o caminho original; se divergir, o template não é compilado
+        for textos, itens in _EXEMPLOS:
+            valores = {
+                placeholder: itens if placeholder in self.listas else textos[indice % len(textos)]
+                for indice, placeholder in enumerate(self.placeholders)
+            }
+            if self._splice(valores) != self.render_full(valores):
+                self.partes = None
+                return
+
+    def _split_sentinels(self, texto):
+        """Separa um texto nas partes fixas e nos placeholders (pelos marcadores)."""
+        partes = []
+        inicio = 0
+        if self.placeholders:
+            padrao = re.compile('|'.join(f"(?P<t{i}>{self._sentinel(i)})" for i in range(len(self.placeholders))))
+            for encontrado in padrao.finditer(texto):
+                partes.append(texto[inicio:encontrado.start()])
+                partes.append(self.placeholders[int(encontrado.lastgroup[1:])])
+                inicio = encontrado.end()
+        partes.append(texto[inicio:])
+        # Partes fixas nas posições pares, placeholders nas ímpares
+        return partes
+
+    @property
+    def compiled(self):
+        """Indica se o template pode ser renderizado por encaixe."""
+        return self.partes is not None
+
+    def _splice(self, valores):
+        """Monta o HTML encaixando os fragmentos (None se algum valor exigir conversão completa)."""
+        fragmentos = []
+        for parte in self.partes:
+            if isinstance(parte, str):
+                fragmentos.append(parte)
+                continue
+
+            bloco, placeholder = parte
+            valor = valores[placeholder]
+            if isinstance(valor, ItemList):
+                if not bloco or valor.is_structural():
+                    return None
+                fragmentos.append(valor.html())
+            elif is_plain_text(valor):
+                fragmentos.append(f"<p>{valor}</p>" if bloco else valor)
+            else:
+                return None
+        return wrap_html(''.join(fragmentos))
+
+    def render_full(self, valores):
+        """Caminho original: substitui os placeholders no texto e converte a carta inteira."""
+        texto = self.template
+        for placeholder, remocoes in self.etapas:
+            valor = valores.get(placeholder)
+            if valor is not None:
+                texto = texto.replace(placeholder, valor.markdown_text() if isinstance(valor, ItemList) else valor)
+            for trecho in remocoes:
+                texto = texto.replace(trecho, '')
+
+        # Garantir que as quebras de linha estão normalizadas antes da conversão
+        texto = normalize_line_breaks(texto)
+        texto_html = texto.replace('\n', '<br>')
+        try:
+            return wrap_html(render_markdown(texto))
+        except Exception as e:
+            print(f"Erro ao converter Markdown para HTML: {e}")
+            # Fallback para o template original - substituir todas as quebras de linha por <br>
+            return f"<html><body>{texto_html}</body></html>"
+
+    def render_text(self, valores):
+        """
+        Renderiza a versão em texto simples do e-mail de um destinatário.
+
+        Args:
+            valores: Dicionário placeholder -> texto ou ItemList (basta informar os de self.usados)
+
+        Returns:
+            Texto do e-mail
+        """
+        fragmentos = {
+            placeholder: valor.plain_text() if isinstance(valor, ItemList) else valor
+            for placeholder, valor in valores.items()
+        }
+        if self.partes_texto is not None:
+            return ''.join(
+                parte if indice % 2 == 0 else fragmentos[parte]
+                for indice, parte in enumerate(self.partes_texto)
+            )
+
+        # Template com marcadores já usados no texto: substituição direta
+        texto = self.template
+        for placeholder, remocoes in self.etapas:
+            if placeholder in fragmentos:
+                texto = texto.replace(placeholder, fragmentos[placeholder])
+            for trecho in remocoes:
+                texto = texto.replace(trecho, '')
+        return markdown_to_text(normalize_line_breaks(texto))
+
+    def render(self, valores):
+        """
+        Renderiza o e-mail de um destinatário.
+
+        Args:
+            valores: Dicionário placeholder -> texto ou ItemList (basta informar os de self.usados)
+
+        Returns:
+            HTML completo do e-mail
+        """
+        if self.partes is not None:
+            html = self._splice(valores)
+            if html is not None:
+                return html
+        return self.render_full(valores)
+
+
+def content_fingerprint(*partes):
+    """
+    Calcula um resumo de tamanho fixo do conteúdo informado (usado nas chaves do cache).
+
+    As listas de itens entram pelo resumo memorizado de cada LazyItems, sem
+    materializar os itens; os demais valores, pela sua representação. Assim
+    a consulta ao cache não copia nem percorre os dados do usuário.
+
+    Args:
+        partes: Textos, números, datas, listas de itens e dicionários
+
+    Returns:
+        Resumo blake2b em hexadecimal
+    """
+    resumo = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        if isinstance(parte, LazyItems):
+            texto = 'itens:' + parte.fingerprint()
+        else:
+            texto = repr(parte)
+        resumo.update(texto.encode('utf-8'))
+        resumo.update(b'\x00')
+    return resumo.hexdigest()
+
+
+class RenderCache:
+    """Cache LRU limitado de e-mails renderizados, compartilhado entre preview e envio."""
+
+    def __init__(self, capacidade=CAPACIDADE_CACHE):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()  # chave -> (conteúdo, grupo)
+        self._grupos = {}  # grupo -> {chaves}
+        # O cache é acessado pelas threads da pré-renderização
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def get(self, chave):
+        """Retorna o conteúdo guardado para a chave (ou None)."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[0]
+
+    def put(self, chave, conteudo, grupo=None):
+        """
+        Guarda um e-mail renderizado.
+
+        Args:
+            chave: Chave (conteúdo do destinatário + versão do template)
+            conteudo: E-mail renderizado
+            grupo: Identificador usado para descartar as entradas de um destinatário
+        """
+        with self._lock:
+            if chave in self._itens:
+                self._remove(chave)
+            self._itens[chave] = (conteudo, grupo)
+            if grupo is not None:
+                self._grupos.setdefault(grupo, set()).add(chave)
+            while len(self._itens) > self.capacidade:
+                self._remove(next(iter(self._itens)))
+
+    def _remove(self, chave):
+        """Remove uma entrada (com o lock adquirido)."""
+        _, grupo = self._itens.pop(chave)
+        if grupo is not None:
+            chaves = self._grupos[grupo]
+            chaves.discard(chave)
+            if not chaves:
+                del self._grupos[grupo]
+
+    def discard_group(self, grupo):
+        """Descarta as entradas de um destinatário."""
+        with self._lock:
+            for chave in list(self._grupos.get(grupo, ())):
+                self._remove(chave)
+
+    def clear(self):
+        """Descarta todas as entradas."""
+        with self._lock:
+            self._itens.clear()
+            self._grupos.clear()